@@ -0,0 +1,313 @@
+# File: aggregate.py
+
+import copy
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from records import TEXT_TIMESTAMP, ErrorBatch, Record, counter_key, timestamp_text
+from rollups import SpikeDetector, TimeRollups
+from sketches import ApproxStats
+from templates import TemplateMiner
+from timestamps import format_timestamp
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is a declared dependency
+    np = None
+
+ENGINES = ("auto", "numpy", "python")
+
+# Length of the "YYYY-MM-DD HH:MM" prefix used for per-minute buckets.
+MINUTE_PREFIX = 16
+
+# Most recent minutes kept in minute_counts; older ones are retired into
+# the running peak and spike detector once twice as many have piled up.
+MINUTE_RETENTION = 10080
+
+# With --approx, records counted exactly before being folded into the
+# sketches; this bounds the user and message counters.
+APPROX_BUFFER = 65536
+
+
+class ErrorStats:
+    """Running error statistics behind the report summary and listings.
+
+    Counters keep the order in which values were first seen, so
+    most_common() breaks ties the same way whichever engine filled them.
+    Setting `rollups` (--rollups) also buckets the errors by hour and
+    minute and adds the buckets and spike flags to the summary.
+
+    `minute_counts` holds the most recent MINUTE_RETENTION minutes (at
+    most twice that between prunes); older minutes are retired in time
+    order into a SpikeDetector and the running peak, so peak_minute() and
+    spikes() still cover the whole log in bounded memory. Records for a
+    minute that has already been retired, here or in merged statistics,
+    only count towards the peak.
+
+    Setting `approx` (--approx) turns the user and message counters into
+    a buffer of at most APPROX_BUFFER records that is folded into
+    fixed-size sketches, so memory no longer grows with the number of
+    distinct users; the summary then reports estimates.
+
+    Setting `templates` (--templates) counts messages by template instead
+    of by exact text, in a TemplateMiner; top_messages() then lists the
+    templates and the summary adds the top ones with example parameters.
+    """
+
+    def __init__(self):
+        self.total_errors = 0
+        self.message_counts: Counter = Counter()
+        self.user_counts: Counter = Counter()
+        self.service_counts: Counter = Counter()
+        self.minute_counts: Counter = Counter()
+        self._retired = SpikeDetector()
+        self._peak: Optional[Tuple[str, int]] = None
+        self.rollups: Optional[TimeRollups] = None
+        self.approx: Optional[ApproxStats] = None
+        self.templates: Optional[TemplateMiner] = None
+        self._buffered = 0
+
+    def add(self, record: Record) -> None:
+        """Count one record (the pure-Python engine)."""
+        self.total_errors += 1
+        if self.templates is None:
+            self.message_counts[record["message"]] += 1
+        else:
+            self.templates.add(record["message"])
+        self.service_counts[record["service"]] += 1
+        minute = timestamp_text(record["timestamp"])[:MINUTE_PREFIX]
+        self.minute_counts[minute] += 1
+        if len(self.minute_counts) > 2 * MINUTE_RETENTION:
+            self._retire()
+        if record["user_id"] is not None:
+            self.user_counts[counter_key(record["user_id"])] += 1
+        if self.rollups is not None:
+            self.rollups.add(minute, record["service"], record["message"])
+        if self.approx is not None:
+            self._buffered += 1
+            if self._buffered >= APPROX_BUFFER:
+                self._flush()
+
+    def add_batch(self, batch: ErrorBatch, engine: str = "auto") -> None:
+        """Count a columnar batch with the chosen engine."""
+        if resolve_engine(engine) == "numpy":
+            self.merge(aggregate_numpy(batch, self.rollups is not None))
+            return
+        self.total_errors += len(batch)
+        if self.templates is None:
+            self.message_counts.update(batch.value_counts("message"))
+        else:
+            self.templates.update(batch.value_counts("message"))
+        self.service_counts.update(batch.value_counts("service"))
+        for timestamp, count in batch.value_counts("timestamp").items():
+            self.minute_counts[timestamp_text(timestamp)[:MINUTE_PREFIX]] += count
+        if len(self.minute_counts) > 2 * MINUTE_RETENTION:
+            self._retire()
+        self.user_counts.update(batch.value_counts("user_id", skip_none=True))
+        if self.rollups is not None:
+            for record in batch:
+                self.rollups.add(
+                    timestamp_text(record.timestamp)[:MINUTE_PREFIX],
+                    record.service,
+                    record.message,
+                )
+        if self.approx is not None:
+            self._flush()
+
+    def merge(self, other: "ErrorStats") -> None:
+        """Fold in statistics computed separately (another batch or file)."""
+        self.total_errors += other.total_errors
+        if self.templates is None:
+            self.message_counts.update(other.message_counts)
+        else:
+            self.templates.update(other.message_counts)
+            if other.templates is not None:
+                self.templates.merge(other.templates)
+        self.user_counts.update(other.user_counts)
+        self.service_counts.update(other.service_counts)
+        self.minute_counts.update(other.minute_counts)
+        if other._peak is not None:
+            self._retire_peak(*other._peak)
+        if other._retired.spikes:
+            spikes = {spike["minute"]: spike for spike in self._retired.spikes}
+            for spike in other._retired.spikes:
+                spikes.setdefault(spike["minute"], spike)
+            self._retired.spikes = [spikes[minute] for minute in sorted(spikes)]
+        if len(self.minute_counts) > 2 * MINUTE_RETENTION:
+            self._retire()
+        if self.rollups is not None and other.rollups is not None:
+            self.rollups.merge(other.rollups)
+        if self.approx is not None:
+            if other.approx is not None:
+                self.approx.merge(other.approx)
+            self._flush()
+
+    def _retire(self) -> None:
+        """Move all but the latest MINUTE_RETENTION minutes out of
+        minute_counts into the spike detector and the peak."""
+        for minute in sorted(self.minute_counts)[:-MINUTE_RETENTION]:
+            count = self.minute_counts.pop(minute)
+            previous = self._retired.previous
+            if previous is None or minute > previous:
+                self._retired.add(minute, count)
+            self._retire_peak(minute, count)
+
+    def _retire_peak(self, minute: str, count: int) -> None:
+        if self._peak is None or count > self._peak[1]:
+            self._peak = (minute, count)
+
+    def _flush(self) -> None:
+        """Fold the exactly counted users and messages into the sketches."""
+        self.approx.update(self.message_counts, self.user_counts)
+        self.message_counts = Counter()
+        self.user_counts = Counter()
+        self._buffered = 0
+
+    def top_messages(self) -> List[Tuple[Any, int]]:
+        """Messages from most to least frequent; with --templates their
+        templates, and with --approx only the heavy hitters, with
+        lower-bound counts."""
+        if self.templates is not None:
+            return [(str(t), t.count) for t in self.templates.most_common()]
+        if self.approx is None:
+            return self.message_counts.most_common()
+        self._flush()
+        return self.approx.top_messages.most_common()
+
+    def top_users(self) -> List[Tuple[Any, int]]:
+        """Affected users in first-seen order; with --approx only the heavy
+        hitters, most frequent first."""
+        if self.approx is None:
+            return list(self.user_counts.items())
+        self._flush()
+        return self.approx.top_users.most_common()
+
+    def summary(self) -> Dict[str, Any]:
+        """The `summary` block of the report."""
+        if self.approx is None:
+            unique_users = len(self.user_counts)
+        else:
+            self._flush()
+            unique_users = self.approx.users.estimate()
+        summary: Dict[str, Any] = {
+            "total_errors": self.total_errors,
+            "unique_affected_users": unique_users,
+        }
+        if self.approx is not None:
+            summary["approximate"] = self.approx.summary()
+        if self.templates is not None:
+            summary["templates"] = self.templates.summary()
+        if self.rollups is not None:
+            summary["rollups"] = self.rollups.summary(self.spikes())
+        return summary
+
+    def peak_minute(self) -> Optional[Dict[str, Any]]:
+        """The minute with the most errors, or None without errors."""
+        peak = self._peak
+        if self.minute_counts:
+            minute, count = self.minute_counts.most_common(1)[0]
+            if peak is None or count > peak[1]:
+                peak = (minute, count)
+        if peak is None:
+            return None
+        return {"minute": peak[0], "errors": peak[1]}
+
+    def spikes(self) -> List[Dict[str, Any]]:
+        """Minutes whose error count stands out from the minutes before
+        them, over the retired minutes and the current window."""
+        detector = copy.deepcopy(self._retired)
+        for minute in sorted(self.minute_counts):
+            if detector.previous is None or minute > detector.previous:
+                detector.add(minute, self.minute_counts[minute])
+        return detector.spikes
+
+
+def resolve_engine(engine: str) -> str:
+    """Map "auto" to numpy when it is installed, else to python."""
+    if engine == "auto":
+        return "numpy" if np is not None else "python"
+    if engine == "numpy" and np is None:
+        raise RuntimeError("the numpy engine needs numpy to be installed")
+    return engine
+
+
+def _codes(batch: ErrorBatch, column: str) -> "np.ndarray":
+    """View a batch column's int32 codes as a numpy array without copying."""
+    return np.frombuffer(batch.codes[column], dtype=np.int32)
+
+
+def _ordered_counts(table: List[Any], counts: "np.ndarray") -> Counter:
+    """Build a Counter from per-code counts, keeping code (first-seen) order."""
+    result: Counter = Counter()
+    for code in np.flatnonzero(counts).tolist():
+        result[counter_key(table[code])] += int(counts[code])
+    return result
+
+
+def aggregate_numpy(batch: ErrorBatch, rollups: bool = False) -> ErrorStats:
+    """Vectorised statistics over a batch's dictionary-encoded columns.
+
+    Every column is counted with one np.bincount over its codes; Python
+    only loops over the distinct values, never over the records. With
+    `rollups` the (minute, service, message) groups are counted by one
+    np.unique over combined codes.
+    """
+    stats = ErrorStats()
+    if rollups:
+        stats.rollups = TimeRollups()
+    stats.total_errors = len(batch)
+    if not len(batch):
+        return stats
+
+    tables = batch.tables
+    for column, target in (
+        ("message", stats.message_counts),
+        ("service", stats.service_counts),
+    ):
+        counts = np.bincount(_codes(batch, column), minlength=len(tables[column]))
+        target.update(_ordered_counts(tables[column], counts))
+
+    users = tables["user_id"]
+    user_counts = np.bincount(_codes(batch, "user_id"), minlength=len(users))
+    for code, value in enumerate(users):
+        if value is None:
+            user_counts[code] = 0
+    stats.user_counts.update(_ordered_counts(users, user_counts))
+
+    # Minutes are epoch seconds // 60; text timestamps keep their own
+    # codes (all below any minute). Distinct keys are numbered in order of
+    # first appearance, the order the Python engine counts them in.
+    timestamps = np.frombuffer(batch.timestamps, dtype=np.int64)
+    minute_keys = np.where(timestamps > TEXT_TIMESTAMP, timestamps // 60, timestamps)
+    distinct, first, inverse = np.unique(
+        minute_keys, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    minute_codes = rank[inverse.reshape(-1)]
+    minute_names = [
+        (
+            batch.timestamp_texts[TEXT_TIMESTAMP - key]
+            if key <= TEXT_TIMESTAMP
+            else format_timestamp(key * 60)
+        )[:MINUTE_PREFIX]
+        for key in distinct[order].tolist()
+    ]
+    minute_counts = np.bincount(minute_codes, minlength=len(minute_names))
+    stats.minute_counts.update(_ordered_counts(minute_names, minute_counts))
+
+    if stats.rollups is not None:
+        services, messages = tables["service"], tables["message"]
+        groups = (
+            minute_codes.astype(np.int64) * len(services) + _codes(batch, "service")
+        ) * len(messages) + _codes(batch, "message")
+        keys, counts = np.unique(groups, return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            minute, rest = divmod(key, len(services) * len(messages))
+            service, message = divmod(rest, len(messages))
+            stats.rollups.add(
+                minute_names[minute], services[service], messages[message], count
+            )
+
+    return stats
@@ -0,0 +1,296 @@
+# File: async_parser.py
+"""Asyncio API over the parser, for callers that must not block their loop.
+
+    async for record in parse_stream("server.log", workers=4):
+        ...
+
+Reading and parsing run in a process pool, one newline-aligned chunk per
+task, and report writing runs on a thread, so the event loop only hands
+batches from one stage to the next. Each hand-over is bounded: at most
+`max_pending` chunks are parsed ahead of the consumer, so a slow writer
+holds back reading instead of letting results pile up in memory, and a
+fast one keeps every worker busy. Throughput then follows whichever of
+the disk, the parser workers or the writer is slowest.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Executor, ProcessPoolExecutor
+from contextlib import aclosing, closing
+from typing import Any, AsyncIterator, Deque, List, Optional, Tuple, Union
+
+from decompress import file_compression
+from log_formats import AUTO_FORMAT, LogFormat
+from parser import (
+    AGGREGATE_BATCH_SIZE,
+    DEFAULT_FILTER,
+    MAX_CHUNK_SIZE,
+    ScanStats,
+    batch_records,
+    chunk_boundaries,
+    iter_log_file,
+    process_chunk,
+    resolve_format,
+)
+from records import ErrorBatch, ErrorRecord
+from writers import REPORT_WRITERS, ReportWriter
+
+# Marks the end of a stream handed over by the reader thread.
+_DONE = object()
+
+
+async def parse_batches(
+    input_path: str,
+    workers: int = 1,
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    filter_expr: str = DEFAULT_FILTER,
+    stats: Optional[ScanStats] = None,
+    executor: Optional[Executor] = None,
+    start: int = 0,
+    end: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+) -> AsyncIterator[ErrorBatch]:
+    """Yield the records iter_log_file would, as columnar batches in file
+    order, without blocking the event loop.
+
+    Bytes [start, end) of a regular uncompressed file (`start` at the
+    beginning of a line) are cut into at least `workers` chunks of at most
+    MAX_CHUNK_SIZE and parsed with process_chunk in `executor`, or in a
+    process pool of `workers` created for the call. Streams (stdin,
+    compressed files) are parsed by iter_log_file on a thread instead and
+    handed over in batches of AGGREGATE_BATCH_SIZE records. Either way at
+    most `max_pending` (default: 2 * workers) results wait for the consumer.
+
+    Lines are read as `log_format`, detected by default as for
+    iter_log_file. Line counters, stage timings, latency and line aggregates go to
+    `stats` as for iter_log_file; the sidecar index, checkpoints and
+    request correlation are not available here. Raises FileNotFoundError
+    for a missing file.
+    """
+    if stats is None:
+        stats = ScanStats()
+    if max_pending is None:
+        max_pending = 2 * workers
+    if input_path != "-" and file_compression(input_path) is None:
+        batches = _parse_chunks(
+            input_path,
+            workers,
+            start_ts,
+            end_ts,
+            filter_expr,
+            stats,
+            executor,
+            start,
+            end,
+            max_pending,
+            log_format,
+        )
+    else:
+        batches = _parse_on_thread(
+            input_path, start_ts, end_ts, filter_expr, stats, max_pending, log_format
+        )
+    async with aclosing(batches):
+        async for batch in batches:
+            yield batch
+
+
+async def parse_stream(
+    input_path: str,
+    workers: int = 1,
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    filter_expr: str = DEFAULT_FILTER,
+    stats: Optional[ScanStats] = None,
+    executor: Optional[Executor] = None,
+    max_pending: Optional[int] = None,
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+) -> AsyncIterator[ErrorRecord]:
+    """Yield the records of parse_batches one at a time."""
+    batches = parse_batches(
+        input_path,
+        workers,
+        start_ts,
+        end_ts,
+        filter_expr,
+        stats,
+        executor,
+        max_pending=max_pending,
+        log_format=log_format,
+    )
+    async with aclosing(batches):
+        async for batch in batches:
+            for record in batch:
+                yield record
+
+
+async def write_report_async(
+    batches: AsyncIterator[ErrorBatch],
+    output_path: str,
+    report_format: str = "json",
+    engine: str = "auto",
+) -> ReportWriter:
+    """Write batches to a report on a worker thread while the next ones
+    are being parsed.
+
+    The loop waits for each write before asking for the next batch, so the
+    parse stage's `max_pending` bounds what piles up in between. A failure
+    on either side leaves any previous report untouched.
+    """
+    writer = await asyncio.to_thread(REPORT_WRITERS[report_format], output_path, engine)
+    try:
+        async for batch in batches:
+            await asyncio.to_thread(writer.write_batch, batch)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    await asyncio.to_thread(writer.close)
+    return writer
+
+
+async def _parse_chunks(
+    input_path: str,
+    workers: int,
+    start_ts: Optional[str],
+    end_ts: Optional[str],
+    filter_expr: str,
+    stats: ScanStats,
+    executor: Optional[Executor],
+    start: int,
+    end: Optional[int],
+    max_pending: int,
+    log_format: Union[str, LogFormat],
+) -> AsyncIterator[ErrorBatch]:
+    loop = asyncio.get_running_loop()
+    line_format = await asyncio.to_thread(resolve_format, input_path, log_format)
+    ranges = await asyncio.to_thread(_ranges, input_path, workers, start, end)
+    if not ranges:
+        return
+
+    pool = executor
+    if pool is None:
+        # The loop's threads (to_thread) make fork() unsafe here.
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(ranges)),
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+    profile = stats.timings is not None
+    calls = iter(ranges)
+    pending: Deque[asyncio.Future] = deque()
+
+    def submit() -> None:
+        for s, e in calls:
+            pending.append(
+                loop.run_in_executor(
+                    pool,
+                    process_chunk,
+                    input_path,
+                    s,
+                    e,
+                    start_ts,
+                    end_ts,
+                    False,
+                    profile,
+                    filter_expr,
+                    False,
+                    stats.latency_field,
+                    stats.empty_aggregators(),
+                    line_format,
+                )
+            )
+            if len(pending) >= max_pending:
+                return
+
+    try:
+        submit()
+        while pending:
+            batch, chunk_stats, _, _ = await pending.popleft()
+            submit()
+            stats.merge(chunk_stats)
+            yield batch
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is None:
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+
+def _ranges(
+    input_path: str, workers: int, start: int, end: Optional[int]
+) -> List[Tuple[int, int]]:
+    """At least `workers` newline-aligned chunks of at most MAX_CHUNK_SIZE."""
+    if end is None:
+        end = os.path.getsize(input_path)
+    if end <= start:
+        return []
+    chunks = max(workers, -(-(end - start) // MAX_CHUNK_SIZE))
+    return chunk_boundaries(input_path, chunks, start, end)
+
+
+async def _parse_on_thread(
+    input_path: str,
+    start_ts: Optional[str],
+    end_ts: Optional[str],
+    filter_expr: str,
+    stats: ScanStats,
+    max_pending: int,
+    log_format: Union[str, LogFormat],
+) -> AsyncIterator[ErrorBatch]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(max_pending)
+    stopped = threading.Event()
+
+    def hand_over(item: Any) -> None:
+        # Blocks while the queue is full; gives up once the consumer left,
+        # whose loop may then cancel the pending put.
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while not stopped.is_set():
+            try:
+                future.result(timeout=0.1)
+                return
+            except TimeoutError:
+                continue
+            except CancelledError:
+                return
+        future.cancel()
+
+    def read() -> None:
+        try:
+            records = iter_log_file(
+                input_path,
+                1,
+                start_ts,
+                end_ts,
+                stats=stats,
+                filter_expr=filter_expr,
+                log_format=log_format,
+            )
+            with closing(records):
+                for batch in batch_records(records, AGGREGATE_BATCH_SIZE):
+                    if stopped.is_set():
+                        return
+                    hand_over(batch)
+        except BaseException as exc:
+            if not stopped.is_set():
+                hand_over(exc)
+        else:
+            if not stopped.is_set():
+                hand_over(_DONE)
+
+    reader = threading.Thread(target=read, name="log-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        await asyncio.to_thread(reader.join)
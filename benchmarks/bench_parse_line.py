@@ -0,0 +1,131 @@
+# File: benchmarks/bench_parse_line.py
+"""Compare the fast-path tokenizer and metadata projection against the
+original regex + json.loads parse_line."""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from genLog.generate_logs import generate_logs  # noqa: E402
+from log_formats import LOG_PATTERN  # noqa: E402
+from parser import (  # noqa: E402
+    ERROR_FIELDS,
+    iter_errors,
+    parse_line,
+    project_metadata,
+)
+from records import as_dict  # noqa: E402
+
+
+def regex_parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """The original parse_line: regex match plus a JSON decode on every line."""
+    line = line.strip()
+    match = LOG_PATTERN.match(line)
+
+    if not match:
+        return None
+
+    timestamp, level, service, req_id, message, metadata_str = match.groups()
+
+    try:
+        metadata = json.loads(metadata_str)
+    except json.JSONDecodeError:
+        return None
+
+    return {
+        "timestamp": timestamp,
+        "level": level,
+        "service": service,
+        "request_id": req_id,
+        "message": message,
+        "metadata": metadata,
+    }
+
+
+def regex_collect_errors(lines: List[str]) -> List[Dict[str, Any]]:
+    """The original ERROR filter loop built on regex_parse_line."""
+    errors_list = []
+    for line in lines:
+        parsed_data = regex_parse_line(line)
+        if parsed_data is not None and parsed_data["level"] == "ERROR":
+            errors_list.append(
+                {
+                    "timestamp": parsed_data["timestamp"],
+                    "service": parsed_data["service"],
+                    "message": parsed_data["message"],
+                    "user_id": parsed_data["metadata"].get("user_id"),
+                }
+            )
+    return errors_list
+
+
+def _per_line_ns(func, lines: List[str], repeat: int) -> float:
+    """Best-of-`repeat` time per line in nanoseconds."""
+    best = min(timeit.repeat(lambda: func(lines), number=1, repeat=repeat))
+    return best / len(lines) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--lines", type=int, default=200_000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    lines = generate_logs(args.lines, seed=args.seed)
+
+    # Both implementations must agree before their speed is worth comparing.
+    assert [parse_line(line) for line in lines] == [
+        regex_parse_line(line) for line in lines
+    ]
+    raw_lines = [line.encode("utf-8") for line in lines]
+    assert [as_dict(record) for record in iter_errors(raw_lines)] == (
+        regex_collect_errors(lines)
+    )
+
+    metadata = [m.group(6) for m in map(LOG_PATTERN.match, lines) if m]
+
+    # (name, baseline, baseline input, fast path, fast path input)
+    cases = [
+        (
+            "parse_line",
+            lambda ls: [regex_parse_line(line) for line in ls],
+            lines,
+            lambda ls: [parse_line(line) for line in ls],
+            lines,
+        ),
+        (
+            "ERROR filter",
+            regex_collect_errors,
+            lines,
+            lambda ls: list(iter_errors(ls)),
+            raw_lines,
+        ),
+        (
+            "metadata",
+            lambda ms: [json.loads(m).get("user_id") for m in ms],
+            metadata,
+            lambda ms: [project_metadata(m, ERROR_FIELDS)["user_id"] for m in ms],
+            metadata,
+        ),
+    ]
+
+    print(f"{len(lines)} lines, best of {args.repeat} runs")
+    print(f"{'case':<14}{'regex ns/line':>16}{'fast ns/line':>16}{'speedup':>10}")
+    for name, baseline, baseline_input, fast, fast_input in cases:
+        baseline_ns = _per_line_ns(baseline, baseline_input, args.repeat)
+        fast_ns = _per_line_ns(fast, fast_input, args.repeat)
+        print(
+            f"{name:<14}{baseline_ns:>16.0f}{fast_ns:>16.0f}"
+            f"{baseline_ns / fast_ns:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# File: benchmarks/bench_suite.py
+"""Measure parse_line, process_log_file and process_errors on synthetic
+corpora: lines/sec, MB/sec and peak RSS, compared with a stored baseline."""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from genLog.generate_logs import parse_size, write_logs  # noqa: E402
+from parser import parse_line, process_errors, process_log_file  # noqa: E402
+
+CORPUS_DIR = PROJECT_ROOT / "benchmarks" / "corpus"
+BASELINE_PATH = PROJECT_ROOT / "benchmarks" / "baseline.json"
+
+CASES = ("parse_line", "process_log_file", "process_errors")
+
+# Relative slowdown (or RSS growth) tolerated before a case is flagged.
+DEFAULT_TOLERANCE = 0.15
+
+# Throughput metrics regress when they fall, memory when it grows.
+HIGHER_IS_BETTER = {"lines_per_sec": True, "mb_per_sec": True, "peak_rss_mb": False}
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS of this process plus its largest child, in MB (Linux: KB)."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return usage / 1024
+
+
+def run_case(case: str, corpus: str, workers: int) -> Dict[str, Any]:
+    """Run one case in this process and return its raw measurements.
+
+    process_errors counts error records and report bytes written; the
+    errors it reports are collected first and are not part of the timing.
+    """
+    if case == "parse_line":
+        lines = 0
+        started = time.perf_counter()
+        with open(corpus, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                parse_line(line)
+                lines += 1
+        seconds = time.perf_counter() - started
+        size = os.path.getsize(corpus)
+
+    elif case == "process_log_file":
+        started = time.perf_counter()
+        process_log_file(corpus, workers=workers)
+        seconds = time.perf_counter() - started
+        size = os.path.getsize(corpus)
+        with open(corpus, "rb") as f:
+            lines = sum(
+                block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")
+            )
+
+    elif case == "process_errors":
+        errors = process_log_file(corpus, workers=workers)
+        with tempfile.TemporaryDirectory() as tmp:
+            report = os.path.join(tmp, "report.json")
+            started = time.perf_counter()
+            process_errors(errors, report)
+            seconds = time.perf_counter() - started
+            size = os.path.getsize(report)
+        lines = len(errors)
+
+    else:
+        raise ValueError(f"unknown case: {case}")
+
+    return {
+        "seconds": seconds,
+        "lines": lines,
+        "bytes": size,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def measure(case: str, corpus: str, workers: int, repeat: int) -> Dict[str, float]:
+    """Best-of-`repeat` throughput and the highest peak RSS, each run in a
+    fresh interpreter so one case's memory never leaks into the next."""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, __file__, "--run-case", case, corpus]
+            + ["--workers", str(workers)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        runs.append(json.loads(result.stdout.splitlines()[-1]))
+
+    best = min(runs, key=lambda run: run["seconds"])
+    return {
+        "lines_per_sec": round(best["lines"] / best["seconds"], 1),
+        "mb_per_sec": round(best["bytes"] / (1 << 20) / best["seconds"], 2),
+        "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+    }
+
+
+def _size_label(size: int) -> str:
+    for unit, factor in (("G", 1 << 30), ("M", 1 << 20), ("K", 1 << 10)):
+        if size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+
+def ensure_corpus(size: int, seed: int) -> str:
+    """Return a seeded corpus of about `size` bytes, generating it once."""
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    path = CORPUS_DIR / f"seed{seed}-{_size_label(size)}.log"
+    if not path.exists():
+        print(f"Generating {path.name}...", file=sys.stderr)
+        partial = path.with_suffix(".log.tmp")
+        write_logs(str(partial), size=size, seed=seed)
+        partial.replace(path)
+    return str(path)
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[str]:
+    """Print the results next to the baseline and return the regressions."""
+    regressions = []
+    print(
+        f"{'case':<40}{'lines/s':>12}{'MB/s':>9}{'peak RSS MB':>13}{'vs baseline':>28}"
+    )
+    for key, metrics in results.items():
+        reference = baseline.get(key, {})
+        changes = []
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            if not reference.get(metric):
+                continue
+            change = metrics[metric] / reference[metric] - 1
+            changes.append(f"{change:+.0%}")
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append(f"{key}: {metric} {change:+.1%}")
+        print(
+            f"{key:<40}{metrics['lines_per_sec']:>12,.0f}"
+            f"{metrics['mb_per_sec']:>9.1f}{metrics['peak_rss_mb']:>13.1f}"
+            f"{' '.join(changes) or 'no baseline':>28}"
+        )
+    return regressions
+
+
+def load_baseline(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {"cases": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--size",
+        dest="sizes",
+        type=parse_size,
+        action="append",
+        help="Corpus size to generate, e.g. 100M or 2G; repeatable (default: 100M).",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="append",
+        default=[],
+        help="Benchmark an existing log file instead; repeatable.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("--case", dest="cases", choices=CASES, action="append")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed relative regression (default: 0.15).",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline.",
+    )
+    parser.add_argument("--run-case", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        case, corpus = args.run_case
+        print(json.dumps(run_case(case, corpus, args.workers)))
+        return
+
+    corpora = list(args.corpus)
+    if args.sizes or not corpora:
+        corpora += [
+            ensure_corpus(size, args.seed) for size in args.sizes or [100 << 20]
+        ]
+
+    results = {}
+    for corpus in corpora:
+        for case in args.cases or CASES:
+            key = f"{Path(corpus).name}/{case}"
+            if args.workers > 1:
+                key += f"/w{args.workers}"
+            results[key] = measure(case, corpus, args.workers, args.repeat)
+
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline["cases"], args.tolerance)
+
+    if args.save_baseline:
+        baseline["cases"].update(results)
+        baseline["python"] = platform.python_version()
+        baseline["platform"] = platform.platform()
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=4)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print("\nRegressions beyond tolerance:")
+        for regression in regressions:
+            print(f" - {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
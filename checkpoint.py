@@ -0,0 +1,129 @@
+# File: checkpoint.py
+
+import base64
+import hashlib
+import json
+import os
+import pickle
+from typing import Any, Optional
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_SUFFIX = ".ckpt"
+
+# Leading bytes hashed to recognise a file that was truncated and regrown.
+FINGERPRINT_SIZE = 1024
+
+
+def checkpoint_path_for(output_path: str) -> str:
+    """Return the default checkpoint path for a report file."""
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def _fingerprint(input_path: str, length: int) -> str:
+    """Hash the first `length` bytes of a file."""
+    with open(input_path, "rb") as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+class Checkpoint:
+    """Where an incremental run stopped in an append-only log file.
+
+    `offset` always sits just after the last complete line, so a partially
+    written last line is parsed again on the next run once it is finished.
+    `line_state` carries whatever the caller aggregates over all lines read
+    so far (the report's line counts and latency sketches); it is opaque
+    here and saved pickled.
+    """
+
+    def __init__(
+        self,
+        device: int = 0,
+        inode: int = 0,
+        offset: int = 0,
+        fingerprint: str = "",
+        total_lines: int = 0,
+        malformed_lines: int = 0,
+        line_state: Any = None,
+    ):
+        self.device = device
+        self.inode = inode
+        self.offset = offset
+        self.fingerprint = fingerprint
+        self.total_lines = total_lines
+        self.malformed_lines = malformed_lines
+        self.line_state = line_state
+
+    def resume_offset(self, input_path: str) -> int:
+        """Return the byte offset to continue from, or 0 if the file was
+        rotated (new inode) or truncated (shorter, or different leading bytes).
+        """
+        stat = os.stat(input_path)
+        if (stat.st_dev, stat.st_ino) != (self.device, self.inode):
+            return 0
+        if stat.st_size < self.offset:
+            return 0
+        length = min(self.offset, FINGERPRINT_SIZE)
+        if _fingerprint(input_path, length) != self.fingerprint:
+            return 0
+        return self.offset
+
+    def advance(
+        self, input_path: str, offset: int, total_lines: int, malformed_lines: int
+    ) -> None:
+        """Move the checkpoint to `offset` and add this run's line counters."""
+        stat = os.stat(input_path)
+        self.device = stat.st_dev
+        self.inode = stat.st_ino
+        self.offset = offset
+        self.fingerprint = _fingerprint(input_path, min(offset, FINGERPRINT_SIZE))
+        self.total_lines += total_lines
+        self.malformed_lines += malformed_lines
+
+    def save(self, path: str) -> None:
+        """Write the checkpoint atomically so a crash never leaves half a file."""
+        data = {
+            "version": CHECKPOINT_VERSION,
+            "device": self.device,
+            "inode": self.inode,
+            "offset": self.offset,
+            "fingerprint": self.fingerprint,
+            "total_lines": self.total_lines,
+            "malformed_lines": self.malformed_lines,
+        }
+        if self.line_state is not None:
+            data["line_state"] = base64.b64encode(
+                pickle.dumps(self.line_state, protocol=pickle.HIGHEST_PROTOCOL)
+            ).decode("ascii")
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        """Read a checkpoint, returning None if it is missing or unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != CHECKPOINT_VERSION:
+            return None
+
+        line_state = None
+        if "line_state" in data:
+            try:
+                line_state = pickle.loads(base64.b64decode(data["line_state"]))
+            except (ValueError, pickle.UnpicklingError, AttributeError, ImportError):
+                pass
+
+        return cls(
+            data["device"],
+            data["inode"],
+            data["offset"],
+            data["fingerprint"],
+            data["total_lines"],
+            data["malformed_lines"],
+            line_state,
+        )
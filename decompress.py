@@ -0,0 +1,124 @@
+# File: decompress.py
+
+import bz2
+import gzip
+import lzma
+import os
+import queue
+import threading
+from typing import BinaryIO, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is a declared dependency
+    zstandard = None
+
+# Leading bytes that identify each supported compression format.
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+)
+MAGIC_SIZE = max(len(magic) for magic, _ in COMPRESSION_MAGIC)
+
+# Decompressed bytes handed from the decompression thread to the parser at
+# once, and how many such blocks may wait in the queue between them.
+DECOMPRESS_BLOCK_SIZE = 1 << 20
+DECOMPRESS_QUEUE_DEPTH = 8
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """Return the compression format of data starting with `head`, or None."""
+    for magic, name in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def file_compression(input_path: str) -> Optional[str]:
+    """Sniff a regular file's compression format; None for plain text,
+    unreadable paths and pipes, whose bytes must not be consumed."""
+    if not os.path.isfile(input_path):
+        return None
+    try:
+        with open(input_path, "rb") as f:
+            return detect_compression(f.read(MAGIC_SIZE))
+    except OSError:
+        return None
+
+
+def open_decompressed(source: BinaryIO, compression: str) -> BinaryIO:
+    """Wrap a binary stream in a decompressing reader."""
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=source, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(source, "rb")
+    if compression == "xz":
+        return lzma.LZMAFile(source, "rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("reading zstd input needs the zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(
+            source, read_across_frames=True, closefd=False
+        )
+    raise ValueError(f"unsupported compression: {compression}")
+
+
+class DecompressionError(Exception):
+    """A compressed input is corrupt or truncated."""
+
+
+def iter_decompressed_lines(source: BinaryIO, compression: str) -> Iterator[bytes]:
+    """Yield the lines of a compressed stream without their newlines.
+
+    A background thread decompresses DECOMPRESS_BLOCK_SIZE blocks into a
+    bounded queue while the caller parses the previous ones; zlib, bz2, lzma
+    and zstd release the GIL, so the two stages genuinely overlap. Nothing
+    is written to disk and at most DECOMPRESS_QUEUE_DEPTH blocks are held in
+    memory. Decompressor failures surface in the caller as
+    DecompressionError.
+    """
+    blocks: queue.Queue = queue.Queue(maxsize=DECOMPRESS_QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def put(item) -> None:
+        # Poll so the thread notices when the consumer stops early.
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def decompress() -> None:
+        try:
+            with open_decompressed(source, compression) as reader:
+                while not stop.is_set():
+                    block = reader.read(DECOMPRESS_BLOCK_SIZE)
+                    put(block)
+                    if not block:
+                        return
+        except Exception as exc:
+            put(exc)
+
+    thread = threading.Thread(target=decompress, name="decompress", daemon=True)
+    thread.start()
+    carry = b""
+    try:
+        while True:
+            block = blocks.get()
+            if isinstance(block, Exception):
+                raise DecompressionError(
+                    f"cannot decompress {compression} input: {block}"
+                ) from block
+            if not block:
+                break
+            lines = (carry + block).split(b"\n")
+            carry = lines.pop()
+            yield from lines
+        if carry:
+            yield carry
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,517 @@
+# File: filters.py
+"""A small filter language for picking log lines.
+
+    level in {ERROR, WARN} and service == risk-engine
+    metadata.latency_ms > 2000 or message ~ "time(d )?out"
+    not (request_id == req-042) and timestamp between 2024-05-01 and 2024-05-02
+
+Fields are level, service, request_id, message, timestamp and
+metadata.<key>[.<key>...]. Operators: == != < <= > >=, `in {a, b}`,
+`between a and b` (inclusive), `~ regex` (search), combined with and, or,
+not and parentheses. Values are quoted strings, numbers, true, false, null
+or bare words such as ERROR or risk-engine.
+"""
+
+import json
+import re
+from functools import reduce
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+# Positions of the raw fields in a tokenized line:
+# [b"[timestamp]", b"LEVEL", b"[service]", b"request_id", b"message", b"{...}"]
+RAW_FIELDS = {"timestamp": 0, "level": 1, "service": 2, "request_id": 3, "message": 4}
+BRACKETED = {"timestamp", "service"}
+
+METADATA_PREFIX = "metadata."
+
+# Evaluation order inside and/or: raw byte comparisons, then regexes (which
+# decode the field), then metadata (which decodes JSON).
+COST_RAW, COST_REGEX, COST_METADATA = 1, 2, 10
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<op>==|!=|<=|>=|<|>|~|\(|\)|\{|\}|,)
+      | (?P<word>[^\s"'(){},=!<>~]+)
+    )""",
+    re.VERBOSE,
+)
+_NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+_KEYWORDS = {"and", "or", "not", "in", "between", "true", "false", "null"}
+_LITERALS = {"true": True, "false": False, "null": None}
+
+Predicate = Callable[[Sequence[bytes]], bool]
+
+
+class FilterError(ValueError):
+    """A filter expression that cannot be parsed."""
+
+
+class _Token:
+    __slots__ = ("kind", "text", "value", "position")
+
+    def __init__(self, kind: str, text: str, value: Any, position: int):
+        self.kind = kind
+        self.text = text
+        self.value = value
+        self.position = position
+
+
+def _tokenize(expression: str) -> List[_Token]:
+    tokens = []
+    position = 0
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            if expression[position:].strip():
+                raise FilterError(f"unexpected {expression[position:]!r}")
+            break
+        start = match.start(match.lastgroup)
+        text = match.group(match.lastgroup)
+        if match.lastgroup == "string":
+            body = re.sub(r"\\([\"'\\])", r"\1", text[1:-1])
+            tokens.append(_Token("value", text, body, start))
+        elif match.lastgroup == "op":
+            tokens.append(_Token("op", text, text, start))
+        elif text in _KEYWORDS and text not in _LITERALS:
+            tokens.append(_Token("keyword", text, text, start))
+        elif text in _LITERALS:
+            tokens.append(_Token("value", text, _LITERALS[text], start))
+        elif _NUMBER.match(text):
+            number = float(text) if any(c in text for c in ".eE") else int(text)
+            tokens.append(_Token("value", text, number, start))
+        else:
+            tokens.append(_Token("word", text, text, start))
+        position = match.end()
+    return tokens
+
+
+# Parsed expressions are nested tuples:
+#   ("and", [nodes]) / ("or", [nodes]) / ("not", node)
+#   ("cmp", field, op, value) / ("in", field, [values])
+#   ("between", field, low, high) / ("regex", field, pattern)
+
+
+class _Parser:
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterError("empty filter expression")
+        node = self._or()
+        if self.position < len(self.tokens):
+            self._fail("unexpected", self.tokens[self.position])
+        return node
+
+    def _fail(self, problem: str, token: Optional[_Token] = None):
+        if token is None:
+            problem = problem.removesuffix(", got")
+            raise FilterError(f"{problem} at end of {self.expression!r}")
+        raise FilterError(
+            f"{problem} {token.text!r} at position {token.position} "
+            f"of {self.expression!r}"
+        )
+
+    def _peek(self) -> Optional[_Token]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def _accept(self, text: str) -> bool:
+        token = self._peek()
+        if token is not None and token.kind in ("op", "keyword") and token.text == text:
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, text: str) -> None:
+        if not self._accept(text):
+            self._fail(f"expected {text!r}, got", self._peek())
+
+    def _or(self):
+        nodes = [self._and()]
+        while self._accept("or"):
+            nodes.append(self._and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def _and(self):
+        nodes = [self._not()]
+        while self._accept("and"):
+            nodes.append(self._not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def _not(self):
+        if self._accept("not"):
+            return ("not", self._not())
+        if self._accept("("):
+            node = self._or()
+            self._expect(")")
+            return node
+        return self._condition()
+
+    def _field(self) -> str:
+        token = self._peek()
+        if token is None or token.kind != "word":
+            self._fail("expected a field name, got", token)
+        name = token.text
+        if name not in RAW_FIELDS and not (
+            name.startswith(METADATA_PREFIX) and len(name) > len(METADATA_PREFIX)
+        ):
+            self._fail("unknown field", token)
+        self.position += 1
+        return name
+
+    def _value(self) -> _Token:
+        token = self._peek()
+        if token is None or token.kind not in ("value", "word"):
+            self._fail("expected a value, got", token)
+        self.position += 1
+        return token
+
+    def _condition(self):
+        field = self._field()
+        token = self._peek()
+        if token is None:
+            self._fail("expected an operator")
+        if token.text in ("==", "!=", "<", "<=", ">", ">="):
+            self.position += 1
+            return ("cmp", field, token.text, self._value())
+        if token.text == "~":
+            self.position += 1
+            pattern = self._value()
+            try:
+                return ("regex", field, re.compile(str(pattern.value)))
+            except re.error as exc:
+                raise FilterError(f"bad regex {pattern.text!r}: {exc}") from None
+        if self._accept("in"):
+            self._expect("{")
+            values = [self._value()]
+            while self._accept(","):
+                values.append(self._value())
+            self._expect("}")
+            return ("in", field, values)
+        if self._accept("between"):
+            low = self._value()
+            self._expect("and")
+            return ("between", field, low, self._value())
+        self._fail("expected an operator, got", token)
+
+
+class Filter:
+    """A compiled filter expression.
+
+    `levels` holds the levels every match must have (None if any level can
+    match), so scanners can reject most lines on the raw level bytes before
+    calling `match`; `match` is None when the levels say it all. `services`
+    likewise lists the only services that can match, for the sidecar index.
+    Metadata is projected at most once per line through `metadata`, which
+    scanners reuse for the record's own metadata fields.
+    """
+
+    __slots__ = (
+        "expression",
+        "levels",
+        "services",
+        "match",
+        "fields",
+        "_project",
+        "_memo_parts",
+        "_memo_values",
+    )
+
+    def __init__(
+        self,
+        expression: str,
+        levels: Optional[FrozenSet[bytes]],
+        services: Optional[FrozenSet[str]],
+        fields: Tuple[str, ...],
+        project: Callable[[str, Sequence[str]], Dict[str, Any]],
+    ):
+        self.expression = expression
+        self.levels = levels
+        self.services = services
+        self.match: Optional[Predicate] = None
+        self.fields = fields
+        self._project = project
+        self._memo_parts: Optional[Sequence[bytes]] = None
+        self._memo_values: Dict[str, Any] = {}
+
+    def metadata(self, parts: Sequence[bytes]) -> Dict[str, Any]:
+        """The projected metadata fields of a tokenized line, decoded once.
+
+        Raises UnicodeDecodeError or json.JSONDecodeError like the projector.
+        """
+        if parts is not self._memo_parts:
+            self._memo_values = self._project(parts[5].decode("utf-8"), self.fields)
+            self._memo_parts = parts
+        return self._memo_values
+
+    def level_names(self) -> Optional[List[str]]:
+        if self.levels is None:
+            return None
+        return sorted(level.decode("utf-8") for level in self.levels)
+
+    def service_names(self) -> Optional[List[str]]:
+        return None if self.services is None else sorted(self.services)
+
+
+def compile_filter(
+    expression: str,
+    record_fields: Sequence[str],
+    project: Callable[[str, Sequence[str]], Dict[str, Any]],
+) -> Filter:
+    """Compile an expression into a Filter.
+
+    `record_fields` are metadata keys the caller always needs (they are
+    projected together with the ones the expression uses) and `project`
+    extracts named keys from metadata JSON text. Raises FilterError.
+    """
+    tree = _Parser(expression).parse()
+
+    conjuncts = list(tree[1]) if tree[0] == "and" else [tree]
+    levels = _field_values(conjuncts, "level", remove=True)
+    services = _field_values(conjuncts, "service", remove=False)
+
+    keys: Dict[str, None] = dict.fromkeys(record_fields)
+    for key in _metadata_keys(tree):
+        keys.setdefault(key)
+
+    compiled = Filter(
+        expression,
+        None if levels is None else frozenset(v.encode("utf-8") for v in levels),
+        services,
+        tuple(keys),
+        project,
+    )
+    if conjuncts:
+        compiled.match = _compile(("and", conjuncts), compiled)[0]
+    return compiled
+
+
+def _field_values(
+    conjuncts: List[Any], field: str, remove: bool
+) -> Optional[FrozenSet[str]]:
+    """Intersect the values allowed by top-level conditions on `field` alone
+    (==, in, or an or of those); optionally drop them from `conjuncts`."""
+    allowed: Optional[FrozenSet[str]] = None
+    for node in list(conjuncts):
+        values = _allowed_values(node, field)
+        if values is None:
+            continue
+        allowed = values if allowed is None else allowed & values
+        if remove:
+            conjuncts.remove(node)
+    return allowed
+
+
+def _allowed_values(node, field: str) -> Optional[FrozenSet[str]]:
+    """The only values of `field` for which `node` holds, or None when the
+    node is not such a plain condition on `field`."""
+    if node[0] == "or":
+        values = [_allowed_values(child, field) for child in node[1]]
+        if any(v is None for v in values):
+            return None
+        return frozenset().union(*values)
+    if node[1:2] != (field,):
+        return None
+    if node[0] == "cmp" and node[2] == "==":
+        return frozenset([_text(node[3])])
+    if node[0] == "in":
+        return frozenset(_text(value) for value in node[2])
+    return None
+
+
+def _metadata_keys(node) -> List[str]:
+    kind = node[0]
+    if kind in ("and", "or"):
+        return [key for child in node[1] for key in _metadata_keys(child)]
+    if kind == "not":
+        return _metadata_keys(node[1])
+    field = node[1]
+    if field.startswith(METADATA_PREFIX):
+        return [field[len(METADATA_PREFIX) :].split(".")[0]]
+    return []
+
+
+def _text(token: _Token) -> str:
+    """A value as compared against a raw text field."""
+    if token.kind == "word" or isinstance(token.value, str):
+        return token.value
+    return token.text
+
+
+def _raw_bound(field: str, token: _Token, upper: bool = False) -> bytes:
+    """Encode a value for comparison with a raw field's bytes (brackets
+    included). Timestamps may use a "T" separator, and a bare date as an
+    upper timestamp bound covers its whole day."""
+    text = _text(token)
+    if field == "timestamp":
+        text = text.replace("T", " ")
+        if upper and len(text) == len("YYYY-MM-DD"):
+            text += " 23:59:59"
+    if field in BRACKETED:
+        return b"[" + text.encode("utf-8") + b"]"
+    return text.encode("utf-8")
+
+
+def _compile(node, compiled: Filter) -> Tuple[Predicate, int]:
+    """Turn a parsed node into (predicate over raw parts, cost)."""
+    kind = node[0]
+
+    if kind in ("and", "or"):
+        children = sorted(
+            (_compile(child, compiled) for child in node[1]), key=lambda pc: pc[1]
+        )
+        predicates = [predicate for predicate, _ in children]
+        if kind == "and":
+            combined = reduce(_both, predicates)
+        else:
+            combined = reduce(_either, predicates)
+        return combined, max(cost for _, cost in children)
+
+    if kind == "not":
+        inner, cost = _compile(node[1], compiled)
+        return (lambda parts: not inner(parts)), cost
+
+    field = node[1]
+    if field.startswith(METADATA_PREFIX):
+        return _compile_metadata(node, compiled), COST_METADATA
+    return _compile_raw(node), COST_REGEX if kind == "regex" else COST_RAW
+
+
+def _both(first: Predicate, second: Predicate) -> Predicate:
+    return lambda parts: first(parts) and second(parts)
+
+
+def _either(first: Predicate, second: Predicate) -> Predicate:
+    return lambda parts: first(parts) or second(parts)
+
+
+def _compile_raw(node) -> Predicate:
+    """Conditions on raw fields, evaluated on the undecoded line bytes.
+
+    Bytes order like the strings they encode, so comparisons need no decode;
+    timestamps and services keep their brackets on both sides.
+    """
+    kind, field = node[0], node[1]
+    i = RAW_FIELDS[field]
+
+    if kind == "regex":
+        pattern = node[2]
+        if field in BRACKETED:
+            return lambda parts: (
+                pattern.search(parts[i][1:-1].decode("utf-8")) is not None
+            )
+        return lambda parts: pattern.search(parts[i].decode("utf-8")) is not None
+
+    if kind == "in":
+        values = frozenset(_raw_bound(field, value) for value in node[2])
+        return lambda parts: parts[i] in values
+
+    if kind == "between":
+        low = _raw_bound(field, node[2])
+        high = _raw_bound(field, node[3], upper=True)
+        if field in BRACKETED:
+            # "]" sorts after every character a timestamp holds, so compare
+            # the inner text to keep "[2024-05-01]" below "[2024-05-01 10:00]".
+            low, high = low[1:-1], high[1:-1]
+            return lambda parts: low <= parts[i][1:-1] <= high
+        return lambda parts: low <= parts[i] <= high
+
+    op = node[2]
+    bound = _raw_bound(field, node[3], upper=op == "<=")
+    if op == "==":
+        return lambda parts: parts[i] == bound
+    if op == "!=":
+        return lambda parts: parts[i] != bound
+    if field in BRACKETED:
+        bound = bound[1:-1]
+        return _ordering(op, lambda parts: parts[i][1:-1], bound)
+    return _ordering(op, lambda parts: parts[i], bound)
+
+
+def _ordering(op: str, get: Callable[[Any], Any], bound: Any) -> Predicate:
+    if op == "<":
+        return lambda parts: get(parts) < bound
+    if op == "<=":
+        return lambda parts: get(parts) <= bound
+    if op == ">":
+        return lambda parts: get(parts) > bound
+    return lambda parts: get(parts) >= bound
+
+
+def _compile_metadata(node, compiled: Filter) -> Predicate:
+    """Conditions on metadata values: decoded JSON, compared by type.
+
+    Ordering comparisons only hold between two numbers or two strings, so a
+    missing key or a value of another type simply does not match.
+    """
+    kind = node[0]
+    key, *path = node[1][len(METADATA_PREFIX) :].split(".")
+    quoted = json.dumps(key).encode("utf-8")
+
+    def get(parts):
+        # Without the quoted key or any escape the key cannot be there, and
+        # most lines are rejected without decoding their metadata.
+        if quoted not in parts[5] and b"\\" not in parts[5]:
+            return None
+        value = compiled.metadata(parts)[key]
+        for step in path:
+            value = value.get(step) if isinstance(value, dict) else None
+        return value
+
+    if kind == "regex":
+        pattern = node[2]
+
+        def search(parts):
+            value = get(parts)
+            return isinstance(value, str) and pattern.search(value) is not None
+
+        return search
+
+    if kind == "in":
+        values = [token.value for token in node[2]]
+        return lambda parts: any(_equal(get(parts), value) for value in values)
+
+    if kind == "between":
+        low, high = node[2].value, node[3].value
+        return lambda parts: _ordered(low, get(parts)) and _ordered(get(parts), high)
+
+    op, value = node[2], node[3].value
+    if op == "==":
+        return lambda parts: _equal(get(parts), value)
+    if op == "!=":
+        return lambda parts: not _equal(get(parts), value)
+    if op == "<":
+        return lambda parts: _ordered(get(parts), value, strict=True)
+    if op == "<=":
+        return lambda parts: _ordered(get(parts), value)
+    if op == ">":
+        return lambda parts: _ordered(value, get(parts), strict=True)
+    return lambda parts: _ordered(value, get(parts))
+
+
+def _kind(value: Any) -> Optional[type]:
+    if isinstance(value, bool) or value is None:
+        return type(value)
+    if isinstance(value, (int, float)):
+        return float
+    if isinstance(value, str):
+        return str
+    return None
+
+
+def _equal(left: Any, right: Any) -> bool:
+    """JSON equality: 1 == 1.0, but true is not 1."""
+    return _kind(left) is _kind(right) and left == right
+
+
+def _ordered(low: Any, high: Any, strict: bool = False) -> bool:
+    """low <= high (or <) when both are numbers or both are strings."""
+    kind = _kind(low)
+    if kind not in (float, str) or kind is not _kind(high):
+        return False
+    return low < high if strict else low <= high
@@ -1,98 +1,291 @@
+import argparse
 import random
-import json
+import re
+import sys
 from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
 
+START_TIME = datetime(2024, 5, 1, 10, 0, 0)
 
-def generate_logs(num_lines=200):
-    start_time = datetime(2024, 5, 1, 10, 0, 0)
-    lines = []
+# Share of each level among the well-formed lines when --levels is not given;
+# matches the mix of the original scenario list.
+DEFAULT_LEVEL_MIX = {"INFO": 2, "DEBUG": 1, "WARN": 1, "ERROR": 2}
+DEFAULT_MALFORMED_RATIO = 0.05
+DEFAULT_USERS = 100
 
-    # Định nghĩa các kịch bản log giống hệt mẫu bạn cung cấp
-    scenarios = [
-        # (LEVEL, SERVICE, MESSAGE, METADATA_GENERATOR)
+# Lines rendered per write() call when streaming to a file.
+WRITE_BATCH_LINES = 10_000
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def _scenarios(rng: random.Random, users: int):
+    """(LEVEL, SERVICE, MESSAGE, METADATA_GENERATOR) tuples, as in the
+    sample logs. Metadata is rendered straight to JSON text."""
+
+    def user() -> int:
+        return rng.randrange(100, 100 + users)
+
+    return [
         (
             "INFO",
-            "[auth-service]",
+            "auth-service",
             "User login successful",
-            lambda: {
-                "user_id": random.randint(100, 199),
-                "ip": f"192.168.1.{random.randint(2, 254)}",
-            },
+            lambda: f'{{"user_id": {user()}, "ip": "192.168.1.{rng.randint(2, 254)}"}}',
         ),
         (
             "DEBUG",
-            "[payment-service]",
+            "payment-service",
             "Processing transaction",
-            lambda: {"amount": random.choice([500, 1200, 2340, 3000, 450])},
+            lambda: f'{{"amount": {rng.choice([500, 1200, 2340, 3000, 450])}}}',
         ),
         (
             "ERROR",
-            "[payment-service]",
+            "payment-service",
             "Connection timeout",
-            lambda: {
-                "user_id": random.randint(100, 199),
-                "retry": random.randint(1, 3),
-            },
+            lambda: f'{{"user_id": {user()}, "retry": {rng.randint(1, 3)}}}',
         ),
         (
             "INFO",
-            "[auth-service]",
+            "auth-service",
             "Token refreshed",
-            lambda: {"user_id": random.randint(100, 199)},
+            lambda: f'{{"user_id": {user()}}}',
         ),
         (
             "WARN",
-            "[risk-engine]",
+            "risk-engine",
             "High latency detected",
-            lambda: {"latency_ms": random.randint(1000, 5000)},
+            lambda: f'{{"latency_ms": {rng.randint(1000, 5000)}}}',
         ),
         (
             "ERROR",
-            "[payment-service]",
+            "payment-service",
             "Insufficient Funds",
-            lambda: {
-                "user_id": random.randint(100, 199),
-                "balance": round(random.uniform(0.5, 50.0), 2),
-            },
+            lambda: (
+                f'{{"user_id": {user()}, '
+                f'"balance": {round(rng.uniform(0.5, 50.0), 2)!r}}}'
+            ),
         ),
     ]
 
-    req_counter = 1
-    current_time = start_time
 
-    for _ in range(num_lines):
-        # 5% cơ hội sinh ra dòng log rác (Broken line) để test tool
-        if random.random() < 0.05:
-            garbage_id = random.randint(10000, 99999)
-            lines.append(f"BROKEN_LINE_GARBAGE_DATA_{garbage_id}")
+def iter_logs(
+    num_lines: Optional[int] = None,
+    seed: Optional[int] = None,
+    level_mix: Optional[Dict[str, float]] = None,
+    malformed_ratio: float = DEFAULT_MALFORMED_RATIO,
+    services: Optional[int] = None,
+    users: int = DEFAULT_USERS,
+    start_time: datetime = START_TIME,
+) -> Iterator[str]:
+    """Yield synthetic log lines one at a time; endless if `num_lines` is None.
+
+    The same `seed` and options always give the same lines. `level_mix`
+    weights the levels of well-formed lines, `malformed_ratio` is the share
+    of garbage lines, `services` spreads lines over that many service names
+    instead of the sample ones and `users` sets the number of distinct
+    user IDs (100, 101, ...).
+    """
+    rng = random.Random(seed)
+    mix = level_mix or DEFAULT_LEVEL_MIX
+    by_level: Dict[str, List[Tuple[str, str, str, object]]] = {}
+    for scenario in _scenarios(rng, users):
+        by_level.setdefault(scenario[0], []).append(scenario)
+    unknown = set(mix) - set(by_level)
+    if unknown:
+        raise ValueError(f"unknown levels: {', '.join(sorted(unknown))}")
+
+    levels = list(mix)
+    cumulative = []
+    total = 0.0
+    for level in levels:
+        total += mix[level]
+        cumulative.append(total)
+    service_names = (
+        None if services is None else [f"service-{i:03d}" for i in range(services)]
+    )
+
+    req_counter = 1
+    # The clock runs in whole seconds since midnight of the start date; the
+    # date part is only re-rendered when the day changes.
+    start_day = datetime.combine(start_time.date(), datetime.min.time())
+    clock = int((start_time - start_day).total_seconds())
+    day_offset = -1
+    date_str = ""
+    produced = 0
+    while num_lines is None or produced < num_lines:
+        produced += 1
+        # A share of garbage lines to exercise the malformed-line handling.
+        if rng.random() < malformed_ratio:
+            yield f"BROKEN_LINE_GARBAGE_DATA_{rng.randint(10000, 99999)}"
             continue
 
-        # Tăng thời gian ngẫu nhiên 1-3 giây mỗi dòng
-        current_time += timedelta(seconds=random.randint(1, 3))
-        timestamp_str = current_time.strftime("%Y-%m-%d %H:%M:%S")
+        # Advance the clock by 1-3 seconds per line.
+        clock += rng.randint(1, 3)
+        day, second = divmod(clock, 86400)
+        if day != day_offset:
+            day_offset = day
+            date_str = (start_day + timedelta(days=day)).strftime("%Y-%m-%d")
+        hour, second = divmod(second, 3600)
+        minute, second = divmod(second, 60)
+        timestamp_str = f"{date_str} {hour:02d}:{minute:02d}:{second:02d}"
 
-        # Chọn ngẫu nhiên 1 kịch bản
-        level, service, msg, meta_func = random.choice(scenarios)
-        meta_json = json.dumps(meta_func())
+        level = levels[0]
+        pick = rng.random() * total
+        for candidate, bound in zip(levels, cumulative):
+            if pick < bound:
+                level = candidate
+                break
+        _, service, msg, meta_func = rng.choice(by_level[level])
+        if service_names is not None:
+            service = rng.choice(service_names)
 
         # Format: [TIMESTAMP] | LEVEL | [SERVICE] | REQ_ID | MSG | JSON
-        # Updated (PEP 8 Standard):
-        line = (
-            f"[{timestamp_str}] | {level} | {service} | "
-            f"req-{req_counter:03d} | {msg} | {meta_json}"
+        yield (
+            f"[{timestamp_str}] | {level} | [{service}] | "
+            f"req-{req_counter:03d} | {msg} | {meta_func()}"
         )
-        lines.append(line)
-
         req_counter += 1
 
-    return lines
 
+def generate_logs(num_lines: int = 200, **options) -> List[str]:
+    """Return `num_lines` synthetic log lines; see iter_logs for the options."""
+    return list(iter_logs(num_lines, **options))
 
-if __name__ == "__main__":
-    logs = generate_logs(200)
 
-    # Ghi ra file server.log
-    with open("server2.log", "w", encoding="utf-8") as f:
-        f.write("\n".join(logs))
+def write_logs(
+    output_path: str,
+    num_lines: Optional[int] = None,
+    size: Optional[int] = None,
+    **options,
+) -> Tuple[int, int]:
+    """Stream synthetic lines to a file until `num_lines` lines or `size`
+    bytes are written, without holding them in memory.
+
+    Returns (lines, bytes) written. Pass '-' to write to stdout.
+    """
+    if num_lines is None and size is None:
+        raise ValueError("give num_lines or size")
 
-    print(f"Đã tạo thành công {len(logs)} dòng log vào file 'server.log'.")
+    lines = iter_logs(num_lines, **options)
+    written_lines = 0
+    written_bytes = 0
+    out = sys.stdout.buffer if output_path == "-" else open(output_path, "wb")
+    try:
+        while True:
+            batch = []
+            for line in lines:
+                batch.append(line)
+                if len(batch) == WRITE_BATCH_LINES:
+                    break
+            if not batch:
+                break
+            data = ("\n".join(batch) + "\n").encode("utf-8")
+            full = size is not None and written_bytes + len(data) >= size
+            if full:
+                # Keep only the whole lines that still fit within `size`.
+                data = data[: data.rfind(b"\n", 0, size - written_bytes) + 1]
+                batch = batch[: data.count(b"\n")]
+            out.write(data)
+            written_lines += len(batch)
+            written_bytes += len(data)
+            if full:
+                break
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    return written_lines, written_bytes
+
+
+def parse_size(value: str) -> int:
+    """Parse sizes such as 500M, 1.5G or 1048576 into bytes."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"expected a size like 500M or 2G: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_level_mix(value: str) -> Dict[str, float]:
+    """Parse a level mix such as INFO=60,ERROR=20,WARN=15,DEBUG=5."""
+    mix = {}
+    for part in value.split(","):
+        level, _, weight = part.partition("=")
+        try:
+            mix[level.strip().upper()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"expected LEVEL=WEIGHT pairs, got {part!r}"
+            ) from None
+    return mix
+
+
+def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic server log, streamed to disk."
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output_path",
+        default="server2.log",
+        help="Output log file, or '-' for stdout (default: server2.log).",
+    )
+    amount = parser.add_mutually_exclusive_group()
+    amount.add_argument(
+        "-n", "--lines", type=int, help="Number of lines to write (default: 200)."
+    )
+    amount.add_argument(
+        "-s", "--size", type=parse_size, help="Approximate file size, e.g. 1G."
+    )
+    parser.add_argument("--seed", type=int, help="Seed for reproducible output.")
+    parser.add_argument(
+        "--levels",
+        dest="level_mix",
+        type=parse_level_mix,
+        help="Level weights, e.g. INFO=60,ERROR=20,WARN=15,DEBUG=5.",
+    )
+    parser.add_argument(
+        "--malformed",
+        dest="malformed_ratio",
+        type=float,
+        default=DEFAULT_MALFORMED_RATIO,
+        help="Share of garbage lines (default: 0.05).",
+    )
+    parser.add_argument(
+        "--services",
+        type=int,
+        help="Number of distinct service names (default: the sample services).",
+    )
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=DEFAULT_USERS,
+        help="Number of distinct user IDs (default: 100).",
+    )
+
+    parsed = parser.parse_args(args)
+    if parsed.lines is None and parsed.size is None:
+        parsed.lines = 200
+    return parsed
+
+
+def main():
+    args = parse_arguments()
+    lines, size = write_logs(
+        args.output_path,
+        num_lines=args.lines,
+        size=args.size,
+        seed=args.seed,
+        level_mix=args.level_mix,
+        malformed_ratio=args.malformed_ratio,
+        services=args.services,
+        users=args.users,
+    )
+    if args.output_path != "-":
+        print(f"Wrote {lines} lines ({size} bytes) to '{args.output_path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# File: line_stats.py
+"""Aggregators fed every well-formed line of a scan.
+
+The scanner that picks out the report's records also hands the raw fields
+of every line inside the time window, whatever its level or --filter, to
+the aggregators in ScanStats.aggregators. Level histograms, per-service
+line counts and custom consumers thereby come out of the same single pass
+as the error report instead of each re-reading the file.
+"""
+
+from collections import Counter
+from typing import Any, Dict, List
+
+# Raw fields per line: timestamp, level, service, request ID, message and
+# metadata.
+FIELDS = 6
+
+
+class LineAggregator:
+    """Base class of the consumers a scan feeds line by line.
+
+    Lines come as their FIELDS raw byte fields (timestamp and service still
+    in brackets), in file order and in batches: every few thousand lines
+    the scanner calls `update` with the fields of all of them in one flat
+    list, which by default calls `add` per line. Override `update` too when
+    a batch can be folded in at once, e.g. by slicing out one field with
+    `fields[i::FIELDS]`, as per-line calls add up over millions of lines.
+
+    Scans split across workers fill one `empty()` copy each, which are
+    then merged, so an aggregator must pickle and `empty()` must carry over
+    its configuration. Its `summary()` goes under `name` in report
+    summaries; the name also tells cached parses apart, so give differently
+    configured aggregators different names.
+    """
+
+    name = ""
+
+    def add(self, parts: List[bytes]) -> None:
+        raise NotImplementedError
+
+    def update(self, fields: List[bytes]) -> None:
+        """Fold in a batch of lines; the list is reused after the call."""
+        for i in range(0, len(fields), FIELDS):
+            self.add(fields[i : i + FIELDS])
+
+    def merge(self, other: "LineAggregator") -> None:
+        raise NotImplementedError
+
+    def empty(self) -> "LineAggregator":
+        return type(self)()
+
+    def summary(self) -> Any:
+        raise NotImplementedError
+
+
+class FieldCounts(LineAggregator):
+    """Lines per value of one raw field, most frequent first."""
+
+    field = 0
+    strip = 0
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def add(self, parts: List[bytes]) -> None:
+        self.counts[parts[self.field]] += 1
+
+    def update(self, fields: List[bytes]) -> None:
+        self.counts.update(fields[self.field :: FIELDS])
+
+    def merge(self, other: "FieldCounts") -> None:
+        self.counts.update(other.counts)
+
+    def summary(self) -> Dict[str, int]:
+        strip = self.strip
+        return {
+            value[strip : len(value) - strip].decode("utf-8", errors="replace"): count
+            for value, count in sorted(
+                self.counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        }
+
+
+class LevelCounts(FieldCounts):
+    """Histogram of log levels."""
+
+    name = "lines_by_level"
+    field = 1
+
+
+class ServiceCounts(FieldCounts):
+    """Lines per service, whatever their level."""
+
+    name = "lines_by_service"
+    field = 2
+    strip = 1
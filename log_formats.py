@@ -0,0 +1,598 @@
+# File: log_formats.py
+"""Log line formats, declared once and compiled into tokenizers.
+
+Whatever its layout on disk, a format hands the scanners the six raw
+fields of the built-in pipe format, as bytes:
+
+    [b"[2024-05-01 10:00:01]", b"ERROR", b"[payment]", b"req-1",
+     b"Connection timeout", b'{"user_id": 101}']
+
+so filters, the sidecar index, rollups and line aggregators work on every
+format unchanged. Timestamps are rewritten to TIMESTAMP_FORMAT, which
+compares correctly as bytes.
+
+A LayoutFormat is declared by a layout such as
+
+    '{remote_addr} - {user_id} [{timestamp}] "{message}" {status} ...'
+
+and compiled once. With a `delimiter` its fast path splits a line on it
+and checks each column's literal prefix and suffix, as the pipe format
+does; lines the split cannot take, and layouts without a delimiter, go
+through one bytes regex built from the layout. Neither decodes the line.
+Fields beyond the six become keys of the metadata object. A JsonFormat
+reads JSON lines, whose object is itself the metadata.
+
+detect_format picks the format that parses most of a file's first lines.
+"""
+
+import json
+import re
+from operator import itemgetter
+from string import Formatter
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+from timestamps import ISO_TIMESTAMP, TimestampDecoder, format_timestamp_bytes
+
+# Constants should be UPPER_CASE
+LOG_PATTERN = re.compile(
+    r"^\[(.*?)\] \| (\w+) \| \[(.*?)\] \| (.*?) \| (.*?) \| (\{.*\})$"
+)
+
+
+# The fields every format yields, in order.
+CANONICAL_FIELDS = (
+    "timestamp",
+    "level",
+    "service",
+    "request_id",
+    "message",
+    "metadata",
+)
+
+# The format of files nothing else parses, and the --log-format that
+# detects it per file.
+DEFAULT_FORMAT = "pipe"
+AUTO_FORMAT = "auto"
+
+# Leading bytes of a file that detect_format looks at.
+DETECT_SIZE = 8 << 10
+
+# Layout field types: how a field is matched and written to the metadata.
+FIELD_TYPES = ("str", "int", "float")
+_TYPE_PATTERNS = {"int": r"-?(?:0|[1-9]\d*)", "float": r"-?(?:0|[1-9]\d*)(?:\.\d+)?"}
+_JSON_NUMBER = _TYPE_PATTERNS["float"].encode("ascii")
+# JSON numbers, each followed by a space.
+_NUMBERS = re.compile(rb"(?:%s )*" % _JSON_NUMBER)
+# Bytes that can stand in a JSON string as they are; deleting them from a
+# text that is a valid string body leaves nothing.
+_PLAIN = bytes(byte for byte in range(0x20, 0x7F) if byte not in b'"\\')
+
+
+def tokenize_line(line: str) -> Optional[Tuple[str, str, str, str, str, str]]:
+    """Split a log line into its six raw fields without decoding the JSON.
+
+    Returns (timestamp, level, service, request_id, message, metadata_str),
+    or None when the line does not follow the log format.
+    """
+    line = line.strip()
+
+    # With exactly five pipes the " | " delimiters are unambiguous, so a plain
+    # split captures the same groups as LOG_PATTERN; anything else falls back.
+    if line.count("|") == 5 and "\n" not in line:
+        parts = line.split(" | ")
+        if len(parts) == 6:
+            timestamp, level, service, req_id, message, metadata_str = parts
+            if (
+                timestamp[:1] == "["
+                and timestamp[-1:] == "]"
+                and level.isalnum()
+                and service[:1] == "["
+                and service[-1:] == "]"
+                and metadata_str[:1] == "{"
+                and metadata_str[-1:] == "}"
+            ):
+                return (
+                    timestamp[1:-1],
+                    level,
+                    service[1:-1],
+                    req_id,
+                    message,
+                    metadata_str,
+                )
+
+    match = LOG_PATTERN.match(line)
+    if not match:
+        return None
+    return match.groups()
+
+
+def _tokenize_bytes(line: bytes) -> Optional[List[bytes]]:
+    """Split a stripped raw line on the fast path, or return None to fall back.
+
+    None does not mean malformed: the caller decodes the line and hands it to
+    tokenize_line, which applies the regex fallback.
+    """
+    if line.count(b"|") != 5:
+        return None
+    parts = line.split(b" | ")
+    if (
+        len(parts) == 6
+        and parts[0][:1] == b"["
+        and parts[0][-1:] == b"]"
+        and parts[1].isalnum()
+        and parts[2][:1] == b"["
+        and parts[2][-1:] == b"]"
+        and parts[5][:1] == b"{"
+        and parts[5][-1:] == b"}"
+    ):
+        return parts
+    return None
+
+
+def _fallback_parts(fields: Tuple[str, str, str, str, str, str]) -> List[bytes]:
+    """Re-encode a regex-parsed line into the fast path's raw parts."""
+    timestamp, level, service, req_id, message, metadata_str = fields
+    return [
+        f"[{timestamp}]".encode("utf-8"),
+        level.encode("utf-8"),
+        f"[{service}]".encode("utf-8"),
+        req_id.encode("utf-8"),
+        message.encode("utf-8"),
+        metadata_str.encode("utf-8"),
+    ]
+
+
+class LogFormat:
+    """A line format: the six raw fields of a line, or None if the line
+    is not in the format.
+
+    `split` is the fast path, given a stripped line; `parse` is given the
+    raw lines `split` rejects and may raise UnicodeDecodeError, which the
+    scanners count as malformed. Formats are pickled to worker processes.
+    """
+
+    name = ""
+    timestamp_format: Optional[str] = None
+
+    def split(self, line: bytes) -> Optional[List[bytes]]:
+        raise NotImplementedError
+
+    def parse(self, raw: bytes) -> Optional[List[bytes]]:
+        return None
+
+    def tokenize(self, raw: bytes) -> Optional[List[bytes]]:
+        """Either path, for callers outside the scanners' loops."""
+        parts = self.split(raw.strip())
+        if parts is None:
+            try:
+                parts = self.parse(raw)
+            except UnicodeDecodeError:
+                return None
+        return parts
+
+    def _timestamp(self, raw: bytes) -> Optional[bytes]:
+        """`raw` in TIMESTAMP_FORMAT, or None if it is not a timestamp."""
+        if self.timestamp_format == ISO_TIMESTAMP:
+            if len(raw) < 19 or raw[4:5] != b"-" or raw[13:14] != b":":
+                return None
+            return raw[:10] + b" " + raw[11:19]
+        seconds = self._decode_timestamp(raw)
+        return None if seconds is None else format_timestamp_bytes(seconds)
+
+    def _init_timestamps(self, timestamp_format: Optional[str]) -> None:
+        self.timestamp_format = timestamp_format
+        self._decode_timestamp = TimestampDecoder(timestamp_format).decode
+
+
+class PipeFormat(LogFormat):
+    """The built-in `[timestamp] | LEVEL | [service] | request ID | message
+    | {metadata}` layout, on its hand-tuned fast path."""
+
+    name = DEFAULT_FORMAT
+    split = staticmethod(_tokenize_bytes)
+
+    def parse(self, raw: bytes) -> Optional[List[bytes]]:
+        fields = tokenize_line(raw.decode("utf-8"))
+        return None if fields is None else _fallback_parts(fields)
+
+
+class LayoutFormat(LogFormat):
+    """A format declared by its layout.
+
+    `layout` spells a line with `{field}` placeholders between literal
+    text (`{{` and `}}` for literal braces) and must have a timestamp,
+    parsed with `timestamp_format` (strptime or ISO_TIMESTAMP; None if it
+    is already in TIMESTAMP_FORMAT). Fields match as little as they can
+    unless `patterns` gives a regex (without capturing groups) or `types`
+    a FIELD_TYPES type. Missing standard fields take their `defaults`,
+    else empty; with `level_from`, a (field, function) pair, the level is
+    computed from that field. Levels are upper-cased.
+
+    Fields not among CANONICAL_FIELDS make up the metadata object, typed
+    by `types`; values equal to `null`, and numbers that do not parse,
+    are written as null. A layout with a `metadata` field takes its JSON
+    object as it is instead.
+
+    With `delimiter`, every delimited column of the layout must hold
+    exactly one field; lines are then split on the delimiter first and
+    only go through the regex when the split does not fit.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        layout: str,
+        delimiter: Optional[str] = None,
+        timestamp_format: Optional[str] = None,
+        types: Optional[Mapping[str, str]] = None,
+        patterns: Optional[Mapping[str, str]] = None,
+        defaults: Optional[Mapping[str, str]] = None,
+        level_from: Optional[Tuple[str, Callable[[bytes], bytes]]] = None,
+        null: Optional[str] = None,
+    ):
+        self.name = name
+        self.layout = layout
+        self.delimiter = delimiter
+        self.types = dict(types or {})
+        self.patterns = dict(patterns or {})
+        self.defaults = dict(defaults or {})
+        self.level_from = level_from
+        self.null = None if null is None else null.encode("utf-8")
+        self._init_timestamps(timestamp_format)
+
+        pieces = _layout_pieces(layout)
+        self.fields = [field for _, field in pieces if field is not None]
+        unknown = set(self.types) | set(self.patterns) | set(self.defaults)
+        unknown -= set(self.fields) | set(CANONICAL_FIELDS)
+        if level_from is not None:
+            unknown |= {level_from[0]} - set(self.fields)
+        if len(set(self.fields)) != len(self.fields) or unknown:
+            raise ValueError(f"{name}: unknown or repeated fields in {layout!r}")
+        if "timestamp" not in self.fields:
+            raise ValueError(f"{name}: the layout needs a {{timestamp}} field")
+        for field, kind in self.types.items():
+            if kind not in FIELD_TYPES:
+                raise ValueError(f"{name}: unknown type {kind!r} of {field}")
+
+        self._pattern = re.compile(self._regex(pieces).encode("utf-8"), re.DOTALL)
+        self._compile_columns()
+        self._compile_fields()
+
+    def split(self, line: bytes) -> Optional[List[bytes]]:
+        if self._delimiter is None:
+            return self._match(line)
+        columns = line.split(self._delimiter)
+        if len(columns) != self._width:
+            return None
+        for index, prefix, suffix, cut in self._affixes:
+            column = columns[index]
+            if (
+                len(column) < cut
+                or not column.startswith(prefix)
+                or not column.endswith(suffix)
+            ):
+                return None
+            columns[index] = column[len(prefix) : len(column) - len(suffix)]
+        return self._assemble(tuple(columns), False)
+
+    def parse(self, raw: bytes) -> Optional[List[bytes]]:
+        return None if self._delimiter is None else self._match(raw.strip())
+
+    def _match(self, line: bytes) -> Optional[List[bytes]]:
+        match = self._pattern.fullmatch(line)
+        if match is None:
+            return None
+        return self._assemble(match.groups(), self._typed_pattern)
+
+    def _assemble(
+        self, values: Tuple[bytes, ...], typed: bool
+    ) -> Optional[List[bytes]]:
+        """The six raw fields from a line's field values, in layout order;
+        `typed` when the numbers already matched their types' patterns."""
+        timestamp = values[self._timestamp_index]
+        if self.timestamp_format is not None:
+            timestamp = self._timestamp(timestamp)
+            if timestamp is None:
+                return None
+        values += self._constants
+        level, service, request_id, message = self._pick(values)
+        if self.level_from is not None:
+            level = self.level_from[1](values[self._level_index])
+        if self._metadata_index is not None:
+            metadata = values[self._metadata_index]
+        else:
+            metadata = self._metadata(values, typed)
+        return [
+            b"[" + timestamp + b"]",
+            level.upper(),
+            b"[" + service + b"]",
+            request_id,
+            message,
+            metadata,
+        ]
+
+    def _metadata(self, values: Tuple[bytes, ...], typed: bool) -> bytes:
+        """The JSON object of the fields beyond the six."""
+        numbers = self._get_numbers(values)
+        if (
+            not b"".join(self._get_strings(values)).translate(None, _PLAIN)
+            and (self.null is None or self.null not in numbers)
+            and (typed or _NUMBERS.fullmatch(b" ".join(numbers)))
+        ):
+            # The common case: one fill of a template. With no quotes in the
+            # strings, a quoted null can only be a whole value.
+            metadata = self._template % self._get_extras(values)
+            if self.null is not None:
+                metadata = metadata.replace(self._quoted_null, b"null")
+            return metadata
+
+        items = []
+        for index in self._extras:
+            value = values[index]
+            if value == self.null:
+                text = b"null"
+            elif index in self._numbers:
+                text = value if _NUMBERS.fullmatch(value + b" ") else b"null"
+            elif not value.translate(None, _PLAIN):
+                text = b'"' + value + b'"'
+            else:
+                text = json.dumps(value.decode("utf-8", errors="replace")).encode()
+            items.append(self._keys[index] + text)
+        return b"{" + b", ".join(items) + b"}"
+
+    def _regex(self, pieces: List[Tuple[str, Optional[str]]]) -> str:
+        regex = []
+        for i, (literal, field) in enumerate(pieces):
+            regex.append(re.escape(literal))
+            if field is None:
+                continue
+            pattern = self.patterns.get(field)
+            kind = self.types.get(field)
+            if pattern is None and kind in _TYPE_PATTERNS:
+                pattern = _TYPE_PATTERNS[kind]
+                if self.null is not None:
+                    pattern += "|" + re.escape(self.null.decode("utf-8"))
+            if pattern is None:
+                # The last field takes the rest of the line.
+                last = all(later is None for _, later in pieces[i + 1 :])
+                pattern = ".*" if last else ".*?"
+            elif re.compile(pattern).groups:
+                raise ValueError(f"{self.name}: the pattern of {field} has groups")
+            regex.append(f"({pattern})")
+        return "".join(regex)
+
+    def _compile_columns(self) -> None:
+        """The delimited columns' literal prefixes and suffixes, for split."""
+        self._delimiter = None
+        if self.delimiter is None:
+            return
+        columns = self.layout.split(self.delimiter)
+        self._affixes = []
+        for index, column in enumerate(columns):
+            pieces = _layout_pieces(column)
+            if sum(field is not None for _, field in pieces) != 1 or (
+                pieces[0][1] is None
+            ):
+                raise ValueError(
+                    f"{self.name}: each column of {self.layout!r} needs one field"
+                )
+            prefix = pieces[0][0].encode("utf-8")
+            suffix = pieces[1][0].encode("utf-8") if len(pieces) > 1 else b""
+            if prefix or suffix:
+                cut = len(prefix) + len(suffix)
+                self._affixes.append((index, prefix, suffix, cut))
+        self._delimiter = self.delimiter.encode("utf-8")
+        self._width = len(columns)
+
+    def _compile_fields(self) -> None:
+        position = {field: i for i, field in enumerate(self.fields)}
+        self._timestamp_index = position["timestamp"]
+        self._level_index = (
+            None if self.level_from is None else position[self.level_from[0]]
+        )
+        self._metadata_index = position.get("metadata")
+        # Values of the missing standard fields, appended to a line's
+        # values so that one itemgetter picks all four, and an empty one
+        # that pads the other getters so that they always return tuples.
+        constants = []
+        indexes = []
+        for field in ("level", "service", "request_id", "message"):
+            if field in position:
+                indexes.append(position[field])
+            else:
+                indexes.append(len(self.fields) + len(constants))
+                constants.append(self.defaults.get(field, "").encode("utf-8"))
+        pad = len(self.fields) + len(constants)
+        self._constants = (*constants, b"")
+        self._pick = itemgetter(*indexes)
+
+        # The metadata fields, with their JSON keys and a template holding
+        # the fields in order, quoted unless they are numbers.
+        self._extras = [
+            position[field] for field in self.fields if field not in CANONICAL_FIELDS
+        ]
+        self._numbers = [
+            i for i in self._extras if self.types.get(self.fields[i]) in _TYPE_PATTERNS
+        ]
+        self._strings = [i for i in self._extras if i not in self._numbers]
+        # Whether the regex itself checks every number, with no custom
+        # pattern in place of its type's.
+        self._typed_pattern = not any(
+            self.fields[i] in self.patterns for i in self._numbers
+        )
+        self._keys = {
+            i: json.dumps(self.fields[i]).encode("utf-8") + b": " for i in self._extras
+        }
+        self._template = (
+            b"{"
+            + b", ".join(
+                self._keys[i].replace(b"%", b"%%")
+                + (b"%s" if i in self._numbers else b'"%s"')
+                for i in self._extras
+            )
+            + b"}%s"
+        )
+        self._get_extras = itemgetter(*self._extras, pad)
+        self._get_numbers = itemgetter(*self._numbers, pad)
+        self._get_strings = itemgetter(*self._strings, pad)
+        if self.null is not None:
+            self._quoted_null = b'"' + self.null + b'"'
+
+
+def _layout_pieces(layout: str) -> List[Tuple[str, Optional[str]]]:
+    """(literal, field) pairs of a layout; the last field may be None."""
+    pieces = []
+    for literal, field, spec, conversion in Formatter().parse(layout):
+        if spec or conversion:
+            raise ValueError(f"use patterns instead of format specs in {layout!r}")
+        pieces.append((literal, field or None))
+    return pieces
+
+
+class JsonFormat(LogFormat):
+    """JSON lines: one object per line, which is also the metadata.
+
+    `keys` maps standard fields to the object's keys when they differ
+    (`{"message": "msg"}`); missing values take their `defaults`, else
+    empty. Levels are upper-cased.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        keys: Optional[Mapping[str, str]] = None,
+        timestamp_format: Optional[str] = ISO_TIMESTAMP,
+        defaults: Optional[Mapping[str, str]] = None,
+    ):
+        self.name = name
+        self.keys = {field: field for field in CANONICAL_FIELDS[:5]}
+        self.keys.update(keys or {})
+        self.defaults = dict(defaults or {})
+        self._init_timestamps(timestamp_format)
+
+    def split(self, line: bytes) -> Optional[List[bytes]]:
+        if line[:1] != b"{":
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        keys = self.keys
+        timestamp = record.get(keys["timestamp"])
+        if not isinstance(timestamp, str):
+            return None
+        timestamp = timestamp.encode("utf-8")
+        if self.timestamp_format is not None:
+            timestamp = self._timestamp(timestamp)
+            if timestamp is None:
+                return None
+        level, service, request_id, message = (
+            self._text(record, field)
+            for field in ("level", "service", "request_id", "message")
+        )
+        return [
+            b"[" + timestamp + b"]",
+            level.upper(),
+            b"[" + service + b"]",
+            request_id,
+            message,
+            line,
+        ]
+
+    def _text(self, record: Dict, field: str) -> bytes:
+        value = record.get(self.keys[field])
+        if value is None:
+            return self.defaults.get(field, "").encode("utf-8")
+        return str(value).encode("utf-8")
+
+
+def http_level(status: bytes) -> bytes:
+    """ERROR for a 5xx response status, WARN for 4xx and INFO otherwise."""
+    return _HTTP_LEVELS.get(status[:1], b"INFO")
+
+
+_HTTP_LEVELS = {b"5": b"ERROR", b"4": b"WARN"}
+
+
+def syslog_level(priority: bytes) -> bytes:
+    """The level of a syslog priority's severity (priority % 8)."""
+    try:
+        return _SYSLOG_LEVELS[int(priority) % 8]
+    except ValueError:
+        return b"INFO"
+
+
+# emerg, alert, crit, err, warning, notice, info, debug
+_SYSLOG_LEVELS = (b"ERROR",) * 4 + (b"WARN", b"INFO", b"INFO", b"DEBUG")
+
+LOG_FORMATS: Dict[str, LogFormat] = {}
+
+
+def register_format(line_format: LogFormat) -> LogFormat:
+    """Add a format to the registry (and to the --log-format choices when
+    registered before the arguments are parsed)."""
+    if line_format.name == AUTO_FORMAT:
+        raise ValueError(f"{AUTO_FORMAT!r} is not a format name")
+    LOG_FORMATS[line_format.name] = line_format
+    return line_format
+
+
+def get_format(name: str) -> LogFormat:
+    try:
+        return LOG_FORMATS[name]
+    except KeyError:
+        raise ValueError(f"unknown log format: {name!r}") from None
+
+
+def detect_format(lines: Iterable[bytes]) -> LogFormat:
+    """The registered format that parses the most of `lines`; earlier
+    registered formats win ties, and the default one when none parses any."""
+    sample = [line for line in lines if line.strip()]
+    best, best_count = LOG_FORMATS[DEFAULT_FORMAT], 0
+    for line_format in LOG_FORMATS.values():
+        count = sum(1 for line in sample if line_format.tokenize(line) is not None)
+        if count > best_count:
+            best, best_count = line_format, count
+    return best
+
+
+PIPE_FORMAT = register_format(PipeFormat())
+register_format(JsonFormat("jsonl"))
+register_format(
+    LayoutFormat(
+        "nginx",
+        '{remote_addr} - {user_id} [{timestamp}] "{message}" {status} '
+        '{body_bytes_sent} "{http_referer}" "{http_user_agent}"',
+        timestamp_format="%d/%b/%Y:%H:%M:%S %z",
+        types={"status": "int", "body_bytes_sent": "int"},
+        patterns={"remote_addr": r"\S+", "user_id": r"\S+"},
+        defaults={"service": "nginx"},
+        level_from=("status", http_level),
+        null="-",
+    )
+)
+register_format(
+    LayoutFormat(
+        "syslog",
+        "<{priority}>{timestamp} {host} {service}{pid}: {message}",
+        timestamp_format="%b %d %H:%M:%S",
+        types={"priority": "int"},
+        patterns={
+            "timestamp": r"[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d",
+            "host": r"\S+",
+            "service": r"[^\s:\[]+",
+            "pid": r"(?:\[\d+\])?",
+        },
+        level_from=("priority", syslog_level),
+    )
+)
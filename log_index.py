@@ -0,0 +1,227 @@
+# File: log_index.py
+
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from timestamps import TimestampDecoder, parse_timestamp
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+
+# Target size of one indexed block; blocks always end on a newline.
+INDEX_BLOCK_SIZE = 1 << 20
+
+# A block while it is being built:
+# [start, end, min_timestamp, max_timestamp, levels, services, lines]
+Block = List[Any]
+
+
+def index_path_for(input_path: str) -> str:
+    """Return the sidecar index path for a log file."""
+    return input_path + INDEX_SUFFIX
+
+
+class IndexBuilder:
+    """Collect per-block timestamp ranges and level/service sets.
+
+    Feed it every line of a byte range in order with `add`; each call advances
+    the offset by the line's length (including its newline).
+    """
+
+    def __init__(self, start: int = 0, block_size: Optional[int] = None):
+        self.block_size = block_size or INDEX_BLOCK_SIZE
+        self.blocks: List[Block] = []
+        self._offset = start
+        self._block = self._new_block(start)
+
+    @staticmethod
+    def _new_block(start: int) -> Block:
+        return [start, start, None, None, set(), set(), 0]
+
+    def add(
+        self,
+        length: int,
+        timestamp: Optional[bytes] = None,
+        level: Optional[bytes] = None,
+        service: Optional[bytes] = None,
+    ) -> None:
+        """Record one line; fields are None for malformed lines."""
+        block = self._block
+        self._offset += length
+        block[6] += 1
+
+        if timestamp is not None:
+            if block[2] is None or timestamp < block[2]:
+                block[2] = timestamp
+            if block[3] is None or timestamp > block[3]:
+                block[3] = timestamp
+            block[4].add(level)
+            block[5].add(service)
+
+        if self._offset - block[0] >= self.block_size:
+            block[1] = self._offset
+            self.blocks.append(block)
+            self._block = self._new_block(self._offset)
+
+    def finish(self, end: int) -> List[Block]:
+        """Close the last block at `end` and return all blocks."""
+        block = self._block
+        if block[6]:
+            block[1] = end
+            self.blocks.append(block)
+        elif self.blocks:
+            self.blocks[-1][1] = end
+        self._block = self._new_block(end)
+        return self.blocks
+
+
+class LogIndex:
+    """Sparse sidecar index: byte ranges with timestamp bounds and bitmaps."""
+
+    def __init__(
+        self,
+        size: int,
+        mtime_ns: int,
+        levels: List[str],
+        services: List[str],
+        blocks: List[List[Any]],
+    ):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.levels = levels
+        self.services = services
+        # [start, end, min_timestamp, max_timestamp, level_bits, service_bits],
+        # timestamps in epoch seconds; None if the block has no well-formed
+        # line or a timestamp not in TIMESTAMP_FORMAT, which bounds nothing.
+        self.blocks = blocks
+
+    @classmethod
+    def from_blocks(cls, input_path: str, blocks: List[Block]) -> "LogIndex":
+        """Build an index from IndexBuilder blocks covering the whole file."""
+        stat = os.stat(input_path)
+        levels: Dict[bytes, int] = {}
+        services: Dict[bytes, int] = {}
+        rows = []
+        decode = TimestampDecoder().decode
+
+        for start, end, min_ts, max_ts, block_levels, block_services, _ in blocks:
+            level_bits = 0
+            for level in block_levels:
+                level_bits |= 1 << levels.setdefault(level, len(levels))
+            service_bits = 0
+            for service in block_services:
+                service_bits |= 1 << services.setdefault(service, len(services))
+            # Timestamps in TIMESTAMP_FORMAT order the same as bytes, so the
+            # block's bytes bounds are its earliest and latest lines.
+            low = None if min_ts is None else decode(min_ts)
+            high = None if max_ts is None else decode(max_ts)
+            if low is None or high is None:
+                low = high = None
+            rows.append([start, end, low, high, level_bits, service_bits])
+
+        return cls(
+            stat.st_size,
+            stat.st_mtime_ns,
+            [_decode(level) for level in levels],
+            [_decode(service) for service in services],
+            rows,
+        )
+
+    def is_current(self, input_path: str) -> bool:
+        """Check that the indexed file has not changed since indexing."""
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    def ranges(
+        self,
+        level: Union[str, Iterable[str], None] = None,
+        service: Union[str, Iterable[str], None] = None,
+        start: Union[str, int, None] = None,
+        end: Union[str, int, None] = None,
+    ) -> List[Tuple[int, int]]:
+        """Return merged byte ranges of blocks that may hold matching lines.
+
+        `level` and `service` take one name or several, any of which may
+        match. `start` and `end` are epoch seconds or "YYYY-MM-DD HH:MM:SS"
+        text, converted once and compared with the blocks' integer bounds;
+        text in another layout does not narrow the ranges.
+        """
+        level_mask = self._mask(self.levels, level)
+        service_mask = self._mask(self.services, service)
+        if level_mask == 0 or service_mask == 0:
+            return []
+        start, end = _epoch(start), _epoch(end)
+
+        ranges: List[Tuple[int, int]] = []
+        for block_start, block_end, min_ts, max_ts, levels, services in self.blocks:
+            # Blocks without well-formed lines have no levels.
+            if not (levels & level_mask and services & service_mask):
+                continue
+            if min_ts is not None and (
+                (start is not None and max_ts < start)
+                or (end is not None and min_ts > end)
+            ):
+                continue
+            if ranges and ranges[-1][1] == block_start:
+                ranges[-1] = (ranges[-1][0], block_end)
+            else:
+                ranges.append((block_start, block_end))
+
+        return ranges
+
+    @staticmethod
+    def _mask(names: List[str], wanted: Union[str, Iterable[str], None]) -> int:
+        if wanted is None:
+            return -1
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        mask = 0
+        for name in wanted:
+            if name in names:
+                mask |= 1 << names.index(name)
+        return mask
+
+    def save(self, path: str) -> None:
+        """Write the index as compact JSON."""
+        data = {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "levels": self.levels,
+            "services": self.services,
+            "blocks": self.blocks,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LogIndex"]:
+        """Read an index, returning None if it is missing or unreadable."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+
+        return cls(
+            data["size"],
+            data["mtime_ns"],
+            data["levels"],
+            data["services"],
+            data["blocks"],
+        )
+
+
+def _decode(value: Optional[bytes]) -> Optional[str]:
+    return None if value is None else value.decode("utf-8", "replace")
+
+
+def _epoch(value: Union[str, int, None]) -> Optional[int]:
+    return parse_timestamp(value) if isinstance(value, str) else value
@@ -1,27 +1,39 @@
-from collections import Counter
+from collections import deque
+from typing import Dict, Optional
+
+from line_stats import LevelCounts, ServiceCounts
+from parser import ScanStats, iter_log_file, write_report
 
 filename = "server.log"
-log_counts = Counter()
 
 
-def analyze_log():
-    log_counts = Counter()
+def analyze_log(
+    input_path: str = filename, output_path: Optional[str] = None
+) -> Dict[str, int]:
+    """Count the lines of each level, on the parser's own scan.
 
-    try:
-        with open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                parts = line.split("|")
-                #
-                if len(parts) >= 2:
-                    level = parts[1].strip()
-                    log_counts[level] += 1
-
-        print("Analysis result:")
-        for level, count in log_counts.items():
-            print(f"{level}: {count}")
+    With `output_path` the same pass also writes the error report, with
+    the level and per-service line counts in its summary, so a combined
+    report reads and parses the file only once.
+    """
+    levels = LevelCounts()
+    stats = ScanStats(aggregators=(levels, ServiceCounts()))
 
+    try:
+        errors = iter_log_file(input_path, stats=stats)
+        if output_path is None:
+            deque(errors, maxlen=0)
+        else:
+            write_report(errors, output_path, aggregators=stats.aggregators)
     except FileNotFoundError:
         print("There's no LOG file")
+        return {}
+
+    log_counts = levels.summary()
+    print("Analysis result:")
+    for level, count in log_counts.items():
+        print(f"{level}: {count}")
+    return log_counts
 
 
 def main():
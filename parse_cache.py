@@ -0,0 +1,150 @@
+# File: parse_cache.py
+
+import hashlib
+import json
+import os
+import pickle
+import stat
+from typing import Any, List, Optional, Tuple
+
+CACHE_VERSION = 3
+CACHE_SUFFIX = ".pickle"
+
+# Entries are evicted, least recently used first, beyond this many bytes.
+CACHE_MAX_BYTES = 1 << 30
+
+# Smaller files are parsed faster than a cache entry is written and read.
+CACHE_MIN_SIZE = 1 << 20
+
+# Parses with more errors are not cached, which bounds the entry collected
+# while the errors stream into a report.
+CACHE_MAX_RECORDS = 1 << 20
+
+# Bytes hashed at the start, middle and end of a file for its fingerprint.
+SAMPLE_SIZE = 64 << 10
+
+
+def default_cache_dir() -> str:
+    """$XDG_CACHE_HOME/log-parser, or ~/.cache/log-parser."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "log-parser")
+
+
+def file_fingerprint(input_path: str) -> Optional[Tuple[str, int, int, str]]:
+    """(real path, size, mtime in ns, hash of sampled content), or None for
+    anything but a regular file.
+
+    Size and mtime catch appends and rewrites; the sampled hash catches a
+    file replaced by one of the same size whose mtime was preserved.
+    """
+    try:
+        with open(input_path, "rb") as f:
+            info = os.fstat(f.fileno())
+            if not stat.S_ISREG(info.st_mode):
+                return None
+            size = info.st_size
+            digest = hashlib.blake2b(digest_size=16)
+            for offset in (0, (size - SAMPLE_SIZE) // 2, size - SAMPLE_SIZE):
+                f.seek(max(offset, 0))
+                digest.update(f.read(SAMPLE_SIZE))
+    except OSError:
+        return None
+    return (os.path.realpath(input_path), size, info.st_mtime_ns, digest.hexdigest())
+
+
+class ParseCache:
+    """On-disk cache of parse results, keyed by file fingerprint.
+
+    A key covers the file's fingerprint and every option that changes what
+    a parse returns (time window, filter, latency field), so a hit is only
+    possible for an unchanged file parsed the same way. Entries are pickled
+    one per file under `directory` and written atomically; a hit refreshes
+    the entry's mtime, which orders eviction once the entries exceed
+    `max_bytes`. Unreadable entries count as misses. Callers give up on an
+    entry once it holds more than `max_records` errors.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: int = CACHE_MAX_BYTES,
+        min_size: Optional[int] = None,
+        max_records: Optional[int] = None,
+    ):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.min_size = CACHE_MIN_SIZE if min_size is None else min_size
+        self.max_records = CACHE_MAX_RECORDS if max_records is None else max_records
+
+    def key(self, input_path: str, *options: Any) -> Optional[str]:
+        """The entry key for parsing `input_path` with `options`, or None if
+        the file is not worth caching (stdin, special files, small files)."""
+        if input_path == "-":
+            return None
+        fingerprint = file_fingerprint(input_path)
+        if fingerprint is None or fingerprint[1] < self.min_size:
+            return None
+        data = json.dumps([CACHE_VERSION, fingerprint, options])
+        return hashlib.blake2b(data.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Store an entry, then evict old ones; failures to write are ignored,
+        as the cache only ever saves work."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.getsize(temp_path) > self.max_bytes:
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, path)
+            self._evict()
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every entry, oldest first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(CACHE_SUFFIX):
+                continue
+            try:
+                info = entry.stat()
+            except OSError:
+                # Evicted by a concurrent run.
+                continue
+            entries.append((info.st_mtime, info.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -1,30 +1,230 @@
 # File: parser.py
 
 import argparse
+import glob
+import heapq
 import json
+import mmap
+import os
 import re
 import sys
-from collections import Counter
-from typing import Any, Dict, List, Optional
+import time
+from collections import deque
+from collections.abc import Mapping
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-# Constants should be UPPER_CASE
-LOG_PATTERN = re.compile(
-    r"^\[(.*?)\] \| (\w+) \| \[(.*?)\] \| (.*?) \| (.*?) \| (\{.*\})$"
+from aggregate import ENGINES, ErrorStats, resolve_engine
+from checkpoint import CHECKPOINT_SUFFIX, Checkpoint, checkpoint_path_for
+from decompress import (
+    MAGIC_SIZE,
+    DecompressionError,
+    detect_compression,
+    file_compression,
+    iter_decompressed_lines,
+)
+from filters import Filter, FilterError, compile_filter
+from line_stats import (
+    FIELDS,
+    FieldCounts,
+    LevelCounts,
+    LineAggregator,
+    ServiceCounts,
+)
+from profiling import (
+    Profiler,
+    StageTimings,
+    print_profile,
+    profile_path_for,
 )
+from log_formats import (
+    AUTO_FORMAT,
+    DETECT_SIZE,
+    LOG_FORMATS,
+    PIPE_FORMAT,
+    LogFormat,
+    detect_format,
+    get_format,
+    tokenize_line,
+)
+from log_index import INDEX_SUFFIX, IndexBuilder, LogIndex, index_path_for
+from parse_cache import ParseCache
+from records import ErrorBatch, ErrorRecord, Record
+from request_index import RequestIndex, RequestIndexBuilder
+from rollups import LATENCY_FIELD, LatencyStats, TimeRollups
+from sketches import DEFAULT_ERROR, ApproxStats
+from templates import TemplateMiner
+from timestamps import TIMESTAMP_FORMAT, TimestampDecoder
+from writers import REPORT_WRITERS, ReportWriter, iter_report_errors
+
+# Metadata fields the ERROR report reads; everything else stays undecoded.
+ERROR_FIELDS = ("user_id",)
+
+# Lines reported when no --filter is given.
+DEFAULT_FILTER = "level == ERROR"
+
+# Upper bound on the byte range handed to one worker task, which keeps the
+# records a finished chunk holds in memory bounded.
+MAX_CHUNK_SIZE = 64 << 20
+
+# Files next to the logs that --input directories and globs never pick up.
+SIDECAR_SUFFIXES = (INDEX_SUFFIX, CHECKPOINT_SUFFIX, ".tmp")
+
+# Records grouped into one columnar batch for the numpy aggregation engine.
+AGGREGATE_BATCH_SIZE = 1 << 16
 
+# Fields of the lines handed to the line aggregators at a time: 4,096
+# lines, kept as one flat list of bytes that the garbage collector skips.
+LINE_BATCH_SIZE = FIELDS << 12
 
-def parse_line(line: str) -> Optional[Dict[str, Any]]:
-    """Parse a single line of log into a dictionary."""
-    line = line.strip()
-    match = LOG_PATTERN.match(line)
+# Bytes read from the memory map per step; processed pages are released.
+READ_BLOCK_SIZE = 1 << 20
 
-    if not match:
+_JSON_DECODER = json.JSONDecoder()
+_VALUE_END = re.compile(r"[ \t\n\r]*[,}]")
+_FIELD_PATTERNS: Dict[str, re.Pattern] = {}
+_FILTERS: Dict[str, Filter] = {}
+
+
+def _field_pattern(field: str) -> re.Pattern:
+    """Compile (and cache) the pattern locating a top-level key's value."""
+    pattern = _FIELD_PATTERNS.get(field)
+    if pattern is None:
+        pattern = re.compile(r"[{,]\s*" + re.escape(json.dumps(field)) + r"\s*:\s*")
+        _FIELD_PATTERNS[field] = pattern
+    return pattern
+
+
+def extract_fields(
+    metadata_str: str, fields: Sequence[str]
+) -> Optional[Dict[str, Any]]:
+    """Pull top-level keys out of a JSON object without decoding all of it.
+
+    Only the values of the named keys are decoded. Returns None whenever the
+    text is not simple enough to be sure of the answer (nested objects,
+    escaped or repeated keys, missing keys); callers then fall back to a full
+    json.loads, which also reports invalid JSON.
+    """
+    if metadata_str.count("{") != 1:
         return None
 
-    timestamp, level, service, req_id, message, metadata_str = match.groups()
+    values = {}
+    for field in fields:
+        match = _field_pattern(field).search(metadata_str)
+        if match is None or metadata_str.count(f'"{field}"') != 1:
+            return None
 
-    try:
+        try:
+            value, end = _JSON_DECODER.raw_decode(metadata_str, match.end())
+        except json.JSONDecodeError:
+            return None
+
+        if not _VALUE_END.match(metadata_str, end):
+            return None
+
+        values[field] = value
+
+    return values
+
+
+def project_metadata(metadata_str: str, fields: Sequence[str]) -> Dict[str, Any]:
+    """Return the named metadata fields, missing ones mapped to None.
+
+    Raises json.JSONDecodeError if the light extractor has to fall back to a
+    full decode and the metadata is not valid JSON.
+    """
+    values = extract_fields(metadata_str, fields)
+    if values is None:
         metadata = json.loads(metadata_str)
+        values = {field: metadata.get(field) for field in fields}
+    return values
+
+
+def compiled_filter(expression: str = DEFAULT_FILTER) -> Filter:
+    """Compile (and cache) a --filter expression for the report scanners.
+
+    The report's own metadata fields are projected along with the ones the
+    expression uses. Raises FilterError for an invalid expression.
+    """
+    compiled = _FILTERS.get(expression)
+    if compiled is None:
+        compiled = compile_filter(expression, ERROR_FIELDS, project_metadata)
+        _FILTERS[expression] = compiled
+    return compiled
+
+
+class LazyMetadata(Mapping):
+    """Read-only metadata mapping that keeps the raw JSON until it is needed.
+
+    Projected fields are served from the light extractor; any other key,
+    iteration or len() decodes the full object once and caches it.
+    """
+
+    __slots__ = ("raw", "_projected", "_decoded")
+
+    def __init__(self, raw: str, projected: Optional[Dict[str, Any]] = None):
+        self.raw = raw
+        self._projected = projected or {}
+        self._decoded: Optional[Dict[str, Any]] = None
+
+    def _decode(self) -> Dict[str, Any]:
+        if self._decoded is None:
+            self._decoded = json.loads(self.raw)
+        return self._decoded
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._projected:
+            return self._projected[key]
+        return self._decode()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._decode())
+
+    def __len__(self) -> int:
+        return len(self._decode())
+
+    def __repr__(self) -> str:
+        return f"LazyMetadata({self.raw!r})"
+
+
+def parse_line(
+    line: str, fields: Optional[Sequence[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """Parse a single line of log into a dictionary.
+
+    Without `fields` the metadata is fully decoded. With `fields`, metadata is
+    a LazyMetadata where only the named keys are extracted up front.
+    """
+    tokens = tokenize_line(line)
+
+    if tokens is None:
+        return None
+
+    timestamp, level, service, req_id, message, metadata_str = tokens
+
+    try:
+        if fields is None:
+            metadata = json.loads(metadata_str)
+        else:
+            projected = extract_fields(metadata_str, fields)
+            metadata = LazyMetadata(metadata_str, projected)
+            if projected is None:
+                metadata._decode()
     except json.JSONDecodeError:
         return None
 
@@ -38,6 +238,77 @@ def parse_line(line: str) -> Optional[Dict[str, Any]]:
     }
 
 
+def positive_int(value: str) -> int:
+    """Argparse type for options that need a number greater than zero."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
+
+def _error_bound(value: str) -> float:
+    """Argparse type for a relative error strictly between 0 and 1."""
+    number = float(value)
+    if not 0 < number < 1:
+        raise argparse.ArgumentTypeError(f"expected a number in (0, 1), got {value}")
+    return number
+
+
+def _start_timestamp(value: str) -> str:
+    """Argparse type for --start-date: a date or a full timestamp."""
+    return normalize_timestamp(value, end_of_day=False)
+
+
+def _end_timestamp(value: str) -> str:
+    """Argparse type for --end-date; a bare date covers the whole day."""
+    return normalize_timestamp(value, end_of_day=True)
+
+
+def normalize_timestamp(value: str, end_of_day: bool) -> str:
+    """TIMESTAMP_FORMAT text of an ISO date or timestamp; a bare date is
+    its first second, or its last with `end_of_day`. Raises
+    argparse.ArgumentTypeError for anything else."""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"expected YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS', got {value!r}"
+        ) from None
+    if end_of_day and len(value) <= len("YYYY-MM-DD"):
+        moment = moment.replace(hour=23, minute=59, second=59)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def expand_inputs(patterns: Sequence[str]) -> List[str]:
+    """Expand --input values into log file paths, keeping the given order.
+
+    Directories contribute the files directly inside them and glob patterns
+    the files they match, both sorted by name; index, checkpoint and
+    temporary sidecars are skipped. Other values, including '-', are kept
+    as they are. Raises ValueError for a pattern that matches no file.
+    """
+    paths: List[str] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(glob.escape(pattern), "*"))
+        elif any(char in pattern for char in "*?["):
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            paths.append(pattern)
+            continue
+
+        files = sorted(
+            path
+            for path in matches
+            if os.path.isfile(path) and not path.endswith(SIDECAR_SUFFIXES)
+        )
+        if not files:
+            raise ValueError(f"no log files match {pattern!r}")
+        paths.extend(files)
+
+    return list(dict.fromkeys(paths))
+
+
 def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -48,8 +319,9 @@ def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
         "-i",
         "--input",
         dest="input_path",  # Map --input to variable 'input_path'
+        nargs="+",
         required=True,
-        help="Path to the input log file.",
+        help="Input log files, directories or glob patterns ('-' reads from stdin).",
     )
     parser.add_argument(
         "-o",
@@ -64,43 +336,1115 @@ def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="Enable all output information.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        help="Number of worker processes (default: 1 for a single file, the "
+        "number of CPUs for several files).",
+    )
+    parser.add_argument(
+        "--start-date",
+        dest="start_ts",
+        type=_start_timestamp,
+        help="Only report errors at or after this date/time.",
+    )
+    parser.add_argument(
+        "--end-date",
+        dest="end_ts",
+        type=_end_timestamp,
+        help="Only report errors at or before this date/time.",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filter_expr",
+        default=DEFAULT_FILTER,
+        help="Lines to report, e.g. 'level in {ERROR, WARN} and "
+        "metadata.latency_ms > 2000' (default: 'level == ERROR').",
+    )
+    parser.add_argument(
+        "--log-format",
+        dest="log_format",
+        choices=[AUTO_FORMAT, *LOG_FORMATS],
+        default=AUTO_FORMAT,
+        help="Layout of the input lines; 'auto' picks the format that parses "
+        "most of each file's first lines (default: auto).",
+    )
+    parser.add_argument(
+        "--context",
+        dest="context_lines",
+        type=positive_int,
+        metavar="N",
+        help="Attach up to N earlier lines of each failing request (same "
+        "request ID) to its record; needs a single uncompressed file.",
+    )
+    parser.add_argument(
+        "--rollups",
+        action="store_true",
+        help="Add per-hour and per-minute error counts by service and "
+        f"message, error spikes and {LATENCY_FIELD} percentiles per service "
+        "to the summary.",
+    )
+    parser.add_argument(
+        "--line-counts",
+        action="store_true",
+        help="Add line counts by level and by service, over all lines in the "
+        "time window, to the summary; counted in the same pass.",
+    )
+    parser.add_argument(
+        "--approx",
+        dest="approx_error",
+        type=_error_bound,
+        nargs="?",
+        const=DEFAULT_ERROR,
+        metavar="ERROR",
+        help="Estimate distinct users and top messages/users with fixed-size "
+        "sketches, within relative error ERROR (default: 0.01).",
+    )
+    parser.add_argument(
+        "--templates",
+        action="store_true",
+        help="Count error messages by template, with tokens containing "
+        "digits (IDs, amounts) masked, and add the top templates with "
+        "example parameters to the summary.",
+    )
+    parser.add_argument(
+        "--index",
+        dest="use_index",
+        action="store_true",
+        help="Build or reuse a .idx sidecar to skip blocks without matches.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="Always parse the input instead of reusing the results cached "
+        "for an unchanged file.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the parse cache (default: $XDG_CACHE_HOME/log-parser "
+        "or ~/.cache/log-parser).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Parse only lines appended since the last run and merge them "
+        "into the existing report.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Like --resume, but keep polling the file for new lines.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        dest="checkpoint_path",
+        help="Checkpoint file for --resume/--follow (default: <output>.ckpt).",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between polls in --follow mode (default: 5).",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=sorted(REPORT_WRITERS),
+        default="json",
+        help="Report format: a JSON document, JSON Lines, CSV (summary in "
+        "<output>.summary.json) or a compressed NumPy .npz archive "
+        "(default: json).",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="auto",
+        help="Aggregation engine for the statistics; auto uses numpy when "
+        "installed (default: auto).",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile_path",
+        nargs="?",
+        const="",
+        help="Time each pipeline stage and write the stats as JSON to this "
+        "file (default: <output>.profile.json).",
+    )
+    parser.add_argument(
+        "--cprofile",
+        dest="cprofile_path",
+        help="With --profile, also dump cProfile stats (pstats format) here.",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        action="store_true",
+        help="With --profile, also trace allocations and list the top sites.",
+    )
 
     # Allow passing args list for easier testing
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    try:
+        parsed.input_paths = expand_inputs(parsed.input_path)
+    except ValueError as exc:
+        parser.error(str(exc))
+    # input_path keeps the value as typed, for messages; runs read input_paths.
+    parsed.input_path = " ".join(parsed.input_path)
+    multiple = len(parsed.input_paths) > 1
+    try:
+        compiled_filter(parsed.filter_expr)
+    except FilterError as exc:
+        parser.error(f"--filter: {exc}")
+    if parsed.profile_path is None and (parsed.cprofile_path or parsed.tracemalloc):
+        parsed.profile_path = ""
+    if parsed.profile_path == "":
+        parsed.profile_path = profile_path_for(parsed.output_path)
+    if parsed.workers is None:
+        parsed.workers = (os.cpu_count() or 1) if multiple else 1
+    if multiple and "-" in parsed.input_paths:
+        parser.error("stdin ('-') cannot be combined with other inputs")
+    if multiple and (parsed.resume or parsed.follow):
+        parser.error("--resume/--follow need a single input file")
+    if (parsed.resume or parsed.follow) and parsed.input_paths[0] == "-":
+        parser.error("--resume/--follow need a regular file, not stdin")
+    if (parsed.resume or parsed.follow) and file_compression(parsed.input_paths[0]):
+        parser.error("--resume/--follow need an uncompressed log file")
+    if parsed.context_lines and (
+        multiple
+        or parsed.input_paths[0] == "-"
+        or parsed.resume
+        or parsed.follow
+        or file_compression(parsed.input_paths[0])
+    ):
+        parser.error(
+            "--context needs a single uncompressed log file, without --resume/--follow"
+        )
+    return parsed
+
+
+class ScanStats:
+    """Line counters filled in by the scanner while records are consumed.
+
+    With `timings` set (--profile) the scanner also records how long each
+    pipeline stage took. With `latency` set (--rollups) it summarises the
+    latency metadata of every line inside the time window, whatever its
+    level; the same lines are fed to every one of `aggregators`.
+    """
+
+    __slots__ = ("total_lines", "malformed_lines", "timings", "latency", "aggregators")
+
+    def __init__(
+        self,
+        total_lines: int = 0,
+        malformed_lines: int = 0,
+        timings: Optional[StageTimings] = None,
+        latency: Optional[LatencyStats] = None,
+        aggregators: Sequence[LineAggregator] = (),
+    ):
+        self.total_lines = total_lines
+        self.malformed_lines = malformed_lines
+        self.timings = timings
+        self.latency = latency
+        self.aggregators = tuple(aggregators)
+
+    def merge(self, other: "ScanStats") -> None:
+        self.total_lines += other.total_lines
+        self.malformed_lines += other.malformed_lines
+        if self.timings is not None and other.timings is not None:
+            self.timings.merge(other.timings)
+        if self.latency is not None and other.latency is not None:
+            self.latency.merge(other.latency)
+        for aggregator, part in zip(self.aggregators, other.aggregators):
+            aggregator.merge(part)
+
+    def child(self) -> "ScanStats":
+        """Empty stats for part of a scan, profiled and collecting latency
+        and line aggregates if these stats are."""
+        return ScanStats(
+            timings=None if self.timings is None else StageTimings(),
+            latency=None if self.latency is None else self.latency.empty(),
+            aggregators=self.empty_aggregators(),
+        )
+
+    def empty_aggregators(self) -> Tuple[LineAggregator, ...]:
+        """Empty copies of the aggregators, for workers to fill."""
+        return tuple(aggregator.empty() for aggregator in self.aggregators)
+
+    @property
+    def latency_field(self) -> Optional[str]:
+        """The metadata key workers must summarise, or None."""
+        return None if self.latency is None else self.latency.field
 
 
-def process_log_file(input_path: str, verbose: bool = False) -> List[Dict[str, Any]]:
-    """Read log file and filter ERROR logs."""
+def iter_errors(
+    lines: Iterable[bytes],
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    index: Optional[IndexBuilder] = None,
+    stats: Optional[ScanStats] = None,
+    filter_expr: str = DEFAULT_FILTER,
+    requests: Optional[RequestIndexBuilder] = None,
+    line_format: LogFormat = PIPE_FORMAT,
+) -> Iterator[ErrorRecord]:
+    """Yield a record for every raw line of `line_format` matching
+    `filter_expr`.
+
+    Cheap checks come first: the level on the raw bytes, then the time
+    window and any other raw-field conditions, still undecoded. Only
+    matching lines are decoded to str, and their JSON metadata is only
+    looked at for `user_id` and the keys the filter names; their timestamp
+    becomes epoch seconds, kept as text if it does not decode. A broken JSON
+    tail is therefore only reported as malformed when the extractor has to
+    fall back to a full decode; undecodable bytes on a line the filter
+    reads count as malformed too.
+
+    Records outside [start_ts, end_ts] are dropped. When `index` is given,
+    every line is also fed to it; lines must then come without newlines.
+    The same goes for `requests`, which also makes records carry their
+    request ID. Line counters are added to `stats` once the lines are
+    exhausted; `stats.latency` and `stats.aggregators` are fed as lines go
+    by.
+
+    When `stats.timings` is set (--profile) each stage is timed as well.
+    Every stage boundary then costs a clock read, so a profiled scan is
+    somewhat slower; the split between stages is what matters. Time spent
+    by the consumer between records is not counted. Metadata the filter
+    decodes, and latency metadata, is counted as json, not filter; line
+    aggregators count as aggregate.
+    """
+    flt = compiled_filter(filter_expr)
+    levels, match = flt.levels, flt.match
+    split, parse = line_format.split, line_format.parse
+    latency = None if stats is None else stats.latency
+    aggregators = () if stats is None else stats.aggregators
+    pending: Optional[List[bytes]] = [] if aggregators else None
+    start = None if start_ts is None else start_ts.encode("utf-8")
+    end = None if end_ts is None else end_ts.encode("utf-8")
+    decode_timestamp = TimestampDecoder().decode
+    timed = stats is not None and stats.timings is not None
+    clock = time.perf_counter
+    mark = read = match_time = indexing = filtering = decode = parse_json = 0.0
+    aggregating = 0.0
     total_lines = 0
     malformed_lines = 0
-    errors_list: List[Dict[str, Any]] = []
+    total_bytes = 0
 
     try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            for line in f:
-                total_lines += 1
-                parsed_data = parse_line(line)
+        if timed:
+            mark = clock()
+        for raw in lines:
+            total_lines += 1
+            if timed:
+                now = clock()
+                read += now - mark
+                mark = now
+                total_bytes += len(raw) + (raw[-1:] != b"\n")
+            parts = split(raw.strip())
+            if timed:
+                now = clock()
+                match_time += now - mark
+                mark = now
+
+            if index is not None:
+                if parts is not None:
+                    index.add(len(raw) + 1, parts[0][1:-1], parts[1], parts[2][1:-1])
+                else:
+                    _index_fallback_line(index, raw, line_format)
+                if timed:
+                    now = clock()
+                    indexing += now - mark
+                    mark = now
+            if requests is not None:
+                requests.add(
+                    len(raw) + 1,
+                    parts[3]
+                    if parts is not None
+                    else _fallback_request_id(raw, line_format),
+                )
+                if timed:
+                    now = clock()
+                    indexing += now - mark
+                    mark = now
+
+            try:
+                if parts is None:
+                    parts = parse(raw)
+                    if timed:
+                        now = clock()
+                        match_time += now - mark
+                        mark = now
+                    if parts is None:
+                        malformed_lines += 1
+                        continue
 
-                if parsed_data is None:
-                    malformed_lines += 1
+                if latency is not None and latency.key in parts[5]:
+                    _observe_latency(latency, parts, start, end)
+                    if timed:
+                        now = clock()
+                        parse_json += now - mark
+                        mark = now
+                if pending is not None and _in_window(parts, start, end):
+                    pending.extend(parts)
+                    if len(pending) >= LINE_BATCH_SIZE:
+                        _feed_aggregators(aggregators, pending)
+                    if timed:
+                        now = clock()
+                        aggregating += now - mark
+                        mark = now
+
+                if levels is not None and parts[1] not in levels:
+                    if timed:
+                        now = clock()
+                        filtering += now - mark
+                        mark = now
+                    continue
+                timestamp = parts[0][1:-1]
+                if (
+                    (start is not None and timestamp < start)
+                    or (end is not None and timestamp > end)
+                    or (match is not None and not match(parts))
+                ):
+                    if timed:
+                        now = clock()
+                        filtering += now - mark
+                        mark = now
                     continue
+                if timed:
+                    now = clock()
+                    filtering += now - mark
+                    mark = now
+
+                seconds = decode_timestamp(timestamp)
+                timestamp = timestamp.decode("utf-8") if seconds is None else seconds
+                service = parts[2][1:-1].decode("utf-8")
+                request_id = None
+                if requests is not None and parts[3]:
+                    request_id = parts[3].decode("utf-8")
+                message = parts[4].decode("utf-8")
+                if timed:
+                    now = clock()
+                    decode += now - mark
+                    mark = now
+
+                metadata = flt.metadata(parts)
+                if timed:
+                    now = clock()
+                    parse_json += now - mark
+                    mark = now
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                malformed_lines += 1
+                continue
+
+            yield ErrorRecord(
+                timestamp, service, message, metadata["user_id"], request_id
+            )
+            if timed:
+                mark = clock()
+    finally:
+        if pending:
+            started = clock()
+            _feed_aggregators(aggregators, pending)
+            aggregating += clock() - started
+        timings = None
+        if timed:
+            timings = StageTimings()
+            timings.seconds.update(
+                read=read,
+                match=match_time,
+                index=indexing,
+                filter=filtering,
+                decode=decode,
+                json=parse_json,
+                aggregate=aggregating,
+            )
+            timings.bytes = total_bytes
+        if stats is not None:
+            stats.merge(ScanStats(total_lines, malformed_lines, timings))
+
+
+def _index_fallback_line(
+    index: IndexBuilder, raw: bytes, line_format: LogFormat = PIPE_FORMAT
+) -> None:
+    """Feed a line that missed the bytes fast path to the index builder."""
+    try:
+        parts = line_format.parse(raw)
+    except UnicodeDecodeError:
+        parts = None
+
+    if parts is None:
+        index.add(len(raw) + 1)
+    else:
+        index.add(len(raw) + 1, parts[0][1:-1], parts[1], parts[2][1:-1])
+
+
+def _observe_latency(
+    latency: LatencyStats,
+    parts: List[bytes],
+    start: Optional[bytes],
+    end: Optional[bytes],
+) -> None:
+    """Feed a line's metadata to `latency` if the line is inside the window."""
+    timestamp = parts[0][1:-1]
+    if (start is not None and timestamp < start) or (
+        end is not None and timestamp > end
+    ):
+        return
+    latency.observe(parts[2][1:-1], parts[5])
+
 
-                if parsed_data["level"] == "ERROR":
-                    user_id = parsed_data["metadata"].get("user_id")
+def _in_window(
+    parts: List[bytes], start: Optional[bytes], end: Optional[bytes]
+) -> bool:
+    """Whether a line's timestamp is inside [start, end]."""
+    if start is None and end is None:
+        return True
+    timestamp = parts[0][1:-1]
+    return (start is None or timestamp >= start) and (end is None or timestamp <= end)
 
-                    error_record = {
-                        "timestamp": parsed_data["timestamp"],
-                        "service": parsed_data["service"],
-                        "message": parsed_data["message"],
-                        "user_id": user_id,
-                    }
-                    errors_list.append(error_record)
+
+def _feed_aggregators(
+    aggregators: Sequence[LineAggregator], pending: List[bytes]
+) -> None:
+    """Hand the fields of a batch of lines to every aggregator and empty
+    the batch."""
+    for aggregator in aggregators:
+        aggregator.update(pending)
+    pending.clear()
+
+
+def _fallback_request_id(
+    raw: bytes, line_format: LogFormat = PIPE_FORMAT
+) -> Optional[bytes]:
+    """The request ID of a line that missed the bytes fast path, if any."""
+    try:
+        parts = line_format.parse(raw)
+    except UnicodeDecodeError:
+        return None
+    return None if parts is None else parts[3]
+
+
+def _iter_mmap_lines(buf: mmap.mmap, start: int, end: int) -> Iterator[bytes]:
+    """Yield the lines of buf[start:end] without their newlines.
+
+    The map is consumed in READ_BLOCK_SIZE steps and pages that have been
+    scanned are handed back to the kernel, so RSS stays flat on large files.
+    """
+    release = getattr(mmap, "MADV_DONTNEED", None)
+    released = start - start % mmap.PAGESIZE
+    carry = b""
+    position = start
+
+    while position < end:
+        stop = min(position + READ_BLOCK_SIZE, end)
+        lines = (carry + buf[position:stop]).split(b"\n")
+        carry = lines.pop()
+        yield from lines
+        position = stop
+
+        if release is not None:
+            boundary = position - position % mmap.PAGESIZE
+            if boundary > released:
+                buf.madvise(release, released, boundary - released)
+                released = boundary
+
+    if carry:
+        yield carry
+
+
+@contextmanager
+def _open_lines(
+    input_path: str, start: int = 0, end: Optional[int] = None
+) -> Iterator[Iterable[bytes]]:
+    """Open a log source as an iterable of raw byte lines.
+
+    Regular files are memory-mapped; stdin ('-'), pipes and anything else
+    that cannot be mapped are read as a buffered binary stream instead.
+    gzip, bz2, xz and zstd input, recognised by its magic bytes, is
+    decompressed on a background thread and streamed from memory.
+    """
+    if input_path == "-":
+        peek = getattr(sys.stdin.buffer, "peek", None)
+        compression = (
+            detect_compression(peek(MAGIC_SIZE)[:MAGIC_SIZE]) if peek else None
+        )
+        if compression is None:
+            yield sys.stdin.buffer
+        else:
+            yield from _decompressed_lines(sys.stdin.buffer, compression)
+        return
+
+    with open(input_path, "rb") as f:
+        compression = detect_compression(f.peek(MAGIC_SIZE)[:MAGIC_SIZE])
+        if compression is not None:
+            yield from _decompressed_lines(f, compression)
+            return
+
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Empty files, FIFOs and character devices cannot be mapped.
+            yield f
+            return
+
+        with buf:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                buf.madvise(mmap.MADV_SEQUENTIAL)
+            yield _iter_mmap_lines(buf, start, len(buf) if end is None else end)
+
+
+def _decompressed_lines(
+    source: BinaryIO, compression: str
+) -> Iterator[Iterable[bytes]]:
+    # Close the line generator so its decompression thread is joined even
+    # when the caller stops early.
+    lines = iter_decompressed_lines(source, compression)
+    try:
+        yield lines
+    finally:
+        lines.close()
+
+
+def chunk_boundaries(
+    input_path: str, chunks: int, start: int = 0, end: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    """Split bytes [start, end) of a file into at most `chunks` newline-aligned
+    ranges; `start` must itself be at the beginning of a line.
+    """
+    if end is None:
+        end = os.path.getsize(input_path)
+    step = max((end - start) // chunks, 1)
+    offsets = [start]
+
+    with open(input_path, "rb") as f:
+        for i in range(1, chunks):
+            target = max(start + i * step, offsets[-1] + 1)
+            if target >= end:
+                break
+            # Back up one byte so a range that already starts a line is kept.
+            f.seek(target - 1)
+            f.readline()
+            position = f.tell()
+            if position >= end:
+                break
+            offsets.append(position)
+
+    offsets.append(end)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def complete_lines_end(input_path: str, start: int) -> int:
+    """Return the offset just past the last newline at or after `start`."""
+    with open(input_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return start
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return buf.rfind(b"\n", start) + 1 or start
+
+
+def _iter_range(
+    input_path: str,
+    start: int,
+    end: int,
+    start_ts: Optional[str],
+    end_ts: Optional[str],
+    stats: ScanStats,
+    blocks: Optional[List[Any]] = None,
+    filter_expr: str = DEFAULT_FILTER,
+    request_parts: Optional[List[Any]] = None,
+    line_format: LogFormat = PIPE_FORMAT,
+) -> Iterator[ErrorRecord]:
+    """Yield the matching records of one byte range; index blocks go to
+    `blocks` and the request index part to `request_parts`."""
+    index = IndexBuilder(start) if blocks is not None else None
+    requests = RequestIndexBuilder(start) if request_parts is not None else None
+    with _open_lines(input_path, start, end) as lines:
+        yield from iter_errors(
+            lines, start_ts, end_ts, index, stats, filter_expr, requests, line_format
+        )
+    if index is not None:
+        blocks.extend(index.finish(end))
+    if requests is not None:
+        request_parts.append(requests.finish())
+
+
+def process_chunk(
+    input_path: str,
+    start: int,
+    end: int,
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    build_index: bool = False,
+    profile: bool = False,
+    filter_expr: str = DEFAULT_FILTER,
+    build_requests: bool = False,
+    latency_field: Optional[str] = None,
+    aggregators: Sequence[LineAggregator] = (),
+    line_format: LogFormat = PIPE_FORMAT,
+) -> Tuple[ErrorBatch, ScanStats, Optional[List[Any]], Optional[List[Any]]]:
+    """Worker entry point: parse one byte range of the log file.
+
+    Returns (errors, stats, index_blocks, request_parts); the errors come
+    back as a columnar batch, which is far cheaper to pickle than record
+    objects. The blocks are None unless `build_index` is set and the
+    request index parts None unless `build_requests` is. With `profile`
+    the stats carry stage timings, with `latency_field` sketches of that
+    metadata key, and `aggregators` (empty, to be filled) are fed the
+    range's lines, which are read as `line_format`.
+    """
+    stats = _worker_stats(profile, latency_field, aggregators)
+    blocks: Optional[List[Any]] = [] if build_index else None
+    request_parts: Optional[List[Any]] = [] if build_requests else None
+    errors = ErrorBatch.from_records(
+        _iter_range(
+            input_path,
+            start,
+            end,
+            start_ts,
+            end_ts,
+            stats,
+            blocks,
+            filter_expr,
+            request_parts,
+            line_format,
+        )
+    )
+    return errors, stats, blocks, request_parts
+
+
+def _worker_stats(
+    profile: bool,
+    latency_field: Optional[str],
+    aggregators: Sequence[LineAggregator] = (),
+) -> ScanStats:
+    return ScanStats(
+        timings=StageTimings() if profile else None,
+        latency=None if latency_field is None else LatencyStats(latency_field),
+        aggregators=aggregators,
+    )
+
+
+def _ordered_results(
+    pool: ProcessPoolExecutor, calls: Iterable[Tuple[Any, ...]], window: int
+) -> Iterator[Any]:
+    """Run process_chunk calls in the pool and yield results in call order.
+
+    At most `window` chunks are in flight, so finished chunks never pile up
+    in memory while the consumer is still writing earlier ones.
+    """
+    pending: deque = deque()
+    for call in calls:
+        pending.append(pool.submit(process_chunk, *call))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _load_index(input_path: str) -> Optional[LogIndex]:
+    """Load the sidecar index if it still describes the file."""
+    index = LogIndex.load(index_path_for(input_path))
+    if index is None or not index.is_current(input_path):
+        return None
+    return index
+
+
+def resolve_format(input_path: str, log_format: Union[str, LogFormat]) -> LogFormat:
+    """The LogFormat `log_format` names, detected from the first lines of
+    the input when it is AUTO_FORMAT."""
+    if isinstance(log_format, LogFormat):
+        return log_format
+    if log_format != AUTO_FORMAT:
+        return get_format(log_format)
+    if input_path == "-":
+        # Only what is already buffered can be looked at without consuming it.
+        peek = getattr(sys.stdin.buffer, "peek", None)
+        sample = peek(DETECT_SIZE)[:DETECT_SIZE] if peek else b""
+        if detect_compression(sample[:MAGIC_SIZE]) is not None:
+            return PIPE_FORMAT
+        return detect_format(sample.splitlines())
+    if not os.path.isfile(input_path):
+        # Reading a pipe or device would consume the lines being detected.
+        return PIPE_FORMAT
+
+    sample, size = [], 0
+    with _open_lines(input_path) as lines:
+        for line in lines:
+            sample.append(line)
+            size += len(line)
+            if size >= DETECT_SIZE:
+                break
+    return detect_format(sample)
+
+
+def iter_log_file(
+    input_path: str,
+    workers: int = 1,
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    use_index: bool = False,
+    checkpoint: Optional[Checkpoint] = None,
+    stats: Optional[ScanStats] = None,
+    filter_expr: str = DEFAULT_FILTER,
+    request_parts: Optional[List[Any]] = None,
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Iterator[ErrorRecord]:
+    """Yield the records of lines matching `filter_expr` in file order.
+
+    With `workers` > 1 the file is cut into newline-aligned byte ranges of
+    at most MAX_CHUNK_SIZE that are parsed in a process pool (`pool` if
+    given, so several files can share one); results are merged back in
+    file order, so the records are identical to a single-process run.
+    Streams such as stdin are always parsed in-process.
+
+    Only records between `start_ts` and `end_ts` are kept. With `use_index`
+    a `.idx` sidecar is written on the first full pass; later runs read only
+    the blocks that can hold matching lines (by the filter's levels and
+    services) inside the requested window, so the line counters then cover
+    just those blocks.
+
+    With `checkpoint` only the complete lines appended since it are parsed,
+    and it is moved forward once all records have been consumed; a rotated
+    or truncated file is parsed again from the start. Saving it is left to
+    the caller, once the records are safely stored. The index is not used
+    in this mode.
+
+    With `request_parts` every line is also indexed by request ID; the
+    parts, in file order, make up a RequestIndex once the records are
+    consumed, and the records carry their request IDs. The whole file is
+    read then, sidecar index or not; this needs a regular, uncompressed file.
+
+    Lines are read as `log_format`, a LogFormat or the name of a registered
+    one; by default the format is detected from the first DETECT_SIZE
+    bytes (see detect_format).
+
+    Compressed files are streamed through a decompression thread and parsed
+    in-process like stdin; workers, the index and checkpoints need byte
+    offsets into plain text and are not used for them.
+
+    Line counters are accumulated in `stats`, and stage timings too when
+    `stats.timings` is set (worker timings are summed, so they can exceed
+    the wall time). When `stats.latency` or `stats.aggregators` are set the
+    sidecar index is not used either, as they need lines from every block. Raises
+    FileNotFoundError when iteration starts if the file does not exist, and
+    DecompressionError for a corrupt compressed file.
+    """
+    if stats is None:
+        stats = ScanStats()
+    run_stats = stats.child()
+    line_format = resolve_format(input_path, log_format)
+
+    is_file = (
+        input_path != "-"
+        and os.path.isfile(input_path)
+        and file_compression(input_path) is None
+    )
+    if not is_file:
+        checkpoint = None
+    if checkpoint is not None:
+        use_index = False
+    index = _load_index(input_path) if use_index and is_file else None
+    if request_parts is not None:
+        if not is_file:
+            raise ValueError(f"request correlation needs a regular file: {input_path}")
+        index = None
+    if run_stats.latency is not None or run_stats.aggregators:
+        index = None
+    build_index = use_index and is_file and index is None
+
+    start, end = 0, None
+    if not is_file:
+        ranges = []
+    elif index is not None:
+        flt = compiled_filter(filter_expr)
+        ranges = index.ranges(
+            level=flt.level_names(),
+            service=flt.service_names(),
+            start=start_ts,
+            end=end_ts,
+        )
+    else:
+        if checkpoint is not None:
+            start = checkpoint.resume_offset(input_path)
+            end = complete_lines_end(input_path, start)
+        else:
+            end = os.path.getsize(input_path)
+        chunks = max(workers, -(-(end - start) // MAX_CHUNK_SIZE))
+        ranges = chunk_boundaries(input_path, chunks if workers > 1 else 1, start, end)
+
+    blocks: Optional[List[Any]] = [] if build_index else None
+
+    if not is_file:
+        with _open_lines(input_path) as lines:
+            yield from iter_errors(
+                lines,
+                start_ts,
+                end_ts,
+                stats=run_stats,
+                filter_expr=filter_expr,
+                line_format=line_format,
+            )
+    elif workers > 1 and len(ranges) > 1:
+        profile = run_stats.timings is not None
+        calls = [
+            (
+                input_path,
+                s,
+                e,
+                start_ts,
+                end_ts,
+                build_index,
+                profile,
+                filter_expr,
+                request_parts is not None,
+                run_stats.latency_field,
+                run_stats.empty_aggregators(),
+                line_format,
+            )
+            for s, e in ranges
+        ]
+        with (
+            nullcontext(pool)
+            if pool is not None
+            else ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+        ) as chunk_pool:
+            for (
+                chunk_errors,
+                chunk_stats,
+                chunk_blocks,
+                chunk_parts,
+            ) in _ordered_results(chunk_pool, calls, 2 * workers):
+                yield from chunk_errors
+                run_stats.merge(chunk_stats)
+                if blocks is not None:
+                    blocks.extend(chunk_blocks)
+                if request_parts is not None:
+                    request_parts.extend(chunk_parts)
+    else:
+        for range_start, range_end in ranges:
+            yield from _iter_range(
+                input_path,
+                range_start,
+                range_end,
+                start_ts,
+                end_ts,
+                run_stats,
+                blocks,
+                filter_expr,
+                request_parts,
+                line_format,
+            )
+
+    if blocks is not None:
+        LogIndex.from_blocks(input_path, blocks).save(index_path_for(input_path))
+
+    if checkpoint is not None:
+        checkpoint.advance(
+            input_path, end, run_stats.total_lines, run_stats.malformed_lines
+        )
+
+    stats.merge(run_stats)
+
+
+def parse_cached(
+    cache: ParseCache,
+    input_path: str,
+    start_ts: Optional[str],
+    end_ts: Optional[str],
+    filter_expr: str,
+    use_index: bool,
+    stats: ScanStats,
+    parse: Callable[[ScanStats], Iterable[ErrorRecord]],
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+) -> Optional[Iterable[ErrorRecord]]:
+    """The errors of an unchanged file from the parse cache, or else those
+    `parse` yields, streamed and cached on the way; None if the file is not
+    worth caching (see ParseCache.key) and the caller should parse it as
+    usual.
+
+    Entries are keyed by the file and everything else that changes a
+    parse's result: the time window, the filter, `use_index` (which limits
+    the line counters to the blocks read), the name of `log_format`
+    `parse` reads, `stats.latency_field` and the names of
+    `stats.aggregators`. An entry holds (errors, total_lines,
+    malformed_lines, latency, aggregators); its counters are merged into
+    `stats`, on a hit at once and otherwise when the errors run out.
+
+    On a miss the errors are collected into the entry as they stream by;
+    past `cache.max_records` the entry is dropped and the parse is not
+    cached, so memory stays bounded. A file that changed while it was
+    parsed is not cached either.
+    """
+    options = (
+        start_ts,
+        end_ts,
+        filter_expr,
+        use_index,
+        getattr(log_format, "name", log_format),
+        stats.latency_field,
+        [aggregator.name for aggregator in stats.aggregators],
+    )
+    key = cache.key(input_path, *options)
+    if key is None:
+        return None
+
+    entry = cache.get(key)
+    if entry is not None:
+        errors, total_lines, malformed_lines, latency, aggregators = entry
+        stats.merge(ScanStats(total_lines, malformed_lines, None, latency, aggregators))
+        return errors
+
+    return _cache_parse(cache, key, input_path, options, stats, parse)
+
+
+def _cache_parse(
+    cache: ParseCache,
+    key: str,
+    input_path: str,
+    options: Tuple[Any, ...],
+    stats: ScanStats,
+    parse: Callable[[ScanStats], Iterable[ErrorRecord]],
+) -> Iterator[ErrorRecord]:
+    run_stats = stats.child()
+    errors: Optional[ErrorBatch] = ErrorBatch()
+    for record in parse(run_stats):
+        if errors is not None:
+            errors.append(record)
+            if len(errors) > cache.max_records:
+                errors = None
+        yield record
+
+    if errors is not None and cache.key(input_path, *options) == key:
+        cache.put(
+            key,
+            (
+                errors,
+                run_stats.total_lines,
+                run_stats.malformed_lines,
+                run_stats.latency,
+                run_stats.aggregators,
+            ),
+        )
+    stats.merge(run_stats)
+
+
+def _parse_whole_file(
+    input_path: str,
+    start_ts: Optional[str],
+    end_ts: Optional[str],
+    use_index: bool,
+    profile: bool = False,
+    filter_expr: str = DEFAULT_FILTER,
+    latency_field: Optional[str] = None,
+    cache: Optional[ParseCache] = None,
+    aggregators: Sequence[LineAggregator] = (),
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+) -> Tuple[ErrorBatch, ScanStats]:
+    """Worker entry point: parse one whole file, e.g. a compressed one that
+    cannot be split into chunks, into a columnar batch, going through
+    `cache` when given."""
+    stats = _worker_stats(profile, latency_field, aggregators)
+
+    def parse(parse_stats: ScanStats) -> Iterator[ErrorRecord]:
+        return iter_log_file(
+            input_path,
+            1,
+            start_ts,
+            end_ts,
+            use_index,
+            stats=parse_stats,
+            filter_expr=filter_expr,
+            log_format=log_format,
+        )
+
+    records = None
+    if cache is not None:
+        records = parse_cached(
+            cache,
+            input_path,
+            start_ts,
+            end_ts,
+            filter_expr,
+            use_index,
+            stats,
+            parse,
+            log_format,
+        )
+    if records is None:
+        records = parse(stats)
+    if not isinstance(records, ErrorBatch):
+        records = ErrorBatch.from_records(records)
+    return records, stats
+
+
+def merge_by_timestamp(
+    streams: Iterable[Iterable[ErrorRecord]],
+) -> Iterator[ErrorRecord]:
+    """K-way merge per-file record streams into one chronological stream.
+
+    Each stream must already be in timestamp order, as a log file is;
+    records with equal timestamps keep the order of their streams. Text
+    timestamps, which did not decode, sort after epoch seconds.
+    """
+    return heapq.merge(*streams, key=_merge_key)
+
+
+def _merge_key(record: ErrorRecord) -> Tuple[bool, Union[int, str]]:
+    timestamp = record.timestamp
+    return isinstance(timestamp, str), timestamp
+
+
+def _print_scan_stats(input_path: str, stats: ScanStats) -> None:
+    print(f"Processing {input_path}...")
+    print("-" * 80)
+    print(f"\nTotal Lines Processed: {stats.total_lines}")
+    print(f"Malformed Lines Skipped: {stats.malformed_lines}")
+
+
+def process_log_file(
+    input_path: str,
+    verbose: bool = False,
+    workers: int = 1,
+    start_ts: Optional[str] = None,
+    end_ts: Optional[str] = None,
+    use_index: bool = False,
+    checkpoint_path: Optional[str] = None,
+    columnar: bool = False,
+    filter_expr: str = DEFAULT_FILTER,
+    log_format: Union[str, LogFormat] = AUTO_FORMAT,
+) -> Union[List[ErrorRecord], ErrorBatch]:
+    """Read log file and filter ERROR logs (or the lines `filter_expr` picks).
+
+    Collects iter_log_file into a list, or into an ErrorBatch when
+    `columnar` is set; see iter_log_file for the other options.
+    """
+    stats = ScanStats()
+    collect = ErrorBatch.from_records if columnar else list
+    checkpoint = None
+    if checkpoint_path is not None:
+        checkpoint = Checkpoint.load(checkpoint_path) or Checkpoint()
+
+    try:
+        errors_list = collect(
+            iter_log_file(
+                input_path,
+                workers,
+                start_ts,
+                end_ts,
+                use_index,
+                checkpoint,
+                stats,
+                filter_expr,
+                log_format=log_format,
+            )
+        )
+        if checkpoint is not None:
+            checkpoint.save(checkpoint_path)
 
         if verbose:
-            print(f"Processing {input_path}...")
-            print("-" * 80)
-            print(f"\nTotal Lines Processed: {total_lines}")
-            print(f"Malformed Lines Skipped: {malformed_lines}")
+            _print_scan_stats(input_path, stats)
 
     except FileNotFoundError:
         print(f"Error: File '{input_path}' not found.")
@@ -109,56 +1453,483 @@ def process_log_file(input_path: str, verbose: bool = False) -> List[Dict[str, A
     return errors_list
 
 
+def _print_error_summary(writer: ReportWriter) -> None:
+    stats = writer.stats
+    print("-" * 80)
+    print(f"\nTotal Errors Found: {stats.total_errors}")
+
+    approx = "" if stats.approx is None else "~"
+    if stats.templates is None:
+        print("\nTop Error Messages:")
+        for msg, count in stats.top_messages():
+            print(f" - {msg} ({approx}{count} occurrences)")
+    else:
+        print("\nTop Error Templates:")
+        for msg, count in stats.top_messages():
+            print(f" - {msg} ({count} occurrences)")
+
+    print("\nAffected Users:")
+    for user, count in stats.top_users():
+        print(f" - User ID: {user} ({approx}{count} errors)")
+
+    print("\nErrors by Service:")
+    for service, count in stats.service_counts.most_common():
+        print(f" - {service} ({count} errors)")
+
+    peak = stats.peak_minute()
+    if peak is not None:
+        print(f"\nPeak Minute: {peak['minute']} ({peak['errors']} errors)")
+
+    if stats.rollups is not None:
+        print("\nError Spikes:")
+        for spike in stats.spikes():
+            print(
+                f" - {spike['minute']} ({spike['errors']} errors, "
+                f"baseline {spike['baseline']})"
+            )
+    for aggregator in writer.aggregators:
+        if not isinstance(aggregator, FieldCounts):
+            continue
+        title = aggregator.name.replace("_", " ").capitalize()
+        print(f"\n{title}:")
+        for value, count in aggregator.summary().items():
+            print(f" - {value} ({count} lines)")
+    if writer.latency is not None:
+        print(f"\nLatency ({writer.latency.field}):")
+        for name, sketch in sorted(writer.latency.sketches.items()):
+            print(
+                f" - {name}: p50 {sketch.quantile(0.5):.0f}, "
+                f"p99 {sketch.quantile(0.99):.0f} ({sketch.count} lines)"
+            )
+
+    print("-" * 80)
+    print(f"\nReport saved to {writer.output_path}")
+
+
+def batch_records(
+    records: Iterable[Record], size: int, timings: Optional[StageTimings] = None
+) -> Iterator[ErrorBatch]:
+    """Group a record stream into columnar batches of at most `size`.
+
+    Encoding counts towards the aggregate stage when `timings` is given.
+    """
+    batch = ErrorBatch()
+    for record in records:
+        if timings is None:
+            batch.append(record)
+        else:
+            started = time.perf_counter()
+            batch.append(record)
+            timings.add("aggregate", time.perf_counter() - started)
+        if len(batch) >= size:
+            yield batch
+            batch = ErrorBatch()
+    if len(batch):
+        yield batch
+
+
+def write_report(
+    records: Union[Iterable[Record], ErrorBatch],
+    output_path: str,
+    verbose: bool = False,
+    report_format: str = "json",
+    engine: str = "auto",
+    file_summaries: Optional[Dict[str, Dict[str, Any]]] = None,
+    timings: Optional[StageTimings] = None,
+    context: Optional[Callable[[Record], List[str]]] = None,
+    rollups: bool = False,
+    latency: Optional[LatencyStats] = None,
+    approx_error: Optional[float] = None,
+    aggregators: Sequence[LineAggregator] = (),
+    templates: bool = False,
+) -> ReportWriter:
+    """Stream records into a report, computing the summary on the fly.
+
+    `file_summaries` adds per-input summaries to the summary block of a
+    report merged from several files. With `timings` (--profile) the time
+    spent counting and writing is recorded. `context` returns the lines
+    written under each record's "context" key. `rollups` adds time buckets
+    and spike flags to the summary, and `latency`, which must be complete
+    by the time the records run out, its percentiles; the same goes for
+    the summaries of `aggregators` and for `file_summaries`. With
+    `approx_error` users and messages are counted by sketches of that
+    relative error, and with `templates` messages are grouped into
+    templates.
+
+    With the numpy engine the stream is grouped into AGGREGATE_BATCH_SIZE
+    columnar batches that are counted vectorised; memory stays bounded by
+    the batch size. A ready-made ErrorBatch is counted in one go.
+    """
+    with REPORT_WRITERS[report_format](output_path, engine) as writer:
+        writer.file_summaries = {} if file_summaries is None else file_summaries
+        writer.timings = timings
+        writer.context = context
+        writer.latency = latency
+        writer.aggregators = aggregators
+        if rollups:
+            writer.stats.rollups = TimeRollups()
+        if approx_error is not None:
+            writer.stats.approx = ApproxStats(approx_error)
+        if templates:
+            writer.stats.templates = TemplateMiner()
+        if isinstance(records, ErrorBatch):
+            writer.write_batch(records)
+        elif resolve_engine(engine) == "numpy":
+            for batch in batch_records(records, AGGREGATE_BATCH_SIZE, timings):
+                writer.write_batch(batch)
+        else:
+            for record in records:
+                writer.write(record)
+
+    if verbose:
+        _print_error_summary(writer)
+
+    return writer
+
+
 def process_errors(
-    errors_list: List[Dict[str, Any]], output_path: str, verbose: bool = False
-) -> List[Dict[str, Any]]:
+    errors_list: Union[List[Record], ErrorBatch],
+    output_path: str,
+    verbose: bool = False,
+    report_format: str = "json",
+    engine: str = "auto",
+) -> Union[List[Record], ErrorBatch]:
     """Analyze errors and write report to JSON."""
-    total_errors = len(errors_list)
-    error_messages = [e["message"] for e in errors_list]
-    error_counts = Counter(error_messages)
+    write_report(errors_list, output_path, verbose, report_format, engine)
+    return errors_list
 
-    affected_users = [e["user_id"] for e in errors_list if e["user_id"] is not None]
-    user_counts = Counter(affected_users)
-    unique_users_count = len(user_counts)
 
-    if verbose:
-        print("-" * 80)
-        print(f"\nTotal Errors Found: {total_errors}")
+def _previous_errors(
+    output_path: str, checkpoint_path: Optional[str]
+) -> Iterator[Record]:
+    """Stream the errors of the report a checkpoint belongs to, if both exist."""
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return iter(())
+    if not os.path.exists(output_path):
+        return iter(())
+    return iter_report_errors(output_path)
 
-        print("\nTop Error Messages:")
-        for msg, count in error_counts.most_common():
-            print(f" - {msg} ({count} occurrences)")
 
-        print("\nAffected Users:")
-        for user, count in user_counts.items():
-            print(f" - User ID: {user} ({count} errors)")
+def _report_log_files(
+    args: argparse.Namespace,
+    profile_stats: ScanStats,
+    cache: Optional[ParseCache] = None,
+) -> ReportWriter:
+    """Parse several inputs and write one report merged by timestamp.
 
-        print("-" * 80)
-        print(f"\nReport saved to {output_path}")
+    Each file is streamed into the merge, so memory is bounded by the
+    chunks in flight instead of growing with the files; with workers the
+    chunks of all files share one process pool. Compressed files cannot be
+    split into chunks, so with workers each is handed to the pool whole,
+    all of them at once, and its errors come back as one batch.
+    """
+    file_stats = [profile_stats.child() for _ in args.input_paths]
+    total = profile_stats.child()
+    # Filled in as each file's records run out, before the writer closes.
+    file_summaries: Dict[str, Dict[str, Any]] = dict.fromkeys(args.input_paths)
 
-    report_data = {
-        "summary": {
-            "total_errors": total_errors,
-            "unique_affected_users": unique_users_count,
-        },
-        "errors": errors_list,
-    }
+    def stream(
+        path: str,
+        stats: ScanStats,
+        pool: Optional[ProcessPoolExecutor],
+        whole: Optional[Future],
+    ) -> Iterator[ErrorRecord]:
+        def parse(parse_stats: ScanStats) -> Iterator[ErrorRecord]:
+            return iter_log_file(
+                path,
+                args.workers,
+                args.start_ts,
+                args.end_ts,
+                args.use_index,
+                stats=parse_stats,
+                filter_expr=args.filter_expr,
+                log_format=args.log_format,
+                pool=pool,
+            )
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(report_data, f, indent=4)
+        records = None
+        if whole is not None:
+            records, parsed = whole.result()
+            stats.merge(parsed)
+        elif cache is not None:
+            records = parse_cached(
+                cache,
+                path,
+                args.start_ts,
+                args.end_ts,
+                args.filter_expr,
+                args.use_index,
+                stats,
+                parse,
+                args.log_format,
+            )
+        if records is None:
+            records = parse(stats)
 
-    return errors_list
+        error_stats = ErrorStats()
+        if args.approx_error is not None:
+            error_stats.approx = ApproxStats(args.approx_error)
+        if args.templates:
+            error_stats.templates = TemplateMiner()
+        for batch in batch_records(records, AGGREGATE_BATCH_SIZE):
+            error_stats.add_batch(batch, args.engine)
+            yield from batch
+        file_summaries[path] = error_stats.summary()
+        total.merge(stats)
+
+    with (
+        ProcessPoolExecutor(max_workers=args.workers)
+        if args.workers > 1
+        else nullcontext()
+    ) as pool:
+        wholes: List[Optional[Future]] = [None] * len(args.input_paths)
+        if pool is not None:
+            for i, (path, stats) in enumerate(zip(args.input_paths, file_stats)):
+                if file_compression(path):
+                    wholes[i] = pool.submit(
+                        _parse_whole_file,
+                        path,
+                        args.start_ts,
+                        args.end_ts,
+                        args.use_index,
+                        stats.timings is not None,
+                        args.filter_expr,
+                        stats.latency_field,
+                        cache,
+                        stats.empty_aggregators(),
+                        args.log_format,
+                    )
+        writer = write_report(
+            merge_by_timestamp(
+                stream(path, stats, pool, whole)
+                for path, stats, whole in zip(args.input_paths, file_stats, wholes)
+            ),
+            args.output_path,
+            False,
+            args.format,
+            args.engine,
+            file_summaries,
+            profile_stats.timings,
+            rollups=args.rollups,
+            latency=total.latency,
+            approx_error=args.approx_error,
+            aggregators=total.aggregators,
+            templates=args.templates,
+        )
+
+    if args.verbose:
+        for path, stats in zip(args.input_paths, file_stats):
+            _print_scan_stats(path, stats)
+        _print_scan_stats(f"{len(file_stats)} files", total)
+        _print_error_summary(writer)
+    profile_stats.merge(total)
+
+    return writer
+
+
+def _report_with_context(
+    args: argparse.Namespace, profile_stats: ScanStats
+) -> ReportWriter:
+    """Parse one file while indexing request IDs, then write a report whose
+    records carry the earlier lines of their request.
+
+    The records are collected first so the index is complete; context
+    lines are then read back by seeking to their offsets.
+    """
+    input_path = args.input_paths[0]
+    line_format = resolve_format(input_path, args.log_format)
+    stats = profile_stats.child()
+    request_parts: List[Any] = []
+    errors = ErrorBatch.from_records(
+        iter_log_file(
+            input_path,
+            args.workers,
+            args.start_ts,
+            args.end_ts,
+            args.use_index,
+            stats=stats,
+            filter_expr=args.filter_expr,
+            request_parts=request_parts,
+            log_format=line_format,
+        )
+    )
+    requests = RequestIndex.from_parts(input_path, request_parts, line_format)
+    try:
+        writer = write_report(
+            errors,
+            args.output_path,
+            False,
+            args.format,
+            args.engine,
+            timings=profile_stats.timings,
+            context=lambda record: requests.context(record, args.context_lines),
+            rollups=args.rollups,
+            latency=stats.latency,
+            approx_error=args.approx_error,
+            aggregators=stats.aggregators,
+            templates=args.templates,
+        )
+    finally:
+        requests.close()
+
+    if args.verbose:
+        _print_scan_stats(input_path, stats)
+        _print_error_summary(writer)
+    profile_stats.merge(stats)
+    return writer
+
+
+def _finish_profile(
+    profiler: Profiler,
+    stats: ScanStats,
+    writer: Optional[ReportWriter],
+    verbose: bool,
+) -> None:
+    data = profiler.stop(
+        stats.total_lines,
+        stats.malformed_lines,
+        0 if writer is None else writer.total_errors,
+    )
+    if verbose:
+        print_profile(data)
+    print(f"Profile saved to {profiler.stats_path}")
 
 
 def main():
     # 1. Parsing Arguments
     args = parse_arguments()
 
-    # 2. Processing Log File
-    error_collection = process_log_file(args.input_path, args.verbose)
+    checkpoint_path = None
+    if args.resume or args.follow:
+        checkpoint_path = args.checkpoint_path or checkpoint_path_for(args.output_path)
+
+    profiler = None
+    if args.profile_path is not None:
+        profiler = Profiler(args.profile_path, args.cprofile_path, args.tracemalloc)
+        profiler.start()
+    # Line counters (and stage timings, latency and line aggregates) summed
+    # over the whole run.
+    profile_stats = ScanStats(
+        timings=None if profiler is None else profiler.timings,
+        latency=LatencyStats(LATENCY_FIELD) if args.rollups else None,
+        aggregators=(LevelCounts(), ServiceCounts()) if args.line_counts else (),
+    )
+
+    # Checkpointed and --context runs never use the cache.
+    cache = ParseCache(args.cache_dir) if args.use_cache else None
+
+    # The one file of a single-input run, after globs and directories.
+    input_path = args.input_paths[0]
+    writer = None
+    first_run = True
+    try:
+        if len(args.input_paths) > 1:
+            writer = _report_log_files(args, profile_stats, cache)
+        elif args.context_lines:
+            writer = _report_with_context(args, profile_stats)
+        else:
+            while True:
+                # 2. Processing Log File (lazily, as the report consumes it)
+                stats = profile_stats.child()
+                records = None
+                if cache is not None and checkpoint_path is None:
+                    # Replayed from the cache, or streamed and cached on the
+                    # way, unless the file is too small to bother.
+                    records = parse_cached(
+                        cache,
+                        input_path,
+                        args.start_ts,
+                        args.end_ts,
+                        args.filter_expr,
+                        args.use_index,
+                        stats,
+                        lambda parse_stats: iter_log_file(
+                            input_path,
+                            args.workers,
+                            args.start_ts,
+                            args.end_ts,
+                            args.use_index,
+                            stats=parse_stats,
+                            filter_expr=args.filter_expr,
+                            log_format=args.log_format,
+                        ),
+                        args.log_format,
+                    )
+                checkpoint = None
+                if records is None:
+                    previous = _previous_errors(args.output_path, checkpoint_path)
+                    if checkpoint_path is not None:
+                        checkpoint = Checkpoint.load(checkpoint_path) or Checkpoint()
+                        if checkpoint.line_state is not None:
+                            # Line counts and latency then cover every line
+                            # read so far, as the report's errors do.
+                            stats.merge(checkpoint.line_state)
+                    new_errors = iter_log_file(
+                        input_path,
+                        args.workers,
+                        args.start_ts,
+                        args.end_ts,
+                        args.use_index,
+                        checkpoint,
+                        stats,
+                        args.filter_expr,
+                        log_format=args.log_format,
+                    )
+                    first_new = next(new_errors, None)
+                    if first_new is not None or first_run:
+                        records = chain(
+                            previous,
+                            [] if first_new is None else [first_new],
+                            new_errors,
+                        )
+
+                # 3. Generating Report
+                if records is not None:
+                    writer = write_report(
+                        records,
+                        args.output_path,
+                        False,
+                        args.format,
+                        args.engine,
+                        timings=profile_stats.timings,
+                        rollups=args.rollups,
+                        latency=stats.latency,
+                        approx_error=args.approx_error,
+                        aggregators=stats.aggregators,
+                        templates=args.templates,
+                    )
+                    if args.verbose:
+                        _print_scan_stats(input_path, stats)
+                        _print_error_summary(writer)
+                elif args.verbose:
+                    _print_scan_stats(input_path, stats)
+                if checkpoint is not None:
+                    # Only now that the report holding the new errors is
+                    # in place, so a failed write parses them again.
+                    if stats.latency is not None or stats.aggregators:
+                        checkpoint.line_state = ScanStats(
+                            latency=stats.latency, aggregators=stats.aggregators
+                        )
+                    checkpoint.save(checkpoint_path)
+                profile_stats.merge(stats)
+
+                if not args.follow:
+                    break
+                first_run = False
+                time.sleep(args.interval)
+    except FileNotFoundError as exc:
+        print(f"Error: File '{exc.filename or args.input_path}' not found.")
+        sys.exit(1)
+    except DecompressionError as exc:
+        print(f"Error: {exc}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        if not args.follow:
+            raise
+        print("\nStopped following.")
 
-    # 3. Generating Report
-    process_errors(error_collection, args.output_path, args.verbose)
+    if profiler is not None:
+        _finish_profile(profiler, profile_stats, writer, args.verbose)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+# File: profiling.py
+
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Dict, Optional
+
+# Pipeline stages timed by --profile, in pipeline order:
+#   read      - pulling raw lines from the memory map, stream or decompressor
+#   match     - fast-path split or regex fallback (including its decode)
+#   index     - feeding the sidecar index builder (--index only)
+#   filter    - level check and --start-date/--end-date window
+#   decode    - UTF-8 decoding of the fields of ERROR lines
+#   json      - metadata extraction / JSON decode
+#   aggregate - summary counters (ErrorStats) and line aggregators
+#   write     - serialising records and the summary to the report
+STAGES = (
+    "read",
+    "match",
+    "index",
+    "filter",
+    "decode",
+    "json",
+    "aggregate",
+    "write",
+)
+
+PROFILE_SUFFIX = ".profile.json"
+
+# Allocation sites listed in the stats file with --tracemalloc.
+TRACEMALLOC_TOP = 20
+
+
+def profile_path_for(output_path: str) -> str:
+    """Return the default stats file path for a report file."""
+    return output_path + PROFILE_SUFFIX
+
+
+class StageTimings:
+    """Seconds spent per pipeline stage, plus the raw bytes scanned."""
+
+    __slots__ = ("seconds", "bytes")
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.bytes = 0
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.seconds[stage] += seconds
+
+    def merge(self, other: "StageTimings") -> None:
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] += seconds
+        self.bytes += other.bytes
+
+
+class Profiler:
+    """One --profile run: wall time, stage timings and the optional
+    cProfile and tracemalloc collectors.
+
+    cProfile and tracemalloc slow the run down considerably; their stage
+    timings are only comparable with runs using the same collectors.
+    """
+
+    def __init__(
+        self,
+        stats_path: str,
+        cprofile_path: Optional[str] = None,
+        trace_memory: bool = False,
+    ):
+        self.stats_path = stats_path
+        self.cprofile_path = cprofile_path
+        self.trace_memory = trace_memory
+        self.timings = StageTimings()
+        self._profile: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile_path is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._started = time.perf_counter()
+
+    def stop(
+        self, total_lines: int, malformed_lines: int, total_errors: int
+    ) -> Dict[str, Any]:
+        """Stop the collectors, write the stats file and return its data."""
+        wall = time.perf_counter() - self._started
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.cprofile_path)
+
+        staged = sum(self.timings.seconds.values())
+        data: Dict[str, Any] = {
+            "wall_seconds": round(wall, 6),
+            "total_lines": total_lines,
+            "malformed_lines": malformed_lines,
+            "total_errors": total_errors,
+            "bytes": self.timings.bytes,
+            "lines_per_sec": round(total_lines / wall, 1) if wall else 0.0,
+            "mb_per_sec": round(self.timings.bytes / (1 << 20) / wall, 3)
+            if wall
+            else 0.0,
+            "stages": {
+                stage: {
+                    "seconds": round(seconds, 6),
+                    "share": round(seconds / staged, 4) if staged else 0.0,
+                }
+                for stage, seconds in self.timings.seconds.items()
+            },
+            "unstaged_seconds": round(max(wall - staged, 0.0), 6),
+        }
+        if self.cprofile_path is not None:
+            data["cprofile"] = self.cprofile_path
+        if self.trace_memory:
+            data["tracemalloc"] = _tracemalloc_summary()
+            tracemalloc.stop()
+
+        temp_path = self.stats_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, self.stats_path)
+        return data
+
+
+def _tracemalloc_summary() -> Dict[str, Any]:
+    """Peak traced memory and the biggest live allocation sites."""
+    _, peak = tracemalloc.get_traced_memory()
+    top = tracemalloc.take_snapshot().statistics("lineno")[:TRACEMALLOC_TOP]
+    return {
+        "peak_mb": round(peak / (1 << 20), 3),
+        "top": [
+            {
+                "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+            }
+            for stat in top
+        ],
+    }
+
+
+def print_profile(data: Dict[str, Any]) -> None:
+    """Print the stage breakdown of a stats file."""
+    print("\nProfile:")
+    print(
+        f" - {data['total_lines']} lines in {data['wall_seconds']:.2f}s "
+        f"({data['lines_per_sec']:,.0f} lines/s, {data['mb_per_sec']:.1f} MB/s)"
+    )
+    for stage, timing in data["stages"].items():
+        if timing["seconds"]:
+            print(f" - {stage:<10}{timing['seconds']:>10.3f}s{timing['share']:>8.1%}")
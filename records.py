@@ -0,0 +1,242 @@
+# File: records.py
+
+import json
+from array import array
+from collections import Counter
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from timestamps import format_timestamp, parse_timestamp
+
+
+class ErrorRecord(NamedTuple):
+    """One ERROR hit in the report.
+
+    Also supports record["field"] lookups, so code written against the old
+    four-key dicts keeps working. `request_id` is only filled in when the
+    run correlates requests (--context) and is left out of reports otherwise.
+    `timestamp` is epoch seconds, or the text of a timestamp that did not
+    decode (only pipe lines can have one); timestamp_text formats either.
+    """
+
+    timestamp: Union[int, str]
+    service: str
+    message: str
+    user_id: Any
+    request_id: Optional[str] = None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+
+# Anything the report layer accepts as a record.
+Record = Union[ErrorRecord, Dict[str, Any]]
+
+COLUMNS = ErrorRecord._fields
+
+# The dictionary-encoded columns of an ErrorBatch; timestamps are not.
+CODED_COLUMNS = COLUMNS[1:]
+
+# ErrorBatch.timestamps entries at or below this stand for text timestamps:
+# TEXT_TIMESTAMP - i is entry i of ErrorBatch.timestamp_texts.
+TEXT_TIMESTAMP = -(1 << 62)
+
+
+def timestamp_text(timestamp: Union[int, str]) -> str:
+    """The report text of a record timestamp."""
+    if isinstance(timestamp, str):
+        return timestamp
+    return format_timestamp(timestamp)
+
+
+def as_dict(record: Record) -> Dict[str, Any]:
+    """Return a record as a plain dict for serialisation."""
+    if isinstance(record, dict):
+        return record
+    data = record._asdict()
+    data["timestamp"] = timestamp_text(data["timestamp"])
+    if data["request_id"] is None:
+        del data["request_id"]
+    return data
+
+
+def counter_key(value: Any) -> Any:
+    """Return a value usable as a Counter key; unhashable JSON values
+    (lists, objects) are counted by their JSON text."""
+    try:
+        hash(value)
+    except TypeError:
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def _user_key(value: Any) -> Tuple[type, Any]:
+    """Lookup key for a user ID that keeps 1, 1.0 and True apart and copes
+    with unhashable JSON values."""
+    try:
+        hash(value)
+    except TypeError:
+        return (type(value), repr(value))
+    return (type(value), value)
+
+
+class ErrorBatch:
+    """Columnar store for error records.
+
+    Timestamps are kept as int64 epoch seconds in `timestamps`, so ranges
+    and minutes come from arithmetic; the rare text timestamp is interned
+    in `timestamp_texts` (see TEXT_TIMESTAMP). Every other column is
+    dictionary-encoded: values are interned once in a table and each
+    record only costs one int32 code per column. Counting runs on the
+    codes, and the whole batch pickles as a handful of arrays, which
+    keeps worker results cheap to ship between processes.
+    """
+
+    __slots__ = ("timestamps", "timestamp_texts", "tables", "codes", "_lookups")
+
+    def __init__(self):
+        self.timestamps = array("q")
+        self.timestamp_texts: List[str] = []
+        self.tables: Dict[str, List[Any]] = {column: [] for column in CODED_COLUMNS}
+        self.codes: Dict[str, array] = {column: array("i") for column in CODED_COLUMNS}
+        self._lookups: Dict[str, Dict[Any, int]] = {column: {} for column in COLUMNS}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Record]) -> "ErrorBatch":
+        batch = cls()
+        batch.extend(records)
+        return batch
+
+    def _encode(self, column: str, value: Any, key: Any) -> None:
+        lookup = self._lookups[column]
+        code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(self.tables[column])
+            self.tables[column].append(value)
+        self.codes[column].append(code)
+
+    def _text_timestamp(self, text: str) -> int:
+        lookup = self._lookups["timestamp"]
+        code = lookup.get(text)
+        if code is None:
+            code = lookup[text] = TEXT_TIMESTAMP - len(self.timestamp_texts)
+            self.timestamp_texts.append(text)
+        return code
+
+    def append(self, record: Record) -> None:
+        timestamp = record["timestamp"]
+        if isinstance(timestamp, str):
+            # Records read back from a report carry text.
+            seconds = parse_timestamp(timestamp)
+            timestamp = self._text_timestamp(timestamp) if seconds is None else seconds
+        self.timestamps.append(timestamp)
+        self._encode("service", record["service"], record["service"])
+        self._encode("message", record["message"], record["message"])
+        user_id = record["user_id"]
+        self._encode("user_id", user_id, _user_key(user_id))
+        # Reports written before request IDs were kept have no such key.
+        if isinstance(record, dict):
+            request_id = record.get("request_id")
+        else:
+            request_id = record.request_id
+        self._encode("request_id", request_id, request_id)
+
+    def append_batch(self, other: "ErrorBatch") -> None:
+        """Append another batch column by column, re-encoding only its
+        distinct values."""
+        if other.timestamp_texts:
+            texts = [self._text_timestamp(text) for text in other.timestamp_texts]
+            self.timestamps.extend(
+                [
+                    texts[TEXT_TIMESTAMP - seconds]
+                    if seconds <= TEXT_TIMESTAMP
+                    else seconds
+                    for seconds in other.timestamps
+                ]
+            )
+        else:
+            self.timestamps.extend(other.timestamps)
+        for column in CODED_COLUMNS:
+            lookup = self._lookups[column]
+            table = self.tables[column]
+            mapping = []
+            for value in other.tables[column]:
+                key = _user_key(value) if column == "user_id" else value
+                code = lookup.get(key)
+                if code is None:
+                    code = lookup[key] = len(table)
+                    table.append(value)
+                mapping.append(code)
+            self.codes[column].extend([mapping[code] for code in other.codes[column]])
+
+    def extend(self, records: Iterable[Record]) -> None:
+        if isinstance(records, ErrorBatch):
+            records = iter(records)
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _timestamp(self, seconds: int) -> Union[int, str]:
+        if seconds <= TEXT_TIMESTAMP:
+            return self.timestamp_texts[TEXT_TIMESTAMP - seconds]
+        return seconds
+
+    def _timestamp_values(self) -> Iterable[Union[int, str]]:
+        if self.timestamp_texts:
+            return map(self._timestamp, self.timestamps)
+        return self.timestamps
+
+    def __getitem__(self, position: int) -> ErrorRecord:
+        return ErrorRecord(
+            self._timestamp(self.timestamps[position]),
+            *(
+                self.tables[column][self.codes[column][position]]
+                for column in CODED_COLUMNS
+            ),
+        )
+
+    def __iter__(self) -> Iterator[ErrorRecord]:
+        tables = [self.tables[column] for column in CODED_COLUMNS]
+        columns = [self.codes[column] for column in CODED_COLUMNS]
+        for timestamp, codes in zip(self._timestamp_values(), zip(*columns)):
+            yield ErrorRecord(
+                timestamp, *(table[code] for table, code in zip(tables, codes))
+            )
+
+    def timestamp_range(self) -> Optional[Tuple[int, int]]:
+        """The first and last epoch seconds, None without any; text
+        timestamps are left out."""
+        seconds: Iterable[int] = self.timestamps
+        if self.timestamp_texts:
+            seconds = [value for value in seconds if value > TEXT_TIMESTAMP]
+        if not seconds:
+            return None
+        return min(seconds), max(seconds)
+
+    def value_counts(self, column: str, skip_none: bool = False) -> Counter:
+        """Count the values of a column, in order of first appearance."""
+        counts: Counter = Counter()
+        if column == "timestamp":
+            for seconds, count in Counter(self.timestamps).items():
+                counts[self._timestamp(seconds)] += count
+            return counts
+        table = self.tables[column]
+        for code, count in Counter(self.codes[column]).items():
+            value = table[code]
+            if skip_none and value is None:
+                continue
+            counts[counter_key(value)] += count
+        return counts
@@ -0,0 +1,145 @@
+# File: request_index.py
+
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+
+from log_formats import PIPE_FORMAT, LogFormat
+from records import Record, timestamp_text
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is a declared dependency
+    np = None
+
+# One part per scanned byte range: (request ID hashes, line offsets).
+Part = Tuple[array, array]
+
+
+def request_key(request_id: bytes) -> int:
+    """The 32-bit hash a request ID is indexed under; collisions are
+    resolved by checking the line itself."""
+    return zlib.crc32(request_id)
+
+
+class RequestIndexBuilder:
+    """Record the offset of every line under its request ID while scanning.
+
+    Lines arrive in file order as (length including the newline, request
+    ID or None); 12 bytes are kept per line with an ID. An empty ID, as
+    formats without a request_id field give every line, is no ID.
+    """
+
+    def __init__(self, start: int = 0):
+        self.position = start
+        self.keys = array("I")
+        self.offsets = array("Q")
+
+    def add(self, length: int, request_id: Optional[bytes] = None) -> None:
+        if request_id:
+            self.keys.append(request_key(request_id))
+            self.offsets.append(self.position)
+        self.position += length
+
+    def finish(self) -> Part:
+        return self.keys, self.offsets
+
+
+class RequestIndex:
+    """request_id -> line offsets of one log file, for pulling up the trace
+    of a failing request by seeking instead of re-scanning.
+
+    Entries are sorted by hash and then offset, so a lookup is a binary
+    search followed by one seek per line of the request. Lines read back
+    are tokenized as `line_format`, the format the file was scanned in.
+    """
+
+    def __init__(
+        self,
+        input_path: str,
+        keys: array,
+        offsets: array,
+        line_format: LogFormat = PIPE_FORMAT,
+    ):
+        self.input_path = input_path
+        self.keys = keys
+        self.offsets = offsets
+        self.line_format = line_format
+        self._file: Optional[BinaryIO] = None
+
+    @classmethod
+    def from_parts(
+        cls,
+        input_path: str,
+        parts: Sequence[Part],
+        line_format: LogFormat = PIPE_FORMAT,
+    ) -> "RequestIndex":
+        """Merge builder parts given in file order."""
+        keys = array("I")
+        offsets = array("Q")
+        for part_keys, part_offsets in parts:
+            keys.extend(part_keys)
+            offsets.extend(part_offsets)
+        # A stable sort on the hash keeps each request's offsets ascending.
+        if np is None:
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            keys = array("I", (keys[i] for i in order))
+            offsets = array("Q", (offsets[i] for i in order))
+        elif keys:
+            key_array = np.frombuffer(keys, dtype=f"u{keys.itemsize}")
+            order = np.argsort(key_array, kind="stable")
+            keys = array("I", key_array[order].tobytes())
+            offsets = array(
+                "Q",
+                np.frombuffer(offsets, dtype=f"u{offsets.itemsize}")[order].tobytes(),
+            )
+        return cls(input_path, keys, offsets, line_format)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lines(self, request_id: str) -> Iterator[bytes]:
+        """Yield the stripped raw lines of a request in file order."""
+        for line, _ in self._entries(request_id):
+            yield line
+
+    def _entries(self, request_id: str) -> Iterator[Tuple[bytes, List[bytes]]]:
+        # (stripped line, canonical parts) of the request's lines.
+        encoded = request_id.encode("utf-8")
+        key = request_key(encoded)
+        low = bisect_left(self.keys, key)
+        high = bisect_right(self.keys, key, low)
+        if low == high:
+            return
+        if self._file is None:
+            self._file = open(self.input_path, "rb")
+        for i in range(low, high):
+            self._file.seek(self.offsets[i])
+            line = self._file.readline().strip()
+            parts = self.line_format.tokenize(line)
+            if parts is not None and parts[3] == encoded:
+                yield line, parts
+
+    def context(self, record: Record, limit: int) -> List[str]:
+        """Up to `limit` lines of the record's request that precede it.
+
+        The record's own line is recognised by its timestamp and message;
+        records without a request ID have no context.
+        """
+        request_id = record["request_id"]
+        if not request_id:
+            return []
+        timestamp = f"[{timestamp_text(record['timestamp'])}]".encode("utf-8")
+        message = record["message"].encode("utf-8")
+        preceding: List[str] = []
+        for line, parts in self._entries(request_id):
+            if parts[0] == timestamp and parts[4] == message:
+                break
+            preceding.append(line.decode("utf-8", errors="replace"))
+        return preceding[-limit:]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,318 @@
+# File: rollups.py
+"""Time-bucketed error rollups, spike flags and latency percentiles.
+
+Everything here is filled in during the single parse pass and needs
+bounded memory: the hourly and per-minute breakdowns are windows of the
+most recent ROLLUP_HOURS and ROLLUP_MINUTES, spikes are found by a
+SpikeDetector fed minute totals in order, and latency values go into
+fixed-accuracy sketches instead of being kept.
+"""
+
+import json
+import math
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional, Tuple
+
+from timestamps import parse_timestamp
+
+# Length of the "YYYY-MM-DD HH" prefix of a minute used for hourly buckets.
+HOUR_PREFIX = 13
+
+# Most recent hours and minutes kept with a per-service and per-message
+# breakdown.
+ROLLUP_HOURS = 720
+ROLLUP_MINUTES = 1440
+
+# A minute is a spike when its errors exceed the mean of the previous
+# SPIKE_WINDOW minutes by SPIKE_FACTOR standard deviations. The deviation
+# is at least sqrt(mean), as for Poisson noise, so a flat baseline does not
+# flag every bump; quiet minutes and short histories are never flagged.
+SPIKE_WINDOW = 60
+SPIKE_FACTOR = 3.0
+SPIKE_MIN_ERRORS = 10
+SPIKE_MIN_HISTORY = 10
+
+# Metadata key whose values are summarised per service.
+LATENCY_FIELD = "latency_ms"
+PERCENTILES = (50, 90, 95, 99)
+
+# Quantiles are accurate to within this fraction of the true value.
+RELATIVE_ACCURACY = 0.01
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with logarithmic buckets.
+
+    A value v > 0 lands in bucket ceil(log(v) / log(gamma)), so every
+    bucket spans values within RELATIVE_ACCURACY of its midpoint; values up
+    to 10^9 need fewer than 1,100 buckets. Zero and negative values share
+    one bucket. Merging adds bucket counts, so per-chunk sketches combine
+    into exactly the sketch of the whole input.
+    """
+
+    __slots__ = ("buckets", "count", "min", "max")
+
+    _gamma = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    _log_gamma = math.log(_gamma)
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        bucket = math.ceil(math.log(value) / self._log_gamma) if value > 0 else None
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The approximate q-quantile (0 <= q <= 1), None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.buckets.get(None, 0)
+        if rank < seen:
+            return min(max(self.min, 0.0), self.max)
+        for bucket in sorted(b for b in self.buckets if b is not None):
+            seen += self.buckets[bucket]
+            if rank < seen:
+                value = 2 * self._gamma**bucket / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"count": self.count, "min": self.min}
+        for p in PERCENTILES:
+            summary[f"p{p}"] = round(self.quantile(p / 100), 2)
+        summary["max"] = self.max
+        return summary
+
+
+class LatencyStats:
+    """Per-service sketches of one numeric metadata key.
+
+    Filled by the scanner from every line carrying the key, whatever its
+    level, so the percentiles do not depend on --filter. The key is looked
+    for in the raw bytes first; only lines that have it are decoded.
+    """
+
+    __slots__ = ("field", "key", "sketches")
+
+    def __init__(self, field: str = LATENCY_FIELD):
+        self.field = field
+        self.key = json.dumps(field).encode("utf-8")
+        self.sketches: Dict[str, QuantileSketch] = {}
+
+    def observe(self, service: bytes, metadata: bytes) -> None:
+        """Add the key's value from a line's raw metadata, if it is a number."""
+        try:
+            value = json.loads(metadata).get(self.field)
+        except (ValueError, AttributeError):
+            return
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        name = service.decode("utf-8", errors="replace")
+        sketch = self.sketches.get(name)
+        if sketch is None:
+            sketch = self.sketches[name] = QuantileSketch()
+        sketch.add(value)
+
+    def merge(self, other: "LatencyStats") -> None:
+        for name, sketch in other.sketches.items():
+            target = self.sketches.get(name)
+            if target is None:
+                target = self.sketches[name] = QuantileSketch()
+            target.merge(sketch)
+
+    def empty(self) -> "LatencyStats":
+        """New, empty stats for the same key."""
+        return LatencyStats(self.field)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "field": self.field,
+            "services": {
+                name: self.sketches[name].summary() for name in sorted(self.sketches)
+            },
+        }
+
+
+class TimeRollups:
+    """Error counts per hour and per minute, by service and by message.
+
+    Buckets are keyed by their "YYYY-MM-DD HH:MM" minute (or "YYYY-MM-DD
+    HH" hour) and count (service, message) pairs. Hours beyond the most
+    recent `hours` and minutes beyond the most recent `minutes` are dropped
+    once twice as many have piled up, so memory stays bounded whatever the
+    span of the log, and late records only ever fall out of the view.
+    """
+
+    def __init__(self, minutes: int = ROLLUP_MINUTES, hours: int = ROLLUP_HOURS):
+        self.retention = minutes
+        self.hour_retention = hours
+        self.hours: Dict[str, Counter] = {}
+        self.minutes: Dict[str, Counter] = {}
+
+    def add(self, minute: str, service: str, message: str, count: int = 1) -> None:
+        key = (service, message)
+        hour = minute[:HOUR_PREFIX]
+        bucket = self.hours.get(hour)
+        if bucket is None:
+            bucket = self.hours[hour] = Counter()
+            if len(self.hours) > 2 * self.hour_retention:
+                _prune(self.hours, self.hour_retention)
+        bucket[key] += count
+
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = Counter()
+            if len(self.minutes) > 2 * self.retention:
+                _prune(self.minutes, self.retention)
+        bucket[key] += count
+
+    def merge(self, other: "TimeRollups") -> None:
+        for target, source in (
+            (self.hours, other.hours),
+            (self.minutes, other.minutes),
+        ):
+            for key, counts in source.items():
+                if key in target:
+                    target[key].update(counts)
+                else:
+                    target[key] = Counter(counts)
+        if len(self.hours) > 2 * self.hour_retention:
+            _prune(self.hours, self.hour_retention)
+        if len(self.minutes) > 2 * self.retention:
+            _prune(self.minutes, self.retention)
+
+    def summary(self, spikes: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """The `rollups` block, with `spikes` found on the exact minute
+        totals."""
+        hours = sorted(self.hours.items())[-self.hour_retention :]
+        minutes = sorted(self.minutes.items())[-self.retention :]
+        return {
+            "hours": [_bucket("hour", key, counts) for key, counts in hours],
+            "minutes": [_bucket("minute", key, counts) for key, counts in minutes],
+            "spikes": spikes,
+        }
+
+
+def _prune(buckets: Dict[str, Any], retention: int) -> None:
+    """Drop all but the latest `retention` keys."""
+    for key in sorted(buckets)[:-retention]:
+        del buckets[key]
+
+
+def _ranked(counts: Counter) -> Dict[str, int]:
+    """Counts from most to least frequent, ties by name, whatever the order
+    the engine happened to fill them in."""
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def _bucket(label: str, key: str, counts: Counter) -> Dict[str, Any]:
+    services: Counter = Counter()
+    messages: Counter = Counter()
+    for (service, message), count in counts.items():
+        services[service] += count
+        messages[message] += count
+    return {
+        label: key,
+        "errors": sum(counts.values()),
+        "services": _ranked(services),
+        "messages": _ranked(messages),
+    }
+
+
+def _minutes_between(earlier: str, later: str) -> int:
+    """Whole minutes from one minute key to the next; 1 if unparseable."""
+    first = parse_timestamp(earlier + ":00")
+    second = parse_timestamp(later + ":00")
+    if first is None or second is None:
+        return 1
+    return max((second - first) // 60, 1)
+
+
+class _Baseline:
+    """Ring buffer of the last `window` minute totals with running sums."""
+
+    def __init__(self, window: int):
+        self.counts: Deque[int] = deque()
+        self.window = window
+        self.total = 0
+        self.squares = 0
+
+    def push(self, count: int) -> None:
+        self.counts.append(count)
+        self.total += count
+        self.squares += count * count
+        if len(self.counts) > self.window:
+            dropped = self.counts.popleft()
+            self.total -= dropped
+            self.squares -= dropped * dropped
+
+    def threshold(self, factor: float) -> Tuple[float, float]:
+        """(mean, the count above which a minute is a spike)."""
+        size = len(self.counts)
+        mean = self.total / size
+        deviation = math.sqrt(max(self.squares / size - mean * mean, 0.0))
+        return mean, mean + factor * max(deviation, math.sqrt(mean), 1.0)
+
+
+class SpikeDetector:
+    """Flags minutes whose error count stands out from the minutes before
+    them.
+
+    Minute totals are fed in order, each minute once, and checked against
+    a baseline of the previous `window` totals, minutes without errors
+    counting as zero; each costs O(1) and only the baseline is kept.
+    """
+
+    def __init__(
+        self,
+        window: int = SPIKE_WINDOW,
+        factor: float = SPIKE_FACTOR,
+        min_errors: int = SPIKE_MIN_ERRORS,
+    ):
+        self.window = window
+        self.factor = factor
+        self.min_errors = min_errors
+        self.baseline = _Baseline(window)
+        self.spikes: List[Dict[str, Any]] = []
+        self.previous: Optional[str] = None
+
+    def add(self, minute: str, count: int) -> None:
+        if self.previous is not None:
+            for _ in range(
+                min(_minutes_between(self.previous, minute) - 1, self.window)
+            ):
+                self.baseline.push(0)
+        if len(self.baseline.counts) >= SPIKE_MIN_HISTORY and count >= self.min_errors:
+            mean, threshold = self.baseline.threshold(self.factor)
+            if count > threshold:
+                self.spikes.append(
+                    {"minute": minute, "errors": count, "baseline": round(mean, 2)}
+                )
+        self.baseline.push(count)
+        self.previous = minute
+
+
+def find_spikes(
+    minute_counts: Mapping[str, int],
+    window: int = SPIKE_WINDOW,
+    factor: float = SPIKE_FACTOR,
+    min_errors: int = SPIKE_MIN_ERRORS,
+) -> List[Dict[str, Any]]:
+    """The spikes a SpikeDetector flags in `minute_counts`."""
+    detector = SpikeDetector(window, factor, min_errors)
+    for minute in sorted(minute_counts):
+        detector.add(minute, minute_counts[minute])
+    return detector.spikes
@@ -0,0 +1,381 @@
+# File: service.py
+"""Long-running HTTP service around the parser.
+
+Log lines arrive as POSTed batches or by following files; they are parsed
+in a process pool and folded into in-memory aggregates, so queries never
+re-scan anything:
+
+    python service.py --follow server.log --port 8000
+    curl --data-binary @more.log localhost:8000/ingest
+    curl 'localhost:8000/errors?service=payment-service&since=2024-05-01'
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Literal, Optional, Sequence, Tuple
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request
+
+from aggregate import ENGINES, ErrorStats
+from async_parser import parse_batches
+from checkpoint import Checkpoint
+from decompress import DecompressionError, file_compression
+from filters import FilterError
+from log_formats import AUTO_FORMAT, DETECT_SIZE, LOG_FORMATS, detect_format, get_format
+from parser import (
+    DEFAULT_FILTER,
+    ScanStats,
+    compiled_filter,
+    complete_lines_end,
+    iter_errors,
+    normalize_timestamp,
+    positive_int,
+)
+from records import ErrorBatch, as_dict
+from timestamps import parse_timestamp
+
+# Error records kept for /errors; the oldest batches are dropped beyond this.
+# The aggregates behind /summary and /top always cover everything ingested.
+DEFAULT_MAX_RECORDS = 1_000_000
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ERRORS_LIMIT = 100
+DEFAULT_TOP = 10
+
+# /top/{field} -> the ErrorStats counter it reads.
+TOP_FIELDS = {
+    "messages": "message_counts",
+    "users": "user_counts",
+    "services": "service_counts",
+    "minutes": "minute_counts",
+}
+
+
+def _parse_batch(
+    data: bytes, filter_expr: str, log_format: str = AUTO_FORMAT
+) -> Tuple[ErrorBatch, ScanStats]:
+    """Worker entry point: parse one POSTed batch of log lines.
+
+    A batch is taken as whole lines; a missing final newline is implied.
+    Lines are read as the named `log_format`, by default the format that
+    parses most of the batch's first DETECT_SIZE bytes, as for a file.
+    """
+    if data.endswith(b"\n"):
+        data = data[:-1]
+    stats = ScanStats()
+    lines = data.split(b"\n") if data else []
+    if log_format == AUTO_FORMAT:
+        line_format = detect_format(data[:DETECT_SIZE].split(b"\n"))
+    else:
+        line_format = get_format(log_format)
+    batch = ErrorBatch.from_records(
+        iter_errors(
+            lines, stats=stats, filter_expr=filter_expr, line_format=line_format
+        )
+    )
+    return batch, stats
+
+
+class LogStore:
+    """Records and running aggregates of everything the service ingested.
+
+    Only the event loop touches a store, one batch at a time, so queries
+    always see whole batches and need no locking.
+    """
+
+    def __init__(self, max_records: int = DEFAULT_MAX_RECORDS, engine: str = "auto"):
+        self.max_records = max_records
+        self.engine = engine
+        self.stats = ErrorStats()
+        self.scan = ScanStats()
+        # (batch, first and last epoch seconds or None) in arrival order.
+        self.batches: Deque[Tuple[ErrorBatch, Optional[Tuple[int, int]]]] = deque()
+        self.retained = 0
+        # Followed path -> why its last poll failed, until one succeeds.
+        self.follow_errors: Dict[str, str] = {}
+
+    def add(self, batch: ErrorBatch, stats: Optional[ScanStats] = None) -> None:
+        """Fold a parsed batch (and its line counters) into the aggregates
+        and keep its records."""
+        if stats is not None:
+            self.scan.merge(stats)
+        if not len(batch):
+            return
+        self.stats.add_batch(batch, self.engine)
+        self.batches.append((batch, batch.timestamp_range()))
+        self.retained += len(batch)
+        while self.retained > self.max_records and len(self.batches) > 1:
+            self.retained -= len(self.batches.popleft()[0])
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total_lines": self.scan.total_lines,
+            "malformed_lines": self.scan.malformed_lines,
+            **self.stats.summary(),
+            "errors_by_service": dict(self.stats.service_counts.most_common()),
+            "peak_minute": self.stats.peak_minute(),
+            "retained_errors": self.retained,
+            "follow_errors": dict(self.follow_errors),
+        }
+
+    def errors(
+        self,
+        service: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = DEFAULT_ERRORS_LIMIT,
+    ) -> List[Dict[str, Any]]:
+        """The first `limit` retained records matching all given conditions.
+
+        `since` and `until` are TIMESTAMP_FORMAT text; records whose
+        timestamp did not decode match no time window. Batches whose
+        service table or timestamp range rules them out are skipped
+        without looking at their records.
+        """
+        found: List[Dict[str, Any]] = []
+        start = None if since is None else parse_timestamp(since)
+        end = None if until is None else parse_timestamp(until)
+        windowed = start is not None or end is not None
+        for batch, span in self.batches:
+            if windowed and (
+                span is None
+                or (start is not None and span[1] < start)
+                or (end is not None and span[0] > end)
+            ):
+                continue
+            if service is not None and service not in batch.tables["service"]:
+                continue
+            for record in batch:
+                if (
+                    (service is None or record.service == service)
+                    and not (windowed and isinstance(record.timestamp, str))
+                    and (start is None or record.timestamp >= start)
+                    and (end is None or record.timestamp <= end)
+                ):
+                    found.append(as_dict(record))
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def top(self, field: str, n: int = DEFAULT_TOP) -> List[Dict[str, Any]]:
+        counts = getattr(self.stats, TOP_FIELDS[field])
+        return [
+            {"value": value, "count": count} for value, count in counts.most_common(n)
+        ]
+
+
+async def follow_file(
+    path: str,
+    store: LogStore,
+    pool: Executor,
+    filter_expr: str = DEFAULT_FILTER,
+    interval: float = 5.0,
+    workers: int = 1,
+) -> None:
+    """Parse `path` and then every complete line appended to it, forever.
+
+    The position is an in-memory Checkpoint, so a rotated or truncated file
+    is read again from the start. A large backlog is split into chunks that
+    the pool's `workers` parse in parallel, with only a few chunks parsed
+    ahead of the store, so memory stays bounded however large it is.
+
+    A poll that cannot read the file (missing, unreadable, corrupt) is
+    retried at the next interval; the error is logged once and shown in
+    the store's `follow_errors` until a poll succeeds.
+    """
+    checkpoint = Checkpoint()
+    while True:
+        try:
+            start = checkpoint.resume_offset(path)
+            end = await asyncio.to_thread(complete_lines_end, path, start)
+            if end > start:
+                stats = ScanStats()
+                async for batch in parse_batches(
+                    path,
+                    workers,
+                    filter_expr=filter_expr,
+                    stats=stats,
+                    executor=pool,
+                    start=start,
+                    end=end,
+                ):
+                    store.add(batch)
+                store.scan.merge(stats)
+            checkpoint.advance(path, end, 0, 0)
+            store.follow_errors.pop(path, None)
+        except (OSError, DecompressionError) as exc:
+            # e.g. between a rotation and the new file appearing.
+            error = str(exc)
+            if store.follow_errors.get(path) != error:
+                logger.warning("Cannot follow %s: %s", path, error)
+            store.follow_errors[path] = error
+        await asyncio.sleep(interval)
+
+
+def _timestamp(value: Optional[str], end_of_day: bool) -> Optional[str]:
+    if value is None:
+        return None
+    try:
+        return normalize_timestamp(value, end_of_day)
+    except argparse.ArgumentTypeError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from None
+
+
+def create_app(
+    follow: Sequence[str] = (),
+    filter_expr: str = DEFAULT_FILTER,
+    workers: int = 1,
+    interval: float = 5.0,
+    max_records: int = DEFAULT_MAX_RECORDS,
+    engine: str = "auto",
+) -> FastAPI:
+    """Build the service app; `uvicorn --factory service:create_app` works too.
+
+    Raises FilterError for an invalid `filter_expr`.
+    """
+    compiled_filter(filter_expr)
+    store = LogStore(max_records, engine)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # The server runs threads, which fork() does not copy safely.
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            app.state.pool = pool
+            tasks = [
+                asyncio.create_task(
+                    follow_file(path, store, pool, filter_expr, interval, workers)
+                )
+                for path in follow
+            ]
+            try:
+                yield
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    app = FastAPI(title="Log parser service", lifespan=lifespan)
+    app.state.store = store
+
+    @app.post("/ingest")
+    async def ingest(
+        request: Request, log_format: str = Query(AUTO_FORMAT, alias="format")
+    ) -> Dict[str, int]:
+        """Parse a batch of raw log lines (the request body) off the event
+        loop; `format` names their layout, as for --log-format."""
+        if log_format != AUTO_FORMAT and log_format not in LOG_FORMATS:
+            raise HTTPException(
+                status_code=422, detail=f"unknown log format: {log_format!r}"
+            )
+        data = await request.body()
+        loop = asyncio.get_running_loop()
+        batch, stats = await loop.run_in_executor(
+            app.state.pool, _parse_batch, data, filter_expr, log_format
+        )
+        store.add(batch, stats)
+        return {
+            "lines": stats.total_lines,
+            "malformed_lines": stats.malformed_lines,
+            "errors": len(batch),
+        }
+
+    @app.get("/summary")
+    async def summary() -> Dict[str, Any]:
+        return store.summary()
+
+    @app.get("/errors")
+    async def errors(
+        service: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = Query(DEFAULT_ERRORS_LIMIT, ge=1),
+    ) -> List[Dict[str, Any]]:
+        """Retained records, oldest first; dates as for --start/--end-date."""
+        return store.errors(
+            service, _timestamp(since, False), _timestamp(until, True), limit
+        )
+
+    @app.get("/top/{field}")
+    async def top(
+        field: Literal["messages", "users", "services", "minutes"],
+        n: int = Query(DEFAULT_TOP, ge=1),
+    ) -> List[Dict[str, Any]]:
+        return store.top(field, n)
+
+    return app
+
+
+def parse_arguments(args: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Serve error summaries and queries over HTTP."
+    )
+    parser.add_argument(
+        "--follow",
+        action="append",
+        default=[],
+        help="Log file to parse and keep following; repeatable.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        default=1,
+        help="Parser worker processes (default: 1).",
+    )
+    parser.add_argument(
+        "--filter",
+        dest="filter_expr",
+        default=DEFAULT_FILTER,
+        help="Lines to keep, as for parser.py (default: 'level == ERROR').",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between polls of followed files (default: 5).",
+    )
+    parser.add_argument(
+        "--max-records",
+        type=positive_int,
+        default=DEFAULT_MAX_RECORDS,
+        help="Error records kept for /errors (default: 1000000).",
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="auto")
+
+    parsed = parser.parse_args(args)
+    try:
+        compiled_filter(parsed.filter_expr)
+    except FilterError as exc:
+        parser.error(f"--filter: {exc}")
+    for path in parsed.follow:
+        if file_compression(path):
+            parser.error(f"--follow needs an uncompressed log file: {path}")
+    return parsed
+
+
+def main():
+    args = parse_arguments()
+    app = create_app(
+        args.follow,
+        args.filter_expr,
+        args.workers,
+        args.interval,
+        args.max_records,
+        args.engine,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# File: sketches.py
+"""Fixed-size, mergeable sketches behind --approx.
+
+HyperLogLog estimates the number of distinct users and Misra-Gries
+summaries keep the heavy-hitter messages and users. Both take the same
+memory however many values go in, and merging two sketches gives the
+sketch of the combined input, so worker, batch and file results combine
+without recounting.
+"""
+
+import hashlib
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Default relative error of --approx.
+DEFAULT_ERROR = 0.01
+
+# Heavy hitters listed in the report summary.
+APPROX_TOP = 10
+
+# HyperLogLog precision bounds: 16 to 262,144 one-byte registers.
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def stable_hash(value: Any) -> int:
+    """64-bit hash of a value that, unlike hash(), is the same in every
+    process, so sketches built in workers can be merged."""
+    digest = hashlib.blake2b(repr(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """Distinct-count estimate with a standard error of 1.04 / sqrt(2^p).
+
+    Each value's hash picks a register by its top `precision` bits and
+    stores the longest run of leading zeros seen in the remaining bits.
+    Small counts fall back to linear counting, which is close to exact.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = 14):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(
+                f"precision must be {MIN_PRECISION}-{MAX_PRECISION}, got {precision}"
+            )
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @classmethod
+    def for_error(cls, error: float) -> "HyperLogLog":
+        """The smallest sketch whose standard error is at most `error`."""
+        precision = math.ceil(math.log2((1.04 / error) ** 2))
+        return cls(min(max(precision, MIN_PRECISION), MAX_PRECISION))
+
+    def add(self, value: Any) -> None:
+        hashed = stable_hash(value)
+        width = 64 - self.precision
+        index = hashed >> width
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[Any]) -> None:
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+class HeavyHitters:
+    """Misra-Gries summary of the most frequent values in `capacity` counters.
+
+    Counts are lower bounds: a value's true count is at most its count
+    plus `error`, and `error` never exceeds total / (capacity + 1), so any
+    value making up more than that share of the input is kept. Updates
+    take exact counts of a batch of values; merging adds the counters and
+    then trims them back to `capacity`, as in Agarwal et al.'s mergeable
+    summaries.
+    """
+
+    __slots__ = ("capacity", "counts", "error")
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Counter = Counter()
+        self.error = 0
+
+    @classmethod
+    def for_error(cls, error: float) -> "HeavyHitters":
+        """A summary whose counts are off by at most `error` times the total."""
+        return cls(math.ceil(1 / error))
+
+    def update(self, counts: Mapping[Any, int]) -> None:
+        self.counts.update(counts)
+        if len(self.counts) > self.capacity:
+            cut = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = Counter(
+                {
+                    value: count - cut
+                    for value, count in self.counts.items()
+                    if count > cut
+                }
+            )
+            self.error += cut
+
+    def merge(self, other: "HeavyHitters") -> None:
+        self.error += other.error
+        self.update(other.counts)
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Any, int]]:
+        return self.counts.most_common(n)
+
+
+class ApproxStats:
+    """The --approx counterparts of the exact user and message counters."""
+
+    __slots__ = ("error", "users", "top_messages", "top_users")
+
+    def __init__(self, error: float = DEFAULT_ERROR):
+        self.error = error
+        self.users = HyperLogLog.for_error(error)
+        self.top_messages = HeavyHitters.for_error(error)
+        self.top_users = HeavyHitters.for_error(error)
+
+    def update(self, messages: Mapping[Any, int], users: Mapping[Any, int]) -> None:
+        """Fold in exact per-value counts of a batch of errors."""
+        self.users.update(users)
+        self.top_messages.update(messages)
+        self.top_users.update(users)
+
+    def merge(self, other: "ApproxStats") -> None:
+        self.users.merge(other.users)
+        self.top_messages.merge(other.top_messages)
+        self.top_users.merge(other.top_users)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "error": self.error,
+            "top_messages": [
+                {"message": message, "count": count}
+                for message, count in self.top_messages.most_common(APPROX_TOP)
+            ],
+            "top_users": [
+                {"user_id": user, "count": count}
+                for user, count in self.top_users.most_common(APPROX_TOP)
+            ],
+            "count_error": {
+                "messages": self.top_messages.error,
+                "users": self.top_users.error,
+            },
+        }
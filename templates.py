@@ -0,0 +1,194 @@
+# File: templates.py
+"""Streaming message templates behind --templates.
+
+Messages that embed IDs or amounts ("Payment 8812 failed for $12.50") are
+grouped into templates ("Payment <*> failed for <*>") with a Drain-style
+prefix tree (He et al., "Drain: An Online Log Parsing Approach with Fixed
+Depth Tree"). A message is split on whitespace; the tree picks a leaf by
+its token count and first tokens, and the message joins the most similar
+template in that leaf, which forgets the tokens they disagree on, or
+starts a new one. Tokens with digits are first masked as wildcards, so a
+new ID or amount neither opens a new branch nor counts as a difference.
+
+Each message costs a bounded walk, and a message seen recently is found
+in an LRU cache without tokenising it again. Memory grows with the number
+of templates, not with the number of distinct messages.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+# The token a template has where its messages differ.
+WILDCARD = "<*>"
+
+# Tree levels: the token count, then the first DEPTH - 2 tokens.
+DEPTH = 4
+
+# Share of tokens a message must have in common with a template to join it.
+SIMILARITY = 0.5
+
+# Branches per tree node; further tokens share the wildcard branch.
+MAX_CHILDREN = 100
+
+# Distinct messages remembered with their template.
+CACHE_SIZE = 10000
+
+# Messages kept per template for its example parameters.
+MAX_EXAMPLES = 3
+
+# Templates listed in the report summary.
+TEMPLATE_TOP = 10
+
+
+# Whether a token looks like an ID, number or amount: it has a digit.
+_is_variable = re.compile(r"\d").search
+
+
+class Template:
+    """A group of messages: their shared tokens, with WILDCARD elsewhere."""
+
+    __slots__ = ("tokens", "count", "examples")
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = list(tokens)
+        self.count = 0
+        self.examples: List[str] = []
+
+    def __str__(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> float:
+        """Share of positions where the (masked) tokens are the same."""
+        same = sum(1 for mine, theirs in zip(self.tokens, tokens) if mine == theirs)
+        return same / len(tokens) if tokens else 1.0
+
+    def absorb(self, tokens: List[str]) -> None:
+        """Turn the positions where `tokens` differ into wildcards."""
+        for i, token in enumerate(tokens):
+            if self.tokens[i] != token:
+                self.tokens[i] = WILDCARD
+
+    def parameters(self, message: str) -> List[str]:
+        """The tokens of a message at this template's wildcards."""
+        return [
+            token
+            for mine, token in zip(self.tokens, message.split())
+            if mine == WILDCARD
+        ]
+
+
+class TemplateMiner:
+    """Message counts grouped into templates, mined as messages arrive.
+
+    `add` and `update` take messages with their counts in any batch size,
+    and `merge` folds in a miner fed separately; merged templates may stay
+    apart when the two miners generalised them differently.
+    """
+
+    def __init__(
+        self,
+        similarity: float = SIMILARITY,
+        depth: int = DEPTH,
+        cache_size: int = CACHE_SIZE,
+    ):
+        self.similarity = similarity
+        self.depth = depth
+        self.cache_size = cache_size
+        self.templates: List[Template] = []
+        self._root: Dict[Any, Any] = {}
+        self._cache: "OrderedDict[str, Template]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def __iter__(self) -> Iterator[Template]:
+        return iter(self.templates)
+
+    def add(self, message: str, count: int = 1) -> Template:
+        """Count a message under its template and return the template."""
+        template = self._cache.get(message)
+        if template is not None:
+            self._cache.move_to_end(message)
+        else:
+            tokens = [
+                WILDCARD if _is_variable(token) else token for token in message.split()
+            ]
+            template = self._match(tokens, [message])
+            self._cache[message] = template
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        template.count += count
+        return template
+
+    def update(self, counts: Mapping[str, int]) -> None:
+        """Fold in exact per-message counts of a batch of errors."""
+        for message, count in counts.items():
+            self.add(message, count)
+
+    def merge(self, other: "TemplateMiner") -> None:
+        for theirs in other.templates:
+            template = self._match(theirs.tokens, theirs.examples)
+            template.count += theirs.count
+
+    def most_common(self, n: Optional[int] = None) -> List[Template]:
+        """Templates from most to least frequent, first seen first on ties."""
+        ranked = sorted(self.templates, key=lambda t: -t.count)
+        return ranked if n is None else ranked[:n]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "distinct": len(self.templates),
+            "top": [
+                {
+                    "template": str(template),
+                    "count": template.count,
+                    "examples": [
+                        template.parameters(message)
+                        for message in template.examples
+                        if WILDCARD in template.tokens
+                    ],
+                }
+                for template in self.most_common(TEMPLATE_TOP)
+            ],
+        }
+
+    def _match(self, tokens: List[str], examples: List[str]) -> Template:
+        """The template for masked `tokens`, absorbing them or newly created."""
+        leaf = self._leaf(tokens)
+        best, best_similarity = None, -1.0
+        for template in leaf:
+            similarity = template.similarity(tokens)
+            if similarity > best_similarity:
+                best, best_similarity = template, similarity
+        if best is None or best_similarity < self.similarity:
+            best = Template(tokens)
+            leaf.append(best)
+            self.templates.append(best)
+        else:
+            best.absorb(tokens)
+        for message in examples:
+            if len(best.examples) >= MAX_EXAMPLES:
+                break
+            if message not in best.examples:
+                best.examples.append(message)
+        return best
+
+    def _leaf(self, tokens: List[str]) -> List[Template]:
+        """The templates of the tree leaf a message's tokens lead to."""
+        node = self._root.get(len(tokens))
+        if node is None:
+            node = self._root[len(tokens)] = {}
+        for token in tokens[: self.depth - 2]:
+            child = node.get(token)
+            if child is None:
+                if len(node) >= MAX_CHILDREN:
+                    token = WILDCARD
+                child = node.get(token)
+                if child is None:
+                    child = node[token] = {}
+            node = child
+        leaf = node.get(None)
+        if leaf is None:
+            leaf = node[None] = []
+        return leaf
@@ -0,0 +1,193 @@
+import pytest
+
+import aggregate
+from aggregate import ErrorStats, aggregate_numpy, resolve_engine
+from records import ErrorBatch, ErrorRecord
+from rollups import TimeRollups
+from sketches import ApproxStats
+from templates import TemplateMiner
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def records():
+    """Returns error records with ties, odd user IDs and two minutes."""
+    return [
+        ErrorRecord("2024-01-01 10:00:01", "S1", "Err B", 1),
+        ErrorRecord("2024-01-01 10:00:02", "S2", "Err A", None),
+        ErrorRecord("2024-01-01 10:00:02", "S1", "Err A", True),
+        ErrorRecord("2024-01-01 10:01:00", "S3", "Err B", "u-1"),
+        ErrorRecord("2024-01-01 10:01:30", "S2", "Err C", [1, 2]),
+        ErrorRecord("2024-01-01 10:01:59", "S1", "Err A", 1),
+    ]
+
+
+def _python_stats(records):
+    stats = ErrorStats()
+    for record in records:
+        stats.add(record)
+    return stats
+
+
+def _as_lists(stats):
+    return (
+        stats.total_errors,
+        stats.message_counts.most_common(),
+        list(stats.user_counts.items()),
+        stats.service_counts.most_common(),
+        list(stats.minute_counts.items()),
+    )
+
+
+# --- TEST: ErrorStats ---
+
+
+def test_python_stats_counts(records):
+    """Test the per-record engine's counters and summary."""
+    stats = _python_stats(records)
+
+    assert stats.message_counts == {"Err A": 3, "Err B": 2, "Err C": 1}
+    assert stats.user_counts == {1: 3, "u-1": 1, "[1, 2]": 1}
+    assert stats.service_counts == {"S1": 3, "S2": 2, "S3": 1}
+    assert stats.minute_counts == {"2024-01-01 10:00": 3, "2024-01-01 10:01": 3}
+    assert stats.summary() == {"total_errors": 6, "unique_affected_users": 3}
+    assert stats.peak_minute() == {"minute": "2024-01-01 10:00", "errors": 3}
+
+
+def test_peak_minute_without_errors():
+    """Test that empty statistics have no peak minute."""
+    assert ErrorStats().peak_minute() is None
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python", None])
+def test_minute_counts_keep_a_window(monkeypatch, engine):
+    """Test that old minutes are retired without changing the peak or spikes."""
+    counts = [2 + i % 3 for i in range(60)]
+    counts[15], counts[40] = 50, 30
+    records = [
+        ErrorRecord(f"2024-01-01 {10 + i // 60:02d}:{i % 60:02d}:00", "S1", "E", 1)
+        for i, count in enumerate(counts)
+        for _ in range(count)
+    ]
+    expected = ErrorStats()
+    for record in records:
+        expected.add(record)
+
+    monkeypatch.setattr(aggregate, "MINUTE_RETENTION", 5)
+    stats = ErrorStats()
+    if engine is None:
+        for record in records:
+            stats.add(record)
+    else:
+        for start in range(0, len(records), 40):
+            stats.add_batch(
+                ErrorBatch.from_records(records[start : start + 40]), engine
+            )
+
+    assert len(stats.minute_counts) <= 10
+    assert stats.peak_minute() == expected.peak_minute()
+    assert stats.peak_minute() == {"minute": "2024-01-01 10:15", "errors": 50}
+    assert stats.spikes() == expected.spikes()
+    assert [spike["minute"] for spike in stats.spikes()] == [
+        "2024-01-01 10:15",
+        "2024-01-01 10:40",
+    ]
+
+
+# --- TEST: numpy engine ---
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_engines_match_per_record_counts(records, engine):
+    """Test that both batch engines match per-record counting, ties included."""
+    stats = ErrorStats()
+    stats.add_batch(ErrorBatch.from_records(records), engine)
+
+    assert _as_lists(stats) == _as_lists(_python_stats(records))
+
+
+def test_numpy_engine_merges_batches(records):
+    """Test that statistics merged batch by batch match a single pass."""
+    stats = ErrorStats()
+    for start in range(0, len(records), 4):
+        stats.merge(
+            aggregate_numpy(ErrorBatch.from_records(records[start : start + 4]))
+        )
+
+    assert _as_lists(stats) == _as_lists(_python_stats(records))
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_engines_match_rollups(records, engine):
+    """Test that both batch engines fill the same rollups as per-record counting."""
+    expected = ErrorStats()
+    expected.rollups = TimeRollups()
+    for record in records:
+        expected.add(record)
+    stats = ErrorStats()
+    stats.rollups = TimeRollups()
+    stats.add_batch(ErrorBatch.from_records(records), engine)
+
+    assert stats.summary() == expected.summary()
+    hours = stats.summary()["rollups"]["hours"]
+    assert hours == [
+        {
+            "hour": "2024-01-01 10",
+            "errors": 6,
+            "services": {"S1": 3, "S2": 2, "S3": 1},
+            "messages": {"Err A": 3, "Err B": 2, "Err C": 1},
+        }
+    ]
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_approx_stats_bounded_buffer(records, engine, monkeypatch):
+    """Test that --approx folds counts into sketches and matches across engines."""
+    monkeypatch.setattr(aggregate, "APPROX_BUFFER", 4)
+    expected = ErrorStats()
+    expected.approx = ApproxStats()
+    for record in records:
+        expected.add(record)
+        assert sum(expected.user_counts.values()) < 4
+    stats = ErrorStats()
+    stats.approx = ApproxStats()
+    stats.add_batch(ErrorBatch.from_records(records), engine)
+
+    summary = stats.summary()
+    assert summary == expected.summary()
+    assert summary["unique_affected_users"] == 3
+    assert summary["approximate"]["top_messages"][0] == {"message": "Err A", "count": 3}
+    assert stats.top_users()[0] == (1, 3)
+
+
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_templates_replace_message_counts(records, engine):
+    """Test that --templates counts messages by template on both engines."""
+    expected = ErrorStats()
+    expected.templates = TemplateMiner()
+    for record in records:
+        expected.add(record)
+    stats = ErrorStats()
+    stats.templates = TemplateMiner()
+    stats.add_batch(ErrorBatch.from_records(records), engine)
+
+    assert not stats.message_counts
+    assert stats.summary() == expected.summary()
+    assert stats.top_messages() == [("Err A", 3), ("Err B", 2), ("Err C", 1)]
+    assert stats.summary()["templates"]["distinct"] == 3
+
+
+def test_numpy_engine_empty_batch():
+    """Test that an empty batch yields empty statistics."""
+    stats = aggregate_numpy(ErrorBatch())
+
+    assert stats.total_errors == 0
+    assert not stats.message_counts and not stats.minute_counts
+
+
+def test_resolve_engine():
+    """Test that auto picks numpy when it is installed."""
+    assert resolve_engine("auto") == "numpy"
+    assert resolve_engine("python") == "python"
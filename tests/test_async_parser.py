@@ -0,0 +1,123 @@
+import asyncio
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import async_parser
+from async_parser import parse_batches, parse_stream, write_report_async
+from decompress import DecompressionError
+from parser import ScanStats, iter_log_file, write_report
+
+
+def _log_lines(count):
+    return [
+        f"[2024-05-01 10:{i // 60:02d}:{i % 60:02d}] | "
+        f"{'ERROR' if i % 2 else 'INFO'} | [payment] | r{i} | Failure {i % 5} | "
+        f'{{"user_id": {i % 7}}}'
+        for i in range(count)
+    ] + ["garbage"]
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "server.log"
+    path.write_text("\n".join(_log_lines(200)) + "\n", encoding="utf-8")
+    return str(path)
+
+
+async def _collect(records):
+    return [record async for record in records]
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """A thread pool that records how many calls were ever submitted."""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+# --- TEST: parse_stream ---
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_parse_stream_matches_iter_log_file(log_file, monkeypatch, workers):
+    """Test that records and counters match a synchronous parse."""
+    monkeypatch.setattr(async_parser, "MAX_CHUNK_SIZE", 2048)
+    expected_stats = ScanStats()
+    expected = list(iter_log_file(log_file, stats=expected_stats))
+
+    stats = ScanStats()
+    records = asyncio.run(_collect(parse_stream(log_file, workers, stats=stats)))
+    assert records == expected
+    assert (stats.total_lines, stats.malformed_lines) == (201, 1)
+
+
+def test_parse_stream_compressed_on_thread(tmp_path):
+    """Test that compressed input streams through the reader thread."""
+    path = tmp_path / "server.log.gz"
+    path.write_bytes(gzip.compress(("\n".join(_log_lines(50)) + "\n").encode()))
+    stats = ScanStats()
+    records = asyncio.run(_collect(parse_stream(str(path), stats=stats)))
+    assert len(records) == 25
+    assert stats.total_lines == 51
+
+    path.write_bytes(gzip.compress(b"x" * 100)[:-10])
+    with pytest.raises(DecompressionError):
+        asyncio.run(_collect(parse_stream(str(path))))
+
+
+def test_parse_stream_missing_file(tmp_path):
+    """Test that a missing file raises FileNotFoundError."""
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(_collect(parse_stream(str(tmp_path / "missing.log"))))
+
+
+def test_parse_batches_back_pressure(log_file, monkeypatch):
+    """Test that no more than max_pending chunks run ahead of the consumer."""
+    monkeypatch.setattr(async_parser, "MAX_CHUNK_SIZE", 1024)
+
+    async def consume(executor):
+        seen = []
+        batches = parse_batches(log_file, executor=executor, max_pending=2)
+        async for _ in batches:
+            seen.append(executor.submitted)
+            await asyncio.sleep(0.01)
+        return seen
+
+    with CountingExecutor() as executor:
+        seen = asyncio.run(consume(executor))
+    assert len(seen) > 4
+    assert all(submitted <= i + 3 for i, submitted in enumerate(seen))
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_parse_stream_stops_early(tmp_path):
+    """Test that leaving the loop early releases the reader thread."""
+    path = tmp_path / "server.log.gz"
+    path.write_bytes(gzip.compress(("\n".join(_log_lines(500)) + "\n").encode()))
+
+    async def first():
+        async for record in parse_stream(str(path), max_pending=1):
+            return record
+
+    assert asyncio.run(first()).message == "Failure 1"
+
+
+def test_write_report_async(log_file, tmp_path):
+    """Test that the async writer produces the synchronous report."""
+    expected = tmp_path / "expected.json"
+    write_report(iter_log_file(log_file), str(expected))
+
+    output = tmp_path / "report.json"
+    writer = asyncio.run(write_report_async(parse_batches(log_file), str(output)))
+    assert writer.total_errors == 100
+    assert json.loads(output.read_text(encoding="utf-8")) == json.loads(
+        expected.read_text(encoding="utf-8")
+    )
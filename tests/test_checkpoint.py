@@ -0,0 +1,213 @@
+import json
+import os
+import sys
+
+import pytest
+
+import parser as parser_module
+from checkpoint import Checkpoint
+from parser import main, process_log_file
+from writers import iter_report_errors
+
+
+def _error_line(n):
+    return (
+        f"[2024-05-01 10:00:{n % 60:02d}] | ERROR | [payment-service] | "
+        f'req-{n} | Failure {n} | {{"user_id": {n}}}\n'
+    )
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Returns a log file with three complete ERROR lines."""
+    path = tmp_path / "server.log"
+    path.write_text("".join(_error_line(n) for n in range(3)), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def checkpoint_path(tmp_path):
+    return str(tmp_path / "report.json.ckpt")
+
+
+def _messages(errors):
+    return [e["message"] for e in errors]
+
+
+# --- TEST: process_log_file with a checkpoint ---
+
+
+def test_resume_parses_only_appended_lines(log_file, checkpoint_path):
+    """Test that a second run only sees lines written after the first."""
+    first = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+    assert _messages(first) == ["Failure 0", "Failure 1", "Failure 2"]
+
+    assert process_log_file(str(log_file), checkpoint_path=checkpoint_path) == []
+
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(_error_line(3))
+    again = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    assert _messages(again) == ["Failure 3"]
+    checkpoint = Checkpoint.load(checkpoint_path)
+    assert checkpoint.offset == os.path.getsize(log_file)
+    assert checkpoint.total_lines == 4
+
+
+def test_resume_waits_for_partial_line(log_file, checkpoint_path):
+    """Test that a line without its newline is parsed once it is complete."""
+    line = _error_line(3)
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(line[:20])
+
+    first = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+    assert len(first) == 3
+
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(line[20:])
+    second = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    assert _messages(second) == ["Failure 3"]
+
+
+def test_resume_detects_truncation(log_file, checkpoint_path):
+    """Test that a truncated (copytruncate-style) file is re-read from 0."""
+    process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    log_file.write_text(_error_line(7), encoding="utf-8")
+    errors = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    assert _messages(errors) == ["Failure 7"]
+
+
+def test_resume_detects_rewrite_of_same_length(log_file, checkpoint_path):
+    """Test that a file regrown past the old offset with new content restarts."""
+    process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    with open(log_file, "r+", encoding="utf-8") as f:
+        f.write("".join(_error_line(n) for n in range(10, 14)))
+    errors = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    assert len(errors) == 4
+
+
+def test_resume_detects_rotation(log_file, checkpoint_path, tmp_path):
+    """Test that a rotated file (new inode) is parsed from the beginning."""
+    process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+
+    keep_inode_alive = open(log_file, "rb")
+    os.rename(log_file, tmp_path / "server.log.1")
+    log_file.write_text(
+        "".join(_error_line(n) for n in range(20, 25)), encoding="utf-8"
+    )
+    errors = process_log_file(str(log_file), checkpoint_path=checkpoint_path)
+    keep_inode_alive.close()
+
+    assert _messages(errors) == [f"Failure {n}" for n in range(20, 25)]
+
+
+# --- TEST: main with --resume ---
+
+
+def test_main_resume_merges_into_report(log_file, tmp_path, monkeypatch):
+    """Test that --resume appends new errors to the existing report."""
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output), "--resume"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    main()
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(_error_line(3))
+    main()
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert report["summary"] == {"total_errors": 4, "unique_affected_users": 4}
+    assert _messages(report["errors"]) == [f"Failure {n}" for n in range(4)]
+    assert os.path.exists(f"{output}.ckpt")
+
+
+def test_main_resume_keeps_line_aggregates(log_file, tmp_path, monkeypatch):
+    """Test that line counts and latency percentiles cover the lines of
+    earlier runs too, as the errors do."""
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output), "--resume"]
+    monkeypatch.setattr(sys, "argv", argv + ["--line-counts", "--rollups"])
+    info_line = (
+        "[2024-05-01 10:01:00] | INFO | [payment-service] | req-4 | Ok | "
+        '{"latency_ms": 12}\n'
+    )
+
+    for appended in (info_line, _error_line(3) + info_line):
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(appended)
+        main()
+
+    summary = json.loads(output.read_text(encoding="utf-8"))["summary"]
+    assert summary["total_errors"] == 4
+    assert summary["lines_by_level"] == {"ERROR": 4, "INFO": 2}
+    assert summary["lines_by_service"] == {"payment-service": 6}
+    assert summary["latency"]["services"]["payment-service"]["count"] == 2
+
+
+def test_main_resume_keeps_checkpoint_on_failed_write(log_file, tmp_path, monkeypatch):
+    """Test that a report that fails to be written leaves the checkpoint
+    behind, so the next run parses the new lines again."""
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output), "--resume"]
+    monkeypatch.setattr(sys, "argv", argv)
+    main()
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(_error_line(3))
+
+    def fail(records, *args, **kwargs):
+        list(records)
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(parser_module, "write_report", fail)
+        with pytest.raises(OSError):
+            main()
+    main()
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert _messages(report["errors"]) == [f"Failure {n}" for n in range(4)]
+
+
+@pytest.mark.parametrize("report_format", ["csv", "npz"])
+def test_main_resume_columnar_formats(log_file, tmp_path, monkeypatch, report_format):
+    """Test that --resume reads back CSV and npz reports it wrote."""
+    output = tmp_path / f"report.{report_format}"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output), "--resume"]
+    monkeypatch.setattr(sys, "argv", argv + ["-f", report_format])
+
+    main()
+    with open(log_file, "a", encoding="utf-8") as f:
+        f.write(_error_line(3))
+    main()
+
+    errors = list(iter_report_errors(str(output)))
+    assert _messages(errors) == [f"Failure {n}" for n in range(4)]
+    assert [e["user_id"] for e in errors] == [0, 1, 2, 3]
+
+
+def test_main_interrupt(log_file, tmp_path, monkeypatch, capsys):
+    """Test that Ctrl-C ends --follow quietly and interrupts other runs."""
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output)]
+
+    def interrupt(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(parser_module.time, "sleep", interrupt)
+    monkeypatch.setattr(sys, "argv", argv + ["--follow", "--interval", "1"])
+    main()
+    assert "Stopped following." in capsys.readouterr().out
+
+    monkeypatch.setattr(parser_module, "write_report", interrupt)
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(KeyboardInterrupt):
+        main()
+    assert "Stopped following." not in capsys.readouterr().out
@@ -0,0 +1,92 @@
+import bz2
+import gzip
+import io
+import lzma
+import threading
+
+import pytest
+import zstandard
+
+import decompress
+from decompress import (
+    DecompressionError,
+    detect_compression,
+    file_compression,
+    iter_decompressed_lines,
+)
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "bz2": bz2.compress,
+    "xz": lzma.compress,
+    "zstd": lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def log_bytes():
+    """Returns a few log lines, the last one without a trailing newline."""
+    return (
+        b"".join(
+            b"[2025-12-16 10:00:%02d] | ERROR | [Svc] | req-%d | Msg | {}\n" % (i, i)
+            for i in range(50)
+        )
+        + b"[2025-12-16 10:01:00] | INFO | [Svc] | req-x | tail | {}"
+    )
+
+
+# --- TEST: detection ---
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSORS))
+def test_detect_compression(compression):
+    """Test that each format is recognised by its magic bytes."""
+    assert detect_compression(COMPRESSORS[compression](b"data")) == compression
+
+
+def test_detect_compression_plain_text(tmp_path):
+    """Test that plain logs, missing files and short files are not compressed."""
+    assert detect_compression(b"[2025-12-16 10:00:00] | INFO") is None
+    assert detect_compression(b"") is None
+    assert file_compression(str(tmp_path / "missing.log")) is None
+
+    log_file = tmp_path / "server.log.1.gz"
+    log_file.write_bytes(gzip.compress(b"x\n"))
+    assert file_compression(str(log_file)) == "gzip"
+
+
+# --- TEST: iter_decompressed_lines ---
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSORS))
+def test_iter_decompressed_lines(monkeypatch, log_bytes, compression):
+    """Test that lines split across small decompressed blocks come out intact."""
+    monkeypatch.setattr(decompress, "DECOMPRESS_BLOCK_SIZE", 7)
+    source = io.BytesIO(COMPRESSORS[compression](log_bytes))
+
+    lines = list(iter_decompressed_lines(source, compression))
+
+    assert lines == log_bytes.split(b"\n")
+
+
+def test_iter_decompressed_lines_stops_thread_early(monkeypatch, log_bytes):
+    """Test that closing the generator early joins the decompression thread."""
+    monkeypatch.setattr(decompress, "DECOMPRESS_BLOCK_SIZE", 7)
+    monkeypatch.setattr(decompress, "DECOMPRESS_QUEUE_DEPTH", 1)
+    lines = iter_decompressed_lines(io.BytesIO(gzip.compress(log_bytes)), "gzip")
+
+    assert next(lines).startswith(b"[2025-12-16 10:00:00]")
+    lines.close()
+
+    assert not any(t.name == "decompress" for t in threading.enumerate())
+
+
+def test_iter_decompressed_lines_truncated(log_bytes):
+    """Test that a truncated archive raises DecompressionError."""
+    data = gzip.compress(log_bytes)[:-20]
+
+    with pytest.raises(DecompressionError):
+        list(iter_decompressed_lines(io.BytesIO(data), "gzip"))
@@ -0,0 +1,112 @@
+import pytest
+
+from filters import FilterError, compile_filter
+from log_formats import _tokenize_bytes
+from parser import project_metadata
+
+LINE = (
+    b"[2024-05-01 10:00:05] | WARN | [risk-engine] | req-042 | "
+    b'High latency detected | {"latency_ms": 2500, "ctx": {"region": "eu"}}'
+)
+
+
+def _compile(expression):
+    return compile_filter(expression, ("user_id",), project_metadata)
+
+
+def _matches(expression, line=LINE):
+    compiled = _compile(expression)
+    parts = _tokenize_bytes(line)
+    return (compiled.levels is None or parts[1] in compiled.levels) and (
+        compiled.match is None or compiled.match(parts)
+    )
+
+
+# --- TEST: compile_filter ---
+
+
+@pytest.mark.parametrize(
+    "expression, expected",
+    [
+        ("level == WARN", True),
+        ("level == ERROR", False),
+        ("level in {ERROR, WARN}", True),
+        ("level != WARN", False),
+        ("service == risk-engine", True),
+        ("service == 'risk'", False),
+        ("request_id == req-042", True),
+        ("message ~ 'latency'", True),
+        ("message ~ '^latency'", False),
+        ("not message ~ 'latency'", False),
+        ("metadata.latency_ms > 2000", True),
+        ("metadata.latency_ms between 1000 and 2000", False),
+        ("metadata.latency_ms in {1, 2500}", True),
+        ("metadata.latency_ms == '2500'", False),
+        ("metadata.ctx.region == eu", True),
+        ("metadata.missing == null", True),
+        ("metadata.missing > 0", False),
+        ("timestamp between 2024-05-01 and 2024-05-01", True),
+        ("timestamp < 2024-05-01T10:00:05", False),
+        ("timestamp <= '2024-05-01 10:00:05'", True),
+        ("level == ERROR or metadata.latency_ms >= 2500", True),
+        ("(level == WARN or level == ERROR) and service == auth", False),
+    ],
+)
+def test_filter_matches(expression, expected):
+    """Test each field and operator against one WARN line."""
+    assert _matches(expression) is expected
+
+
+def test_filter_level_and_service_prefilters():
+    """Test that level and service conditions are hoisted out of the predicate."""
+    compiled = _compile("level == ERROR")
+    assert compiled.levels == {b"ERROR"} and compiled.match is None
+
+    compiled = _compile("(level == WARN or level == ERROR) and service in {a, b}")
+    assert compiled.level_names() == ["ERROR", "WARN"]
+    assert compiled.service_names() == ["a", "b"]
+    assert compiled.match is not None
+
+    compiled = _compile("level == WARN or service == a")
+    assert compiled.levels is None and compiled.services is None
+
+
+def test_filter_metadata_fields():
+    """Test that the record's fields and the filter's keys are projected once."""
+    compiled = _compile("metadata.latency_ms > 1 and metadata.ctx.region == eu")
+    parts = _tokenize_bytes(LINE)
+
+    assert compiled.fields == ("user_id", "latency_ms", "ctx")
+    assert compiled.match(parts)
+    assert compiled.metadata(parts) is compiled.metadata(parts)
+    assert compiled.metadata(parts)["latency_ms"] == 2500
+
+
+def test_filter_skips_metadata_without_the_key():
+    """Test that lines lacking the key are rejected without decoding JSON."""
+    line = b"[2024-05-01 10:00:05] | INFO | [svc] | r1 | ok | {not json}"
+
+    assert not _matches("metadata.latency_ms > 2000", line)
+    with pytest.raises(ValueError):
+        _matches("metadata.latency_ms > 2000", line.replace(b"{not", b'{"latency_ms"'))
+
+
+@pytest.mark.parametrize(
+    "expression",
+    [
+        "",
+        "level",
+        "level ==",
+        "level = ERROR",
+        "host == a",
+        "metadata. == 1",
+        "level == ERROR and",
+        "level == ERROR )",
+        "level in {ERROR",
+        "message ~ '('",
+    ],
+)
+def test_filter_syntax_errors(expression):
+    """Test that invalid expressions raise FilterError."""
+    with pytest.raises(FilterError):
+        _compile(expression)
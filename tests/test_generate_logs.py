@@ -0,0 +1,103 @@
+import argparse
+
+import pytest
+
+from genLog.generate_logs import (
+    generate_logs,
+    iter_logs,
+    parse_level_mix,
+    parse_size,
+    write_logs,
+)
+from parser import parse_line
+
+
+# --- TEST: iter_logs ---
+
+
+def test_iter_logs_is_seeded():
+    """Test that a seed reproduces the same lines and lines parse cleanly."""
+    lines = generate_logs(500, seed=1)
+
+    assert lines == generate_logs(500, seed=1)
+    assert lines != generate_logs(500, seed=2)
+    parsed = [parse_line(line) for line in lines]
+    assert any(p is None for p in parsed)
+    assert all(
+        line.startswith("BROKEN_LINE") for line, p in zip(lines, parsed) if not p
+    )
+
+
+def test_iter_logs_options():
+    """Test level mix, malformed ratio and service/user cardinality."""
+    lines = list(
+        iter_logs(
+            2000,
+            seed=3,
+            level_mix={"ERROR": 3, "INFO": 1},
+            malformed_ratio=0,
+            services=4,
+            users=5,
+        )
+    )
+    parsed = [parse_line(line) for line in lines]
+
+    assert all(parsed)
+    levels = [p["level"] for p in parsed]
+    assert set(levels) == {"ERROR", "INFO"}
+    assert levels.count("ERROR") > 2 * levels.count("INFO")
+    assert {p["service"] for p in parsed} == {f"service-00{i}" for i in range(4)}
+    assert {p["metadata"]["user_id"] for p in parsed} == set(range(100, 105))
+    timestamps = [p["timestamp"] for p in parsed]
+    assert timestamps == sorted(timestamps)
+
+
+def test_iter_logs_unknown_level():
+    """Test that a level without scenarios is rejected."""
+    with pytest.raises(ValueError):
+        next(iter_logs(1, level_mix={"FATAL": 1}))
+
+
+# --- TEST: write_logs ---
+
+
+def test_write_logs_size(tmp_path):
+    """Test that a size target is met with whole lines and never exceeded."""
+    output = tmp_path / "corpus.log"
+
+    lines, size = write_logs(str(output), size=50_000, seed=4)
+
+    data = output.read_bytes()
+    assert len(data) == size <= 50_000
+    assert size > 49_000
+    assert data.endswith(b"\n") and data.count(b"\n") == lines
+
+
+def test_write_logs_lines(tmp_path):
+    """Test that a line count writes exactly the generated lines."""
+    output = tmp_path / "corpus.log"
+
+    assert write_logs(str(output), num_lines=30, seed=5)[0] == 30
+    assert output.read_text(encoding="utf-8").splitlines() == generate_logs(30, seed=5)
+
+
+# --- TEST: argument types ---
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("1024", 1024), ("100M", 100 << 20), ("1.5G", 3 << 29), ("2gb", 2 << 30)],
+)
+def test_parse_size(value, expected):
+    """Test human-readable sizes."""
+    assert parse_size(value) == expected
+
+
+def test_parse_level_mix():
+    """Test LEVEL=WEIGHT lists and their validation."""
+    assert parse_level_mix("info=60,ERROR=40") == {"INFO": 60.0, "ERROR": 40.0}
+
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_level_mix("INFO")
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_size("lots")
@@ -0,0 +1,66 @@
+import pickle
+
+from line_stats import LevelCounts, LineAggregator, ServiceCounts
+
+
+def _fields(*lines):
+    """The flat field list the scanner hands to `update`."""
+    fields = []
+    for level, service in lines:
+        fields.extend(
+            [b"[2024-05-01 10:00:00]", level, service, b"req-1", b"Msg", b"{}"]
+        )
+    return fields
+
+
+class MessageLengths(LineAggregator):
+    """A custom aggregator that only implements `add`."""
+
+    name = "message_lengths"
+
+    def __init__(self):
+        self.total = 0
+
+    def add(self, parts):
+        self.total += len(parts[4])
+
+    def merge(self, other):
+        self.total += other.total
+
+    def summary(self):
+        return self.total
+
+
+# --- TEST: line aggregators ---
+
+
+def test_field_counts_summary():
+    """Test that counts are decoded, unbracketed and ranked, ties by name."""
+    levels, services = LevelCounts(), ServiceCounts()
+    fields = _fields(
+        (b"INFO", b"[auth]"), (b"ERROR", b"[payment]"), (b"ERROR", b"[auth]")
+    )
+    levels.update(fields)
+    services.update(fields)
+    services.add(fields[6:12])
+
+    assert levels.summary() == {"ERROR": 2, "INFO": 1}
+    assert list(services.summary().items()) == [("auth", 2), ("payment", 2)]
+
+
+def test_field_counts_merge_empty_copies():
+    """Test that empty copies pickle, fill separately and merge back."""
+    total = LevelCounts()
+    parts = [pickle.loads(pickle.dumps(total.empty())) for _ in range(2)]
+    parts[0].update(_fields((b"WARN", b"[a]")))
+    parts[1].update(_fields((b"WARN", b"[b]"), (b"DEBUG", b"[b]")))
+    for part in parts:
+        total.merge(part)
+    assert total.summary() == {"WARN": 2, "DEBUG": 1}
+
+
+def test_default_update_calls_add():
+    """Test that an aggregator with only `add` gets every line of a batch."""
+    lengths = MessageLengths()
+    lengths.update(_fields((b"INFO", b"[a]"), (b"INFO", b"[b]")))
+    assert lengths.summary() == 6
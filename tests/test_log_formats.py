@@ -0,0 +1,175 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from log_formats import (
+    LOG_FORMATS,
+    JsonFormat,
+    LayoutFormat,
+    _tokenize_bytes,
+    detect_format,
+    get_format,
+    register_format,
+)
+
+PIPE_LINES = [
+    b'[2024-05-01 10:00:01] | ERROR | [payment] | r1 | Timeout | {"user_id": 7}',
+    b"[2024-05-01 10:00:02] | INFO | [auth] | r2 | Login ok | {}",
+    b'[2024-05-01 10:00:03] | WARN | [auth] | r3 | Split | here | {"a": 1}',
+    b"[2024-05-01 10:00:04] | ERROR | payment | r4 | No brackets | {}",
+    b"garbage",
+]
+
+NGINX_LINE = (
+    b'10.0.0.1 - - [01/May/2024:10:00:01 +0000] "GET /pay HTTP/1.1" 502 17 '
+    b'"-" "curl/8.0"'
+)
+SYSLOG_LINE = b"<11>May  1 10:00:01 web1 payment[230]: Connection timeout"
+JSON_LINE = (
+    b'{"timestamp": "2024-05-01T10:00:01Z", "level": "error", '
+    b'"service": "payment", "request_id": "r1", "message": "boom", "user_id": 7}'
+)
+
+
+# --- TEST: LayoutFormat ---
+
+
+def test_declared_pipe_layout_matches_builtin():
+    """Test that the pipe layout, declared, tokenizes like the built-in."""
+    declared = LayoutFormat(
+        "declared-pipe",
+        "[{timestamp}] | {level} | [{service}] | {request_id} | {message} | {metadata}",
+        delimiter=" | ",
+        patterns={"level": r"\w+", "metadata": r"\{.*\}"},
+    )
+    builtin = get_format("pipe")
+    for line in PIPE_LINES:
+        assert declared.tokenize(line) == builtin.tokenize(line)
+    assert declared.split(PIPE_LINES[0]) == _tokenize_bytes(PIPE_LINES[0])
+
+
+def test_nginx_format():
+    """Test canonical parts, typed metadata and the level from the status."""
+    parts = get_format("nginx").tokenize(NGINX_LINE)
+    assert parts[:5] == [
+        b"[2024-05-01 10:00:01]",
+        b"ERROR",
+        b"[nginx]",
+        b"",
+        b"GET /pay HTTP/1.1",
+    ]
+    assert json.loads(parts[5]) == {
+        "remote_addr": "10.0.0.1",
+        "user_id": None,
+        "status": 502,
+        "body_bytes_sent": 17,
+        "http_referer": None,
+        "http_user_agent": "curl/8.0",
+    }
+    assert get_format("nginx").tokenize(NGINX_LINE.replace(b"502", b"404"))[1] == (
+        b"WARN"
+    )
+    assert get_format("nginx").tokenize(b"GET / 200") is None
+
+
+def test_syslog_format():
+    """Test the service, pid and level taken from a syslog line."""
+    parts = get_format("syslog").tokenize(SYSLOG_LINE)
+    year = datetime.now().year
+    assert parts[:5] == [
+        b"[%d-05-01 10:00:01]" % year,
+        b"ERROR",
+        b"[payment]",
+        b"",
+        b"Connection timeout",
+    ]
+    assert json.loads(parts[5]) == {"priority": 11, "host": "web1", "pid": "[230]"}
+
+
+def test_custom_layout_with_escaped_metadata():
+    """Test that a regex-only layout escapes strings in its metadata."""
+    line_format = LayoutFormat(
+        "custom",
+        "{timestamp} {level} {user} {message}",
+        timestamp_format="iso",
+        patterns={"timestamp": r"\S+", "level": r"\S+", "user": r"\S+"},
+        types={"user": "int"},
+        defaults={"service": "api"},
+    )
+    parts = line_format.tokenize(b'2024-05-01T10:00:01 error 42 said "hi"\\')
+    assert parts[:5] == [
+        b"[2024-05-01 10:00:01]",
+        b"ERROR",
+        b"[api]",
+        b"",
+        b'said "hi"\\',
+    ]
+    assert json.loads(parts[5]) == {"user": 42}
+    assert json.loads(line_format.tokenize(b"2024-05-01T10:00:01 x ab m")[5]) == {
+        "user": None
+    }
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"layout": "{level} {message}"},
+        {"layout": "{timestamp} {level} {level}"},
+        {"layout": "{timestamp} {message}", "types": {"missing": "int"}},
+        {"layout": "{timestamp} {message}", "types": {"message": "bool"}},
+        {"layout": "{timestamp:>10} {message}"},
+        {"layout": "{timestamp} {message}", "patterns": {"message": "(a|b)"}},
+        {"layout": "{timestamp} {level}{message}", "delimiter": " "},
+    ],
+)
+def test_invalid_layouts(kwargs):
+    """Test that malformed declarations are rejected when compiled."""
+    with pytest.raises(ValueError):
+        LayoutFormat("bad", **kwargs)
+
+
+# --- TEST: JsonFormat ---
+
+
+def test_json_format():
+    """Test that JSON lines keep their object as the metadata."""
+    parts = get_format("jsonl").tokenize(JSON_LINE)
+    assert parts == [
+        b"[2024-05-01 10:00:01]",
+        b"ERROR",
+        b"[payment]",
+        b"r1",
+        b"boom",
+        JSON_LINE,
+    ]
+    renamed = JsonFormat("renamed", keys={"message": "msg"}, defaults={"level": "I"})
+    line = b'{"timestamp": "2024-05-01 10:00:01", "msg": "hi"}'
+    assert renamed.tokenize(line)[1:5] == [b"I", b"[]", b"", b"hi"]
+    assert renamed.tokenize(b'{"msg": "no timestamp"}') is None
+    assert renamed.tokenize(b"[1, 2]") is None
+
+
+# --- TEST: registry ---
+
+
+def test_detect_format():
+    """Test that detection picks the format most sample lines parse."""
+    assert detect_format(PIPE_LINES).name == "pipe"
+    assert detect_format([NGINX_LINE] * 3 + [b"garbage"]).name == "nginx"
+    assert detect_format([b"", SYSLOG_LINE]).name == "syslog"
+    assert detect_format([JSON_LINE, PIPE_LINES[0], JSON_LINE]).name == "jsonl"
+    assert detect_format([b"garbage"]).name == "pipe"
+
+
+def test_register_format():
+    """Test that registered formats can be looked up and bad names fail."""
+    line_format = JsonFormat("test-json")
+    try:
+        assert register_format(line_format) is get_format("test-json")
+    finally:
+        del LOG_FORMATS["test-json"]
+    with pytest.raises(ValueError):
+        register_format(JsonFormat("auto"))
+    with pytest.raises(ValueError):
+        get_format("test-json")
@@ -0,0 +1,161 @@
+import os
+
+import pytest
+
+from log_index import IndexBuilder, LogIndex, index_path_for
+from parser import process_log_file
+from timestamps import parse_timestamp
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def day_log(tmp_path):
+    """Writes a log with one line per minute for a day; every 10th is ERROR."""
+    lines = []
+    for minute in range(24 * 60):
+        level = "ERROR" if minute % 10 == 0 else "INFO"
+        service = "payment-service" if minute < 12 * 60 else "auth-service"
+        lines.append(
+            f"[2024-05-01 {minute // 60:02d}:{minute % 60:02d}:00] | {level} | "
+            f'[{service}] | req-{minute} | Message | {{"user_id": {minute}}}'
+        )
+        if minute % 100 == 0:
+            lines.append("BROKEN_LINE_GARBAGE_DATA")
+    log_file = tmp_path / "day.log"
+    log_file.write_text("\n".join(lines), encoding="utf-8")
+    return str(log_file)
+
+
+# --- TEST: IndexBuilder ---
+
+
+def test_index_builder_blocks_cover_range():
+    """Test that blocks are contiguous and end on line boundaries."""
+    builder = IndexBuilder(start=100, block_size=10)
+    for _ in range(7):
+        builder.add(4, b"2024-05-01 10:00:00", b"INFO", b"svc")
+    builder.add(4)
+
+    blocks = builder.finish(132)
+
+    assert [(b[0], b[1]) for b in blocks] == [(100, 112), (112, 124), (124, 132)]
+    assert blocks[-1][4] == {b"INFO"}
+    assert sum(b[6] for b in blocks) == 8
+
+
+# --- TEST: LogIndex ---
+
+
+def test_index_ranges_skip_blocks(day_log, monkeypatch):
+    """Test that queries only return blocks matching level, service and time."""
+    monkeypatch.setattr("log_index.INDEX_BLOCK_SIZE", 4096)
+    process_log_file(day_log, use_index=True)
+    index = LogIndex.load(index_path_for(day_log))
+
+    assert index is not None and index.is_current(day_log)
+    assert len(index.blocks) > 10
+    assert index.ranges(level="FATAL") == []
+    assert index.ranges() == [(0, os.path.getsize(day_log))]
+
+    window = index.ranges(start="2024-05-01 13:00:00", end="2024-05-01 13:59:59")
+    assert 0 < sum(end - start for start, end in window) < os.path.getsize(day_log)
+
+    payment = index.ranges(service="payment-service")
+    auth = index.ranges(service="auth-service")
+    assert payment[0][0] == 0 and auth[-1][1] == os.path.getsize(day_log)
+    assert index.ranges(service=["payment-service", "auth-service"]) == index.ranges()
+    assert index.ranges(level={"FATAL", "ERROR"}) == index.ranges(level="ERROR")
+
+
+def test_index_stores_epoch_seconds(tmp_path):
+    """Test that block bounds are epoch seconds and odd timestamps bound
+    nothing."""
+    log_file = tmp_path / "odd.log"
+    log_file.write_bytes(b"x" * 40)
+    builder = IndexBuilder(block_size=10)
+    builder.add(10, b"2024-05-01 10:00:00", b"INFO", b"svc")
+    builder.add(10, b"2024-05-01 10:30:00", b"INFO", b"svc")
+    builder.add(10, b"2024-05-01 11:00:00", b"INFO", b"svc")
+    builder.add(10, b"yesterday", b"INFO", b"svc")
+    index = LogIndex.from_blocks(str(log_file), builder.finish(40))
+
+    start = 1714557600  # 2024-05-01 10:00:00
+    assert [block[2:4] for block in index.blocks] == [
+        [start, start],
+        [start + 1800, start + 1800],
+        [start + 3600, start + 3600],
+        [None, None],
+    ]
+    assert index.ranges(start="2024-05-01 10:15:00", end="2024-05-01 10:45:00") == [
+        (10, 20),
+        (30, 40),
+    ]
+    assert index.ranges(start=start + 900, end=start + 2700) == [(10, 20), (30, 40)]
+    assert index.ranges(start="2024-05-01") == [(0, 40)]
+
+
+def test_index_load_rejects_bad_files(tmp_path):
+    """Test that missing, corrupt or foreign index files are ignored."""
+    assert LogIndex.load(str(tmp_path / "missing.idx")) is None
+
+    corrupt = tmp_path / "corrupt.idx"
+    corrupt.write_text("{not json", encoding="utf-8")
+    assert LogIndex.load(str(corrupt)) is None
+
+    old = tmp_path / "old.idx"
+    old.write_text('{"version": 0}', encoding="utf-8")
+    assert LogIndex.load(str(old)) is None
+
+
+# --- TEST: process_log_file with an index ---
+
+
+def test_indexed_query_matches_full_scan(day_log):
+    """Test that the indexed date-range query returns the same records."""
+    window = {"start_ts": "2024-05-01 13:00:00", "end_ts": "2024-05-01 13:30:00"}
+    expected = process_log_file(day_log, **window)
+
+    assert process_log_file(day_log, use_index=True, **window) == expected
+    assert os.path.exists(index_path_for(day_log))
+    assert process_log_file(day_log, use_index=True, **window) == expected
+    assert process_log_file(day_log, workers=3, use_index=True, **window) == expected
+
+    assert len(expected) == 4
+    start, end = parse_timestamp(window["start_ts"]), parse_timestamp(window["end_ts"])
+    assert all(start <= e["timestamp"] <= end for e in expected)
+
+    payment = {"filter_expr": "level == ERROR and service == payment-service"}
+    payment_errors = process_log_file(day_log, **payment)
+    assert process_log_file(day_log, use_index=True, **payment) == payment_errors
+    assert len(payment_errors) == 72
+
+
+def test_stale_index_is_rebuilt(day_log):
+    """Test that an index is ignored and rebuilt after the file changes."""
+    process_log_file(day_log, use_index=True)
+    with open(day_log, "a", encoding="utf-8") as f:
+        f.write(
+            "\n[2024-05-02 00:00:00] | ERROR | [auth-service] | req-x | Late | "
+            '{"user_id": 7}'
+        )
+
+    errors = process_log_file(day_log, use_index=True, start_ts="2024-05-02 00:00:00")
+
+    assert [e["message"] for e in errors] == ["Late"]
+    assert LogIndex.load(index_path_for(day_log)).is_current(day_log)
+
+
+def test_workers_build_same_index(day_log, monkeypatch):
+    """Test that chunked workers produce an index equivalent to one pass."""
+    monkeypatch.setattr("log_index.INDEX_BLOCK_SIZE", 4096)
+    process_log_file(day_log, use_index=True)
+    single = LogIndex.load(index_path_for(day_log))
+    os.remove(index_path_for(day_log))
+
+    process_log_file(day_log, workers=4, use_index=True)
+    parallel = LogIndex.load(index_path_for(day_log))
+
+    assert set(single.levels) == set(parallel.levels)
+    assert parallel.ranges(level="ERROR") == single.ranges(level="ERROR")
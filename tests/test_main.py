@@ -0,0 +1,41 @@
+import json
+
+from main import analyze_log
+
+LINES = [
+    "[2024-05-01 10:00:00] | INFO | [auth] | r1 | Login | {}",
+    '[2024-05-01 10:00:01] | ERROR | [payment] | r2 | Declined | {"user_id": 7}',
+    "[2024-05-01 10:00:02] | INFO | [payment] | r3 | Paid | {}",
+    "a | stray line",
+]
+
+
+# --- TEST: analyze_log ---
+
+
+def test_analyze_log_counts_levels(tmp_path, capsys):
+    """Test that well-formed lines are counted per level and printed."""
+    log_file = tmp_path / "server.log"
+    log_file.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+
+    assert analyze_log(str(log_file)) == {"INFO": 2, "ERROR": 1}
+    assert capsys.readouterr().out == "Analysis result:\nINFO: 2\nERROR: 1\n"
+
+
+def test_analyze_log_writes_report_in_same_pass(tmp_path):
+    """Test that the error report comes out of the same scan."""
+    log_file = tmp_path / "server.log"
+    log_file.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+    output = tmp_path / "report.json"
+
+    analyze_log(str(log_file), str(output))
+    summary = json.loads(output.read_text(encoding="utf-8"))["summary"]
+    assert summary["total_errors"] == 1
+    assert summary["lines_by_level"] == {"INFO": 2, "ERROR": 1}
+    assert summary["lines_by_service"] == {"payment": 2, "auth": 1}
+
+
+def test_analyze_log_missing_file(tmp_path, capsys):
+    """Test the message for a missing log file."""
+    assert analyze_log(str(tmp_path / "missing.log")) == {}
+    assert capsys.readouterr().out == "There's no LOG file\n"
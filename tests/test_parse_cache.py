@@ -0,0 +1,72 @@
+import os
+
+from parse_cache import ParseCache, file_fingerprint
+
+
+def _log(tmp_path, content=b"line\n" * 100, name="server.log"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+# --- TEST: ParseCache ---
+
+
+def test_key_follows_file_and_options(tmp_path):
+    """Test that the key changes with the file's content and the options."""
+    cache = ParseCache(str(tmp_path / "cache"), min_size=0)
+    path = _log(tmp_path)
+    key = cache.key(path, None, None, "level == ERROR")
+
+    assert cache.key(path, None, None, "level == ERROR") == key
+    assert cache.key(path, "2024-05-01 00:00:00", None, "level == ERROR") != key
+
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.write(b"LINE")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert file_fingerprint(path)[1:3] == (stat.st_size, stat.st_mtime_ns)
+    assert cache.key(path, None, None, "level == ERROR") != key
+
+
+def test_key_skips_small_files_and_stdin(tmp_path):
+    """Test that stdin, missing and small files are not cached."""
+    cache = ParseCache(str(tmp_path / "cache"), min_size=1000)
+    assert cache.key("-") is None
+    assert cache.key(str(tmp_path / "missing.log")) is None
+    assert cache.key(_log(tmp_path, b"short\n")) is None
+    assert cache.key(_log(tmp_path, b"x" * 1000, "big.log")) is not None
+
+
+def test_get_put_round_trip(tmp_path):
+    """Test that entries come back and unreadable ones are misses."""
+    cache = ParseCache(str(tmp_path / "cache"))
+    assert cache.get("k") is None
+    cache.put("k", ([1, 2], 3))
+    assert cache.get("k") == ([1, 2], 3)
+
+    (tmp_path / "cache" / "k.pickle").write_bytes(b"not a pickle")
+    assert cache.get("k") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """Test that eviction drops the entries used longest ago first."""
+    cache = ParseCache(str(tmp_path / "cache"), max_bytes=2500)
+    for name in ("a", "b"):
+        cache.put(name, b"x" * 1000)
+    for age, name in enumerate(("b", "a")):
+        path = tmp_path / "cache" / f"{name}.pickle"
+        os.utime(path, (1000 + age, 1000 + age))
+    assert cache.get("b") is not None
+
+    cache.put("c", b"x" * 1000)
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
+
+
+def test_skips_entries_over_the_cap(tmp_path):
+    """Test that an entry larger than the whole cache is not written."""
+    cache = ParseCache(str(tmp_path / "cache"), max_bytes=100)
+    cache.put("k", b"x" * 1000)
+    assert cache.get("k") is None
+    assert os.listdir(tmp_path / "cache") == []
@@ -1,8 +1,50 @@
+import gzip
+import io
 import json
+import os
+import sys
+
 import pytest
 
-# Đã xóa import sys (F401 fixed)
-from parser import parse_line, parse_arguments, process_log_file, process_errors
+import parser as parser_module
+from line_stats import LineAggregator
+from log_formats import LOG_PATTERN, tokenize_line
+from profiling import StageTimings
+from parser import (
+    LazyMetadata,
+    chunk_boundaries,
+    expand_inputs,
+    extract_fields,
+    main,
+    merge_by_timestamp,
+    parse_arguments,
+    parse_line,
+    process_errors,
+    ErrorBatch,
+    ErrorRecord,
+    ScanStats,
+    iter_log_file,
+    process_log_file,
+    project_metadata,
+)
+
+
+class _RequestIds(LineAggregator):
+    """Distinct request IDs; a custom aggregator for the scanner tests."""
+
+    name = "request_ids"
+
+    def __init__(self):
+        self.ids = set()
+
+    def add(self, parts):
+        self.ids.add(parts[3])
+
+    def merge(self, other):
+        self.ids |= other.ids
+
+    def summary(self):
+        return len(self.ids)
 
 
 # --- FIXTURES (Sample Data) ---
@@ -66,6 +108,78 @@ def test_parse_line_bad_json(sample_log_line_bad_json):
     assert result is None
 
 
+@pytest.mark.parametrize(
+    "line",
+    [
+        "[2025-12-16 10:00:00] | INFO | [Svc] | req-1 | Msg | {}",
+        '  [t] | WARN | [Svc] | req-1 | Msg | {"a": 1}  \n',
+        '[t] | ERROR | [Svc] | req-1 | a | b | {"pipe": "x | y"}',
+        "[t] | LOG_LEVEL | [Svc] | req-1 | Msg | {}",
+        "[t] | ERR-OR | [Svc] | req-1 | Msg | {}",
+        "[t] | ERROR | Svc | req-1 | Msg | {}",
+        "[t] | ERROR | [Svc] |  | Msg | {}",
+        "[t] | | ERROR | [Svc] | req-1 | {}",
+        "[t] | ERROR | [Svc] | req-1 | Msg | not json",
+        "",
+    ],
+)
+def test_tokenize_line_matches_log_pattern(line):
+    """Test that the fast-path tokenizer agrees with LOG_PATTERN."""
+    match = LOG_PATTERN.match(line.strip())
+    expected = match.groups() if match else None
+    assert tokenize_line(line) == expected
+
+
+# --- TEST: metadata projection ---
+
+
+@pytest.mark.parametrize(
+    "metadata_str, expected",
+    [
+        ('{"user_id": 102, "error_code": 500}', {"user_id": 102}),
+        ('{"error_code": 500,"user_id":"u-7" }', {"user_id": "u-7"}),
+        ('{"user_id": null}', {"user_id": None}),
+        ('{"retry": 3}', None),
+        ('{"ctx": {"user_id": 1}, "user_id": 2}', None),
+        ('{"note": "\\"user_id\\": 9", "user_id": 2}', {"user_id": 2}),
+        ('{"note": "user_id", "user_id": 2}', None),
+        ('{"user_id": 12abc}', None),
+        ("{invalid_json}", None),
+    ],
+)
+def test_extract_fields(metadata_str, expected):
+    """Test the light extractor and the cases where it defers to json.loads."""
+    assert extract_fields(metadata_str, ["user_id"]) == expected
+
+
+def test_project_metadata_falls_back_to_full_decode():
+    """Test that ambiguous metadata is decoded in full and bad JSON raises."""
+    nested = '{"ctx": {"user_id": 1}, "user_id": 2}'
+    assert project_metadata(nested, ["user_id"]) == {"user_id": 2}
+    assert project_metadata('{"retry": 3}', ["user_id"]) == {"user_id": None}
+
+    with pytest.raises(json.JSONDecodeError):
+        project_metadata("{invalid_json}", ["user_id"])
+
+
+def test_parse_line_with_fields_is_lazy(sample_log_line_error):
+    """Test that projected parsing only decodes the full JSON on demand."""
+    result = parse_line(sample_log_line_error, fields=["user_id"])
+
+    metadata = result["metadata"]
+    assert isinstance(metadata, LazyMetadata)
+    assert metadata["user_id"] == 102
+    assert metadata._decoded is None
+
+    assert metadata["error_code"] == 500
+    assert metadata == {"user_id": 102, "error_code": 500}
+
+
+def test_parse_line_with_fields_bad_json(sample_log_line_bad_json):
+    """Test that projected parsing still rejects metadata it cannot read."""
+    assert parse_line(sample_log_line_bad_json, fields=["user_id"]) is None
+
+
 # --- TEST: parse_arguments ---
 
 
@@ -79,6 +193,54 @@ def test_parse_arguments_valid():
     assert args.input_path == "input.log"
     assert args.output_path == "output.json"
     assert args.verbose is True
+    assert args.workers == 1
+
+
+def test_parse_arguments_workers():
+    """Test the --workers option and its validation."""
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--workers", "4"])
+    assert args.workers == 4
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", "in.log", "-o", "out.json", "--workers", "0"])
+
+
+def test_parse_arguments_date_range():
+    """Test that --start-date/--end-date accept dates and timestamps."""
+    args = parse_arguments(
+        ["-i", "in.log", "-o", "out.json", "--start-date", "2024-05-01"]
+        + ["--end-date", "2024-05-02", "--index"]
+    )
+    assert args.start_ts == "2024-05-01 00:00:00"
+    assert args.end_ts == "2024-05-02 23:59:59"
+    assert args.use_index is True
+
+    args = parse_arguments(
+        ["-i", "in.log", "-o", "out.json", "--end-date", "2024-05-02 10:30:00"]
+    )
+    assert args.start_ts is None
+    assert args.end_ts == "2024-05-02 10:30:00"
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", "in.log", "-o", "out.json", "--start-date", "May 1"])
+
+
+def test_parse_arguments_resume_rejects_stdin():
+    """Test that --resume/--follow require a file they can checkpoint."""
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--follow"])
+    assert args.follow is True and args.interval == 5.0
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", "-", "-o", "out.json", "--resume"])
+
+
+def test_parse_arguments_resume_rejects_compressed(tmp_path):
+    """Test that --resume refuses a compressed log it cannot checkpoint."""
+    log_file = tmp_path / "server.log.1.gz"
+    log_file.write_bytes(gzip.compress(b"line\n"))
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", str(log_file), "-o", "out.json", "--resume"])
 
 
 def test_parse_arguments_missing_required():
@@ -110,6 +272,117 @@ def test_process_log_file(tmp_path, sample_log_line_valid, sample_log_line_error
     assert errors[0]["user_id"] == 102
 
 
+def test_process_log_file_workers_match_single_process(tmp_path):
+    """Test that chunked multi-process parsing merges results in file order."""
+    lines = []
+    for i in range(300):
+        level = "ERROR" if i % 3 == 0 else "INFO"
+        lines.append(
+            f"[2025-12-16 10:{i // 60:02d}:{i % 60:02d}] | {level} | [Svc{i % 4}] | "
+            f'req-{i} | Message {i % 7} | {{"user_id": {i}}}'
+        )
+        if i % 50 == 0:
+            lines.append("Invalid Line")
+    log_file = tmp_path / "big.log"
+    log_file.write_text("\n".join(lines), encoding="utf-8")
+
+    expected = process_log_file(str(log_file), workers=1)
+    for workers in (2, 3, 7):
+        assert process_log_file(str(log_file), workers=workers) == expected
+
+
+def test_iter_log_file_streams_small_chunks(tmp_path, monkeypatch):
+    """Test that many bounded worker chunks still yield records in order."""
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 512)
+    lines = [
+        f"[2025-12-16 10:00:{i % 60:02d}] | ERROR | [Svc] | req-{i} | "
+        f'Message {i} | {{"user_id": {i}}}'
+        for i in range(200)
+    ]
+    log_file = tmp_path / "stream.log"
+    log_file.write_text("\n".join(lines), encoding="utf-8")
+    stats = ScanStats()
+
+    records = iter_log_file(str(log_file), workers=2, stats=stats)
+
+    assert next(records)["user_id"] == 0
+    assert [r["user_id"] for r in records] == list(range(1, 200))
+    assert stats.total_lines == 200
+
+
+def test_chunk_boundaries_are_newline_aligned(tmp_path):
+    """Test that every byte range starts at the beginning of a line."""
+    log_file = tmp_path / "chunks.log"
+    data = b"".join(b"line %d\n" % i for i in range(100))
+    log_file.write_bytes(data)
+
+    ranges = chunk_boundaries(str(log_file), 4)
+
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 1 : start] == b"\n"
+
+
+def test_process_log_file_small_read_blocks(
+    tmp_path, monkeypatch, sample_log_line_valid, sample_log_line_error
+):
+    """Test that lines spanning memory-map read blocks are reassembled."""
+    monkeypatch.setattr(parser_module, "READ_BLOCK_SIZE", 7)
+    log_file = tmp_path / "blocks.log"
+    content = f"{sample_log_line_error}\r\n{sample_log_line_valid}\n\n"
+    log_file.write_bytes((content * 3 + sample_log_line_error).encode("utf-8"))
+
+    errors = process_log_file(str(log_file))
+
+    assert len(errors) == 4
+    assert all(e["message"] == "Payment failed" for e in errors)
+
+
+def test_process_log_file_empty(tmp_path):
+    """Test that an empty file (which cannot be memory-mapped) is handled."""
+    log_file = tmp_path / "empty.log"
+    log_file.write_bytes(b"")
+    assert process_log_file(str(log_file)) == []
+
+
+def test_process_log_file_stdin(monkeypatch, capsys, sample_log_line_error):
+    """Test reading from stdin via '-', the stream fallback of the reader."""
+    stream = io.TextIOWrapper(io.BytesIO(f"{sample_log_line_error}\n".encode()))
+    monkeypatch.setattr(sys, "stdin", stream)
+
+    errors = process_log_file("-", verbose=True, workers=4)
+
+    assert [e["user_id"] for e in errors] == [102]
+    assert "Total Lines Processed: 1" in capsys.readouterr().out
+
+
+def test_process_log_file_undecodable_error_line(tmp_path, sample_log_line_error):
+    """Test that ERROR lines with invalid UTF-8 are skipped, not fatal."""
+    log_file = tmp_path / "binary.log"
+    bad_line = sample_log_line_error.replace("Payment", "Pay\udcffment")
+    log_file.write_bytes(
+        bad_line.encode("utf-8", "surrogateescape") + b"\n\xff\xfe garbage"
+    )
+
+    assert process_log_file(str(log_file)) == []
+
+
+def test_process_log_file_compressed(tmp_path, sample_log_line_error):
+    """Test that a gzip-compressed log gives the same records as plain text."""
+    text = f"{sample_log_line_error}\nInvalid Line\n{sample_log_line_error}"
+    plain = tmp_path / "server.log"
+    plain.write_text(text, encoding="utf-8")
+    compressed = tmp_path / "server.log.1.gz"
+    compressed.write_bytes(gzip.compress(text.encode("utf-8")))
+
+    expected = process_log_file(str(plain))
+    assert len(expected) == 2
+    assert process_log_file(str(compressed), workers=2, use_index=True) == expected
+    assert not (tmp_path / "server.log.1.gz.idx").exists()
+
+
 def test_process_log_file_not_found():
     """Test behavior when the input file does not exist."""
     with pytest.raises(SystemExit):
@@ -144,3 +417,839 @@ def test_process_errors_report(tmp_path):
     assert data["summary"]["total_errors"] == 3
     assert data["summary"]["unique_affected_users"] == 2
     assert len(data["errors"]) == 3
+
+
+def test_process_errors_columnar_batch(tmp_path, capsys):
+    """Test that a columnar batch gives the same report and listing as a list."""
+    errors_list = [
+        ErrorRecord("t1", "S1", "Err A", 1),
+        ErrorRecord("t2", "S1", "Err B", None),
+        ErrorRecord("t3", "S2", "Err A", 2),
+    ]
+    list_report = tmp_path / "list.json"
+    batch_report = tmp_path / "batch.json"
+
+    process_errors(errors_list, str(list_report), verbose=True)
+    list_output = capsys.readouterr().out
+    process_errors(ErrorBatch.from_records(errors_list), str(batch_report), True)
+    batch_output = capsys.readouterr().out
+
+    assert list_report.read_text() == batch_report.read_text()
+    assert list_output.replace("list.json", "batch.json") == batch_output
+
+
+def test_process_errors_engines_match(tmp_path, capsys, monkeypatch):
+    """Test that numpy and python aggregation give the same report and listing."""
+    monkeypatch.setattr(parser_module, "AGGREGATE_BATCH_SIZE", 2)
+    errors_list = [
+        ErrorRecord("2024-01-01 10:00:00", "S1", "Err B", 1),
+        ErrorRecord("2024-01-01 10:00:30", "S2", "Err A", None),
+        ErrorRecord("2024-01-01 10:01:00", "S1", "Err A", "1"),
+        ErrorRecord("2024-01-01 10:01:10", "S2", "Err B", 1),
+        ErrorRecord("2024-01-01 10:01:20", "S1", "Err C", 2),
+    ]
+    reports = {}
+    outputs = {}
+    for engine in ("numpy", "python"):
+        report = tmp_path / f"{engine}.json"
+        process_errors(errors_list, str(report), True, engine=engine)
+        reports[engine] = report.read_text()
+        outputs[engine] = capsys.readouterr().out.replace(engine, "ENGINE")
+
+    assert reports["numpy"] == reports["python"]
+    assert outputs["numpy"] == outputs["python"]
+    assert "Errors by Service:\n - S1 (3 errors)\n - S2 (2 errors)" in outputs["numpy"]
+    assert "Peak Minute: 2024-01-01 10:01 (3 errors)" in outputs["numpy"]
+
+
+def test_process_log_file_columnar(tmp_path, sample_log_line_error):
+    """Test collecting the parsed errors straight into an ErrorBatch."""
+    log_file = tmp_path / "test.log"
+    log_file.write_text(f"{sample_log_line_error}\n" * 3, encoding="utf-8")
+
+    batch = process_log_file(str(log_file), columnar=True)
+
+    assert isinstance(batch, ErrorBatch)
+    assert len(batch) == 3
+    assert batch.tables["service"] == ["PaymentService"]
+
+
+def test_main_jsonl_report(tmp_path, monkeypatch, sample_log_line_error):
+    """Test the streaming CLI path with a JSON Lines report."""
+    log_file = tmp_path / "test.log"
+    log_file.write_text(f"{sample_log_line_error}\nInvalid Line\n", encoding="utf-8")
+    output = tmp_path / "report.jsonl"
+    argv = ["parser.py", "-i", str(log_file), "-o", str(output), "-f", "jsonl"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    main()
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[0])["service"] == "PaymentService"
+    assert json.loads(lines[1]) == {
+        "summary": {"total_errors": 1, "unique_affected_users": 1}
+    }
+
+
+# --- TEST: multiple inputs ---
+
+
+def _host_log(path, seconds, user_id):
+    path.write_text(
+        "".join(
+            f"[2025-12-16 10:00:{second:02d}] | ERROR | [Svc] | req-{second} | "
+            f'Err | {{"user_id": {user_id}}}\n'
+            for second in seconds
+        ),
+        encoding="utf-8",
+    )
+
+
+def test_expand_inputs(tmp_path):
+    """Test that directories and globs expand to sorted files without sidecars."""
+    for name in ("b.log", "a.log", "a.log.idx", "report.json.ckpt", "c.txt"):
+        (tmp_path / name).write_text("x\n", encoding="utf-8")
+    (tmp_path / "sub").mkdir()
+
+    assert expand_inputs([str(tmp_path)]) == [
+        str(tmp_path / name) for name in ("a.log", "b.log", "c.txt")
+    ]
+    assert expand_inputs([str(tmp_path / "*.log"), str(tmp_path / "a.log")]) == [
+        str(tmp_path / "a.log"),
+        str(tmp_path / "b.log"),
+    ]
+    assert expand_inputs(["-"]) == ["-"]
+
+    with pytest.raises(ValueError):
+        expand_inputs([str(tmp_path / "*.gz")])
+
+
+def test_parse_arguments_multiple_inputs(tmp_path):
+    """Test that several inputs default to one worker per CPU."""
+    _host_log(tmp_path / "a.log", [1], 1)
+    _host_log(tmp_path / "b.log", [2], 2)
+
+    args = parse_arguments(["-i", str(tmp_path / "*.log"), "-o", "out.json"])
+    assert args.input_paths == [str(tmp_path / "a.log"), str(tmp_path / "b.log")]
+    assert args.workers >= 1
+
+    single = parse_arguments(["-i", str(tmp_path / "a.log"), "-o", "out.json"])
+    assert single.input_path == str(tmp_path / "a.log") and single.workers == 1
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", str(tmp_path), "-o", "out.json", "--resume"])
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", str(tmp_path / "a.log"), "-", "-o", "out.json"])
+
+
+def test_report_log_files_merge_by_timestamp(tmp_path):
+    """Test the k-way merge of per-file streams and the report it feeds."""
+    _host_log(tmp_path / "a.log", [1, 4, 5], 1)
+    _host_log(tmp_path / "b.log", [2, 3, 4, 6], 2)
+    paths = [str(tmp_path / "a.log"), str(tmp_path / "b.log")]
+
+    merged = list(merge_by_timestamp(iter_log_file(path) for path in paths))
+    assert [(r.timestamp % 60, r.user_id) for r in merged] == [
+        (1, 1),
+        (2, 2),
+        (3, 2),
+        (4, 1),
+        (4, 2),
+        (5, 1),
+        (6, 2),
+    ]
+
+    output = tmp_path / "report.json"
+    stats = ScanStats()
+    args = parse_arguments(["-i", *paths, "-o", str(output), "-w", "2"])
+    writer = parser_module._report_log_files(args, stats)
+
+    assert writer.total_errors == 7 and stats.total_lines == 7
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert [e["user_id"] for e in report["errors"]] == [r.user_id for r in merged]
+
+
+def test_main_multiple_inputs_report(tmp_path, monkeypatch):
+    """Test the merged report with per-file and combined summaries."""
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    _host_log(logs / "a.log", [1, 4], 1)
+    _host_log(logs / "b.log", [2], 2)
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(logs), "-o", str(output), "-w", "2"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    main()
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert [e["timestamp"][-2:] for e in report["errors"]] == ["01", "02", "04"]
+    assert report["summary"] == {
+        "total_errors": 3,
+        "unique_affected_users": 2,
+        "files": {
+            str(logs / "a.log"): {"total_errors": 2, "unique_affected_users": 1},
+            str(logs / "b.log"): {"total_errors": 1, "unique_affected_users": 1},
+        },
+    }
+
+
+def test_main_multiple_compressed_inputs(tmp_path, monkeypatch):
+    """Test that compressed inputs, parsed whole by pool workers, merge into
+    the same report as when parsed in one process."""
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    for name, seconds, user_id in [("a", [1, 4], 1), ("b", [2, 5], 2), ("c", [3], 3)]:
+        _host_log(logs / f"{name}.log", seconds, user_id)
+    for name in ("a", "b"):
+        plain = logs / f"{name}.log"
+        (logs / f"{name}.log.gz").write_bytes(gzip.compress(plain.read_bytes()))
+        plain.unlink()
+
+    reports = []
+    for workers in ("1", "3"):
+        output = tmp_path / f"report{workers}.json"
+        argv = ["parser.py", "-i", str(logs), "-o", str(output), "-w", workers]
+        monkeypatch.setattr(sys, "argv", argv)
+        main()
+        reports.append(json.loads(output.read_text(encoding="utf-8")))
+
+    assert reports[0] == reports[1]
+    assert [e["user_id"] for e in reports[1]["errors"]] == [1, 2, 3, 1, 2]
+    assert reports[1]["summary"]["files"][str(logs / "b.log.gz")] == {
+        "total_errors": 2,
+        "unique_affected_users": 1,
+    }
+
+
+@pytest.mark.parametrize("pattern", ["logs/*.log", "logs"])
+def test_main_single_expanded_input(tmp_path, monkeypatch, pattern):
+    """Test that a glob or directory holding one file is parsed as that file."""
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    _host_log(logs / "a.log", [1, 4], 1)
+    output = tmp_path / "report.json"
+    argv = ["parser.py", "-i", str(tmp_path / pattern), "-o", str(output)]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    main()
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert [e["timestamp"][-2:] for e in report["errors"]] == ["01", "04"]
+    assert "files" not in report["summary"]
+
+
+def test_main_multiple_inputs_missing_file(tmp_path, monkeypatch, capsys):
+    """Test that a missing file among several inputs is reported by name."""
+    _host_log(tmp_path / "a.log", [1], 1)
+    missing = str(tmp_path / "missing.log")
+    argv = ["parser.py", "-i", str(tmp_path / "a.log"), missing, "-o", "out.json"]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    with pytest.raises(SystemExit):
+        main()
+    assert f"File '{missing}' not found" in capsys.readouterr().out
+
+
+# --- TEST: --profile ---
+
+
+def test_timed_scanner_matches_plain_scanner(tmp_path):
+    """Test that a profiled scan yields the same records and counters."""
+    lines = [
+        b"[2025-12-16 10:00:00] | INFO | [Svc] | r1 | ok | {}",
+        b'[2025-12-16 10:00:01] | ERROR | [Svc] | r2 | boom | {"user_id": 7}',
+        b'[2025-12-16 10:00:02] | ERROR | [Svc] | r3 | a | b | {"user_id": 8}',
+        b"[2025-12-16 10:00:03] | ERROR | [Svc] | r4 | bad | {nope}",
+        b'[2025-12-16 10:00:04] | ERROR | [Sv\xff] | r5 | bin | {"user_id": 9}',
+        b'[2025-12-17 00:00:00] | ERROR | [Svc] | r6 | late | {"user_id": 1}',
+        b"garbage",
+    ]
+    plain_stats = ScanStats()
+    plain = list(
+        parser_module.iter_errors(lines, None, "2025-12-16 23:59:59", None, plain_stats)
+    )
+    timed_stats = ScanStats(timings=StageTimings())
+    timed = list(
+        parser_module.iter_errors(lines, None, "2025-12-16 23:59:59", None, timed_stats)
+    )
+
+    assert timed == plain and len(plain) == 2
+    assert (timed_stats.total_lines, timed_stats.malformed_lines) == (
+        plain_stats.total_lines,
+        plain_stats.malformed_lines,
+    )
+    assert timed_stats.timings.bytes == sum(len(line) + 1 for line in lines)
+    assert timed_stats.timings.seconds["match"] > 0
+
+
+def test_parse_arguments_profile():
+    """Test the default stats path and that --cprofile implies --profile."""
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--profile"])
+    assert args.profile_path == "out.json.profile.json"
+
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--cprofile", "p.prof"])
+    assert args.profile_path == "out.json.profile.json"
+
+    assert parse_arguments(["-i", "in.log", "-o", "out.json"]).profile_path is None
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_main_profile(tmp_path, monkeypatch, sample_log_line_error, workers):
+    """Test that --profile leaves the report unchanged and writes stage stats."""
+    log_file = tmp_path / "test.log"
+    log_file.write_text(
+        f"{sample_log_line_error}\nInvalid Line\n" * 50, encoding="utf-8"
+    )
+    plain = tmp_path / "plain.json"
+    profiled = tmp_path / "profiled.json"
+    stats_file = tmp_path / "stats.json"
+
+    monkeypatch.setattr(sys, "argv", ["p", "-i", str(log_file), "-o", str(plain)])
+    main()
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["p", "-i", str(log_file), "-o", str(profiled), "-w", workers]
+        + ["--profile", str(stats_file)],
+    )
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 1024)
+    main()
+
+    assert profiled.read_text() == plain.read_text()
+    stats = json.loads(stats_file.read_text(encoding="utf-8"))
+    assert stats["total_lines"] == 100
+    assert stats["malformed_lines"] == 50
+    assert stats["total_errors"] == 50
+    assert stats["bytes"] == log_file.stat().st_size
+    assert stats["stages"]["json"]["seconds"] > 0
+    assert stats["stages"]["write"]["seconds"] > 0
+
+
+# --- TEST: --filter ---
+
+
+FILTER_LINES = [
+    b'[2024-05-01 10:00:00] | INFO | [auth-service] | req-001 | ok | {"user_id": 101}',
+    b"[2024-05-01 10:00:01] | WARN | [risk-engine] | req-002 | slow | "
+    b'{"latency_ms": 2500}',
+    b"[2024-05-01 10:00:02] | WARN | [risk-engine] | req-003 | slow | "
+    b'{"latency_ms": 1500}',
+    b"[2024-05-01 10:00:03] | ERROR | [payment-service] | req-004 | boom | "
+    b'{"user_id": 102}',
+    b"[2024-05-01 10:00:04] | WARN | [risk | engine] | req-005 | odd | "
+    b'{"latency_ms": 9000}',
+    b"[2024-05-01 10:00:05] | WARN | [risk-engine] | req-006 | bad | "
+    b'{"latency_ms": oops}',
+    b"garbage",
+]
+
+
+@pytest.mark.parametrize("timed", [False, True])
+def test_scanner_filter(timed):
+    """Test metadata, regex-fallback and request_id filters, timed or not."""
+
+    def run(expression):
+        stats = ScanStats(timings=StageTimings() if timed else None)
+        records = list(
+            parser_module.iter_errors(FILTER_LINES, stats=stats, filter_expr=expression)
+        )
+        return [r["message"] for r in records], stats.malformed_lines
+
+    assert run("level == ERROR") == (["boom"], 1)
+    assert run("level == WARN and metadata.latency_ms > 2000") == (
+        ["slow", "odd"],
+        2,
+    )
+    assert run("service == 'risk | engine'") == (["odd"], 1)
+    assert run("request_id == req-003") == (["slow"], 1)
+
+
+def test_default_filter_matches_error_report(tmp_path):
+    """Test that an explicit 'level == ERROR' filter gives the default records."""
+    log_file = tmp_path / "test.log"
+    log_file.write_bytes(b"\n".join(FILTER_LINES) + b"\n")
+
+    default = process_log_file(str(log_file))
+
+    assert [e["message"] for e in default] == ["boom"]
+    assert process_log_file(str(log_file), filter_expr="level == ERROR") == default
+
+
+def test_main_filter_report(tmp_path, monkeypatch):
+    """Test a --filter run across workers, with and without the index."""
+    log_file = tmp_path / "test.log"
+    log_file.write_bytes(b"\n".join(FILTER_LINES * 20) + b"\n")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 512)
+    expression = "level in {WARN, ERROR} and (metadata.user_id > 0 or message ~ odd)"
+
+    reports = []
+    for extra in (["-w", "1"], ["-w", "3"], ["--index"], ["--index", "-w", "2"]):
+        output = tmp_path / f"report{len(reports)}.json"
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["p", "-i", str(log_file), "-o", str(output), "--filter", expression]
+            + extra,
+        )
+        main()
+        reports.append(json.loads(output.read_text(encoding="utf-8")))
+
+    assert all(report == reports[0] for report in reports)
+    assert reports[0]["summary"]["total_errors"] == 40
+
+
+def test_parse_arguments_filter(capsys):
+    """Test the --filter default and that bad expressions are rejected."""
+    args = parse_arguments(["-i", "in.log", "-o", "out.json"])
+    assert args.filter_expr == "level == ERROR"
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", "in.log", "-o", "out.json", "--filter", "level =="])
+    assert "--filter: expected a value" in capsys.readouterr().err
+
+
+# --- TEST: --context ---
+
+CONTEXT_LINES = [
+    b"[2024-05-01 10:00:00] | INFO | [gateway] | req-1 | Received | {}",
+    b"[2024-05-01 10:00:01] | DEBUG | [gateway] | req-2 | Received | {}",
+    b"[2024-05-01 10:00:02] | WARN | [payment] | req-1 | Slow card check | {}",
+    b'[2024-05-01 10:00:03] | ERROR | [payment] | req-1 | Timeout | {"user_id": 7}',
+    b"[2024-05-01 10:00:04] | INFO | [gateway] | req-1 | Responded | {}",
+    b"not a log line",
+    b'[2024-05-01 10:00:05] | ERROR | [auth] | req-2 | Bad token | {"user_id": 8}',
+]
+
+
+def test_main_context_report(tmp_path, monkeypatch):
+    """Test that --context attaches the earlier lines of each failing request."""
+    log_file = tmp_path / "test.log"
+    lines = [
+        line.replace(b"10:00:", b"10:%02d:" % minute)
+        for minute in range(10)
+        for line in CONTEXT_LINES
+    ]
+    log_file.write_bytes(b"\n".join(lines) + b"\n")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 256)
+
+    reports = []
+    for workers in ("1", "3"):
+        output = tmp_path / f"report{workers}.json"
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["p", "-i", str(log_file), "-o", str(output), "--context", "2"]
+            + ["-w", workers],
+        )
+        main()
+        reports.append(json.loads(output.read_text(encoding="utf-8")))
+
+    assert reports[0] == reports[1]
+    errors = reports[0]["errors"]
+    assert len(errors) == 20
+    assert errors[0]["request_id"] == "req-1"
+    assert errors[0]["context"] == [lines[0].decode(), lines[2].decode()]
+    # Later occurrences see the whole history of the ID, capped at N lines.
+    assert errors[2]["context"] == [lines[7].decode(), lines[9].decode()]
+    assert errors[1]["context"] == [lines[1].decode()]
+
+
+def test_main_context_report_jsonl(tmp_path, monkeypatch):
+    """Test that --context reads lines back in the format they were scanned in."""
+    log_file = tmp_path / "test.log"
+    lines = [
+        json.dumps(
+            {
+                "timestamp": f"2024-05-01T10:00:0{second}Z",
+                "level": level,
+                "service": "payment",
+                "request_id": request_id,
+                "message": message,
+            }
+        ).encode()
+        for second, level, request_id, message in [
+            (0, "info", "req-1", "Received"),
+            (1, "info", "req-2", "Received"),
+            (2, "error", "req-1", "Timeout"),
+        ]
+    ]
+    log_file.write_bytes(b"\n".join(lines) + b"\n")
+    output = tmp_path / "report.json"
+    monkeypatch.setattr(
+        sys, "argv", ["p", "-i", str(log_file), "-o", str(output), "--context", "2"]
+    )
+    main()
+
+    errors = json.loads(output.read_text(encoding="utf-8"))["errors"]
+    assert [e["context"] for e in errors] == [[lines[0].decode()]]
+
+
+def test_main_context_report_without_request_ids(tmp_path, monkeypatch):
+    """Test that lines of a format with no request_id field are not grouped
+    under an empty ID by --context."""
+    lines = [
+        f'10.0.0.1 - - [01/May/2024:10:00:0{i} +0000] "GET /a{i} HTTP/1.1" {status} 1 '
+        '"-" "curl"'
+        for i, status in enumerate([200, 200, 500])
+    ]
+    log_file = tmp_path / "access.log"
+    log_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    output = tmp_path / "report.json"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["p", "-i", str(log_file), "-o", str(output), "--context", "2"]
+        + ["--log-format", "nginx"],
+    )
+    main()
+
+    errors = json.loads(output.read_text(encoding="utf-8"))["errors"]
+    assert [e["message"] for e in errors] == ["GET /a2 HTTP/1.1"]
+    assert errors[0]["context"] == [] and "request_id" not in errors[0]
+
+
+def test_default_report_has_no_request_id(tmp_path, monkeypatch):
+    """Test that records only carry request IDs and context with --context."""
+    log_file = tmp_path / "test.log"
+    log_file.write_bytes(b"\n".join(CONTEXT_LINES) + b"\n")
+    output = tmp_path / "report.json"
+    monkeypatch.setattr(sys, "argv", ["p", "-i", str(log_file), "-o", str(output)])
+    main()
+
+    errors = json.loads(output.read_text(encoding="utf-8"))["errors"]
+    assert all("request_id" not in e and "context" not in e for e in errors)
+
+
+@pytest.mark.parametrize(
+    "extra",
+    [["-i", "a.log", "b.log"], ["-i", "-"], ["-i", "a.log", "--resume"]],
+)
+def test_parse_arguments_context_needs_one_file(extra, capsys):
+    """Test that --context is rejected where the input cannot be re-read."""
+    with pytest.raises(SystemExit):
+        parse_arguments(["-o", "out.json", "--context", "3"] + extra)
+    assert "--context needs a single" in capsys.readouterr().err
+
+
+# --- TEST: --rollups ---
+
+
+def test_main_rollups_report(tmp_path, monkeypatch):
+    """Test rollups and latency in one pass, alike across workers and files."""
+    lines = []
+    for minute in range(30):
+        lines.append(
+            f"[2024-05-01 10:{minute:02d}:00] | ERROR | [payment] | r{minute} | "
+            f'Timeout | {{"user_id": {minute}}}'
+        )
+        lines.append(
+            f"[2024-05-01 10:{minute:02d}:30] | WARN | [risk-engine] | r{minute} | "
+            f'High latency detected | {{"latency_ms": {1000 + minute}}}'
+        )
+    log_file = tmp_path / "test.log"
+    log_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    (tmp_path / "a.log").write_text("\n".join(lines[:30]) + "\n", encoding="utf-8")
+    (tmp_path / "b.log").write_text("\n".join(lines[30:]) + "\n", encoding="utf-8")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 512)
+
+    summaries = []
+    for inputs in (
+        [str(log_file)],
+        [str(log_file), "-w", "3"],
+        [str(tmp_path / "a.log"), str(tmp_path / "b.log")],
+    ):
+        output = tmp_path / f"report{len(summaries)}.json"
+        monkeypatch.setattr(
+            sys, "argv", ["p", "-i", *inputs, "-o", str(output), "--rollups"]
+        )
+        main()
+        summary = json.loads(output.read_text(encoding="utf-8"))["summary"]
+        summary.pop("files", None)
+        summaries.append(summary)
+
+    assert all(summary == summaries[0] for summary in summaries)
+    rollups = summaries[0]["rollups"]
+    assert rollups["hours"] == [
+        {
+            "hour": "2024-05-01 10",
+            "errors": 30,
+            "services": {"payment": 30},
+            "messages": {"Timeout": 30},
+        }
+    ]
+    assert len(rollups["minutes"]) == 30 and rollups["spikes"] == []
+    latency = summaries[0]["latency"]["services"]["risk-engine"]
+    assert (latency["count"], latency["min"], latency["max"]) == (30, 1000, 1029)
+    assert latency["p50"] == pytest.approx(1014.5, rel=0.01)
+
+
+# --- TEST: --approx ---
+
+
+def test_main_approx_report(tmp_path, monkeypatch):
+    """Test that --approx reports estimates, alike across workers."""
+    lines = [
+        f"[2024-05-01 10:00:{i % 60:02d}] | ERROR | [payment] | r{i} | "
+        f'{"Timeout" if i % 3 else "Declined"} | {{"user_id": {i % 40}}}'
+        for i in range(300)
+    ]
+    log_file = tmp_path / "test.log"
+    log_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 1024)
+
+    summaries = []
+    for workers in ("1", "3"):
+        output = tmp_path / f"report{workers}.json"
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["p", "-i", str(log_file), "-o", str(output), "--approx", "-w", workers],
+        )
+        main()
+        summaries.append(json.loads(output.read_text(encoding="utf-8"))["summary"])
+
+    assert summaries[0] == summaries[1]
+    assert summaries[0]["unique_affected_users"] == 40
+    approximate = summaries[0]["approximate"]
+    assert approximate["error"] == 0.01
+    assert approximate["top_messages"] == [
+        {"message": "Timeout", "count": 200},
+        {"message": "Declined", "count": 100},
+    ]
+
+
+def test_parse_arguments_approx(capsys):
+    """Test the --approx default error and that bad bounds are rejected."""
+    args = parse_arguments(["-i", "in.log", "-o", "out.json"])
+    assert args.approx_error is None
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--approx"])
+    assert args.approx_error == 0.01
+    args = parse_arguments(["-i", "in.log", "-o", "out.json", "--approx", "0.05"])
+    assert args.approx_error == 0.05
+
+    with pytest.raises(SystemExit):
+        parse_arguments(["-i", "in.log", "-o", "out.json", "--approx", "1.5"])
+    assert "expected a number in (0, 1)" in capsys.readouterr().err
+
+
+# --- TEST: --templates ---
+
+
+def test_main_templates_report(tmp_path, monkeypatch, capsys):
+    """Test that --templates groups messages with IDs, alike across workers."""
+    lines = [
+        f"[2024-05-01 10:00:{i % 60:02d}] | ERROR | [payment] | r{i} | "
+        + (f"Order {1000 + i} declined" if i % 3 else "Timeout")
+        + f' | {{"user_id": {i % 40}}}'
+        for i in range(300)
+    ]
+    log_file = tmp_path / "test.log"
+    log_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 1024)
+
+    summaries = []
+    for workers in ("1", "3"):
+        output = tmp_path / f"report{workers}.json"
+        argv = ["p", "-i", str(log_file), "-o", str(output), "--templates"]
+        monkeypatch.setattr(sys, "argv", argv + ["-v", "-w", workers])
+        main()
+        summaries.append(json.loads(output.read_text(encoding="utf-8"))["summary"])
+
+    assert summaries[0] == summaries[1]
+    assert summaries[0]["templates"] == {
+        "distinct": 2,
+        "top": [
+            {
+                "template": "Order <*> declined",
+                "count": 200,
+                "examples": [["1001"], ["1002"], ["1004"]],
+            },
+            {"template": "Timeout", "count": 100, "examples": []},
+        ],
+    }
+    assert " - Order <*> declined (200 occurrences)" in capsys.readouterr().out
+
+
+# --- TEST: log formats ---
+
+
+def test_main_detects_nginx_format(tmp_path, monkeypatch):
+    """Test that an nginx access log is detected and reported, alike across
+    workers and with the format named."""
+    lines = [
+        f"10.0.0.{i % 5} - - [01/May/2024:10:00:{i % 60:02d} +0000] "
+        f'"GET /pay/{i % 3} HTTP/1.1" {503 if i % 4 == 0 else 200} {i} "-" "curl"'
+        for i in range(120)
+    ]
+    log_file = tmp_path / "access.log"
+    log_file.write_text("\n".join(lines) + "\nbroken\n", encoding="utf-8")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 1024)
+
+    reports = []
+    for extra in (["-w", "1"], ["-w", "3"], ["--log-format", "nginx"]):
+        output = tmp_path / "report.json"
+        monkeypatch.setattr(
+            sys, "argv", ["p", "-i", str(log_file), "-o", str(output), *extra]
+        )
+        main()
+        reports.append(json.loads(output.read_text(encoding="utf-8")))
+
+    assert reports[0] == reports[1] == reports[2]
+    errors = reports[0]["errors"]
+    assert len(errors) == 30
+    assert errors[0] == {
+        "timestamp": "2024-05-01 10:00:00",
+        "service": "nginx",
+        "message": "GET /pay/0 HTTP/1.1",
+        "user_id": None,
+    }
+
+    stats = ScanStats()
+    records = list(
+        iter_log_file(str(log_file), stats=stats, filter_expr="metadata.status == 503")
+    )
+    assert [record.message for record in records[:2]] == [
+        "GET /pay/0 HTTP/1.1",
+        "GET /pay/1 HTTP/1.1",
+    ]
+    assert (stats.total_lines, stats.malformed_lines) == (121, 1)
+
+
+# --- TEST: parse cache ---
+
+
+def test_main_reuses_cached_parse(tmp_path, monkeypatch):
+    """Test that a rerun on an unchanged file reuses the cached parse."""
+    lines = [
+        f"[2024-05-01 10:00:{i % 60:02d}] | ERROR | [payment] | r{i} | "
+        f'Timeout | {{"user_id": {i % 7}}}'
+        for i in range(50)
+    ]
+    log_file = tmp_path / "test.log"
+    log_file.write_text("\n".join(lines) + "\nbroken\n", encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr("parse_cache.CACHE_MIN_SIZE", 0)
+
+    def run(name, *extra):
+        output = tmp_path / name
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            ["p", "-i", str(log_file), "-o", str(output), "--cache-dir", str(cache_dir)]
+            + list(extra),
+        )
+        main()
+        return output.read_text(encoding="utf-8")
+
+    first = run("first.json")
+    assert len(os.listdir(cache_dir)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("parsed a cached file")
+
+    monkeypatch.setattr(parser_module, "iter_log_file", fail)
+    assert run("second.json") == first
+    assert run("other.csv", "-f", "csv").count("Timeout") == 50
+
+    # Another filter or --index is another entry; --no-cache always parses.
+    with pytest.raises(AssertionError):
+        run("warn.json", "--filter", "level == WARN")
+    with pytest.raises(AssertionError):
+        run("indexed.json", "--index")
+    with pytest.raises(AssertionError):
+        run("uncached.json", "--no-cache")
+
+
+def test_main_skips_caching_many_errors(tmp_path, monkeypatch):
+    """Test that a parse with more errors than an entry holds is streamed
+    into the report without being cached."""
+    log_file = tmp_path / "test.log"
+    log_file.write_text(
+        "".join(
+            f"[2024-05-01 10:00:{i:02d}] | ERROR | [payment] | r{i} | Timeout | {{}}\n"
+            for i in range(50)
+        ),
+        encoding="utf-8",
+    )
+    cache_dir = tmp_path / "cache"
+    output = tmp_path / "report.json"
+    monkeypatch.setattr("parse_cache.CACHE_MIN_SIZE", 0)
+    monkeypatch.setattr("parse_cache.CACHE_MAX_RECORDS", 10)
+    argv = ["p", "-i", str(log_file), "-o", str(output), "--cache-dir", str(cache_dir)]
+    monkeypatch.setattr(sys, "argv", argv)
+
+    main()
+
+    assert json.loads(output.read_text(encoding="utf-8"))["summary"] == {
+        "total_errors": 50,
+        "unique_affected_users": 0,
+    }
+    assert not cache_dir.exists() or not os.listdir(cache_dir)
+
+
+# --- TEST: --line-counts ---
+
+
+def test_main_line_counts_report(tmp_path, monkeypatch):
+    """Test line counts over all well-formed lines, alike across workers."""
+    lines = [
+        f"[2024-05-01 10:{i % 60:02d}:00] | {('INFO', 'WARN', 'ERROR')[i % 3]} | "
+        f'[{("auth", "payment")[i % 2]}] | r{i} | Msg | {{"user_id": {i}}}'
+        for i in range(120)
+    ] + ["not a log line"]
+    log_file = tmp_path / "test.log"
+    log_file.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    (tmp_path / "a.log").write_text("\n".join(lines[:60]) + "\n", encoding="utf-8")
+    (tmp_path / "b.log").write_text("\n".join(lines[60:]) + "\n", encoding="utf-8")
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 1024)
+
+    summaries = []
+    for inputs in (
+        [str(log_file)],
+        [str(log_file), "-w", "3"],
+        [str(tmp_path / "a.log"), str(tmp_path / "b.log")],
+    ):
+        output = tmp_path / f"report{len(summaries)}.json"
+        monkeypatch.setattr(
+            sys, "argv", ["p", "-i", *inputs, "-o", str(output), "--line-counts"]
+        )
+        main()
+        summary = json.loads(output.read_text(encoding="utf-8"))["summary"]
+        summaries.append((summary["lines_by_level"], summary["lines_by_service"]))
+
+    assert all(summary == summaries[0] for summary in summaries)
+    assert summaries[0] == (
+        {"ERROR": 40, "INFO": 40, "WARN": 40},
+        {"auth": 60, "payment": 60},
+    )
+
+    # Like the report, the counts only cover the time window.
+    output = tmp_path / "window.json"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["p", "-i", str(log_file), "-o", str(output), "--line-counts"]
+        + ["--start-date", "2024-05-01 10:30", "--end-date", "2024-05-01 10:39:59"],
+    )
+    main()
+    summary = json.loads(output.read_text(encoding="utf-8"))["summary"]
+    assert summary["lines_by_level"] == {"INFO": 8, "ERROR": 6, "WARN": 6}
+
+
+def test_iter_log_file_custom_aggregator(tmp_path, monkeypatch):
+    """Test that a custom aggregator sees every line, across chunk workers."""
+    log_file = tmp_path / "test.log"
+    log_file.write_text(
+        "".join(
+            f"[2024-05-01 10:00:{i:02d}] | INFO | [auth] | r{i} | Msg | {{}}\n"
+            for i in range(50)
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(parser_module, "MAX_CHUNK_SIZE", 512)
+
+    for workers in (1, 3):
+        requests = _RequestIds()
+        stats = ScanStats(aggregators=[requests])
+        assert list(iter_log_file(str(log_file), workers, stats=stats)) == []
+        assert requests.summary() == 50
@@ -0,0 +1,53 @@
+import json
+import pstats
+
+from profiling import STAGES, Profiler, StageTimings, profile_path_for
+
+
+# --- TEST: StageTimings ---
+
+
+def test_stage_timings_merge():
+    """Test that stage seconds and bytes add up across merges."""
+    timings = StageTimings()
+    timings.add("read", 1.5)
+    other = StageTimings()
+    other.add("read", 0.5)
+    other.add("write", 2.0)
+    other.bytes = 10
+
+    timings.merge(other)
+
+    assert list(timings.seconds) == list(STAGES)
+    assert timings.seconds["read"] == 2.0
+    assert timings.seconds["write"] == 2.0
+    assert timings.bytes == 10
+
+
+# --- TEST: Profiler ---
+
+
+def test_profiler_writes_stats_file(tmp_path):
+    """Test the stats file with its throughput, stages and optional dumps."""
+    stats_path = tmp_path / "report.json.profile.json"
+    cprofile_path = tmp_path / "run.prof"
+    profiler = Profiler(str(stats_path), str(cprofile_path), trace_memory=True)
+
+    profiler.start()
+    profiler.timings.add("match", 0.25)
+    profiler.timings.add("write", 0.75)
+    profiler.timings.bytes = 2048
+    data = profiler.stop(total_lines=100, malformed_lines=3, total_errors=7)
+
+    assert json.loads(stats_path.read_text(encoding="utf-8")) == data
+    assert data["total_lines"] == 100 and data["bytes"] == 2048
+    assert data["lines_per_sec"] > 0
+    assert data["stages"]["match"] == {"seconds": 0.25, "share": 0.25}
+    assert data["tracemalloc"]["peak_mb"] >= 0
+    assert data["cprofile"] == str(cprofile_path)
+    pstats.Stats(str(cprofile_path))
+
+
+def test_profile_path_for():
+    """Test the default stats file name next to the report."""
+    assert profile_path_for("out/report.json") == "out/report.json.profile.json"
@@ -0,0 +1,130 @@
+import pickle
+from array import array
+
+import pytest
+
+from records import ErrorBatch, ErrorRecord, as_dict
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def records():
+    """Returns error records with repeated values and odd user IDs."""
+    return [
+        ErrorRecord("t1", "S1", "Err A", 1),
+        ErrorRecord("t1", "S1", "Err B", None),
+        ErrorRecord("t2", "S2", "Err A", True),
+        ErrorRecord("t3", "S1", "Err A", "u-1"),
+        ErrorRecord("t3", "S2", "Err C", [1, 2]),
+        ErrorRecord("t4", "S1", "Err A", 1),
+    ]
+
+
+# --- TEST: ErrorRecord ---
+
+
+def test_error_record_dict_style_access():
+    """Test that records keep the dict-style access of the old format."""
+    record = ErrorRecord("t1", "S1", "Err A", 7)
+
+    assert record["message"] == "Err A"
+    assert record[3] == 7
+    assert record.user_id == 7
+    assert as_dict(record) == {
+        "timestamp": "t1",
+        "service": "S1",
+        "message": "Err A",
+        "user_id": 7,
+    }
+    assert as_dict({"a": 1}) == {"a": 1}
+
+
+# --- TEST: ErrorBatch ---
+
+
+def test_error_batch_round_trip(records):
+    """Test that a batch gives back exactly the records it was built from."""
+    batch = ErrorBatch.from_records(records)
+
+    assert len(batch) == 6
+    assert list(batch) == records
+    assert batch[4] == records[4]
+    assert type(batch[2].user_id) is bool
+    assert batch.tables["message"] == ["Err A", "Err B", "Err C"]
+
+
+def test_error_batch_accepts_dicts(records):
+    """Test that dict records (e.g. read back from a report) can be added."""
+    batch = ErrorBatch.from_records(as_dict(r) for r in records[:2])
+    batch.extend(ErrorBatch.from_records(records[2:]))
+
+    assert list(batch) == records
+
+
+def test_error_batch_append_batch(records):
+    """Test that appending a batch re-encodes its codes into this batch."""
+    batch = ErrorBatch.from_records(records[3:])
+    batch.append_batch(ErrorBatch.from_records(records[:3]))
+
+    assert list(batch) == records[3:] + records[:3]
+    assert batch.tables["user_id"] == ["u-1", [1, 2], 1, None, True]
+    assert batch.tables["message"] == ["Err A", "Err C", "Err B"]
+
+
+def test_error_batch_value_counts(records):
+    """Test counting on encoded columns, in order of first appearance."""
+    batch = ErrorBatch.from_records(records)
+
+    assert list(batch.value_counts("message").items()) == [
+        ("Err A", 4),
+        ("Err B", 1),
+        ("Err C", 1),
+    ]
+    users = batch.value_counts("user_id", skip_none=True)
+    # 1 and True are the same Counter key, exactly as with a plain Counter.
+    assert users[1] == 3
+    assert users["[1, 2]"] == 1
+    assert None not in users
+
+
+def test_error_batch_epoch_timestamps():
+    """Test that timestamps are stored as epoch seconds, text read back from
+    a report included, and that text which does not decode is kept."""
+    batch = ErrorBatch.from_records(
+        [
+            ErrorRecord(1714557601, "S1", "Err A", 1),
+            {
+                "timestamp": "2024-05-01 10:00:00",
+                "service": "S1",
+                "message": "Err A",
+                "user_id": 1,
+            },
+            ErrorRecord("t1", "S2", "Err B", None),
+        ]
+    )
+    batch.append_batch(ErrorBatch.from_records([ErrorRecord("t2", "S2", "E", 2)]))
+
+    assert batch.timestamps[:2] == array("q", [1714557601, 1714557600])
+    assert batch.timestamp_texts == ["t1", "t2"]
+    assert [record.timestamp for record in batch] == [
+        1714557601,
+        1714557600,
+        "t1",
+        "t2",
+    ]
+    assert batch[3].timestamp == "t2"
+    assert batch.timestamp_range() == (1714557600, 1714557601)
+    assert list(batch.value_counts("timestamp")) == [1714557601, 1714557600, "t1", "t2"]
+    assert as_dict(batch[0])["timestamp"] == "2024-05-01 10:00:01"
+    assert (
+        ErrorBatch.from_records([ErrorRecord("t1", "S", "E", 1)]).timestamp_range()
+        is None
+    )
+
+
+def test_error_batch_pickles(records):
+    """Test that batches survive the trip to and from a worker process."""
+    batch = ErrorBatch.from_records(records)
+    assert list(pickle.loads(pickle.dumps(batch))) == records
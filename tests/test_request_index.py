@@ -0,0 +1,81 @@
+from array import array
+
+from records import ErrorRecord
+from request_index import RequestIndex, RequestIndexBuilder, request_key
+
+LINES = [
+    b"[2024-05-01 10:00:00] | INFO | [gateway] | req-1 | Received | {}",
+    b"[2024-05-01 10:00:01] | INFO | [gateway] | req-2 | Received | {}",
+    b"[2024-05-01 10:00:02] | WARN | [payment] | req-1 | Retrying | {}",
+    b"[2024-05-01 10:00:03] | ERROR | [payment] | req-1 | Timeout | {}",
+    b"[2024-05-01 10:00:04] | INFO | [gateway] | req-1 | Responded | {}",
+]
+
+
+def _build(tmp_path, split=2):
+    """Index LINES as two builder parts, the way chunked workers do."""
+    log_file = tmp_path / "server.log"
+    log_file.write_bytes(b"\n".join(LINES) + b"\n")
+    parts = []
+    position = 0
+    for chunk in (LINES[:split], LINES[split:]):
+        builder = RequestIndexBuilder(position)
+        for line in chunk:
+            builder.add(len(line) + 1, line.split(b" | ")[3])
+        position = builder.position
+        parts.append(builder.finish())
+    return RequestIndex.from_parts(str(log_file), parts)
+
+
+# --- TEST: RequestIndex ---
+
+
+def test_builder_offsets():
+    """Test that offsets advance over lines without a request ID."""
+    builder = RequestIndexBuilder(10)
+    builder.add(5, b"a")
+    builder.add(7)
+    builder.add(3, b"b")
+
+    keys, offsets = builder.finish()
+    assert list(offsets) == [10, 22]
+    assert len(keys) == 2 and builder.position == 25
+
+
+def test_lines_in_file_order(tmp_path):
+    """Test that a lookup returns the request's lines across parts, in order."""
+    index = _build(tmp_path)
+    try:
+        assert len(index) == 5
+        assert list(index.lines("req-1")) == [LINES[0], LINES[2], LINES[3], LINES[4]]
+        assert list(index.lines("req-2")) == [LINES[1]]
+        assert list(index.lines("req-9")) == []
+    finally:
+        index.close()
+
+
+def test_lines_skip_hash_collisions(tmp_path):
+    """Test that lines whose ID only shares the hash are not returned."""
+    built = _build(tmp_path)
+    # Index every line under req-1's hash, as if all the IDs collided.
+    key = request_key(b"req-1")
+    index = RequestIndex.from_parts(
+        built.input_path, [(array("I", [key] * len(built)), sorted(built.offsets))]
+    )
+    try:
+        assert list(index.lines("req-1")) == [LINES[0], LINES[2], LINES[3], LINES[4]]
+        assert list(index.lines("req-2")) == []
+    finally:
+        index.close()
+
+
+def test_context_precedes_record(tmp_path):
+    """Test that context stops at the record's own line and keeps the last N."""
+    index = _build(tmp_path)
+    record = ErrorRecord("2024-05-01 10:00:03", "payment", "Timeout", None, "req-1")
+    try:
+        assert index.context(record, 5) == [LINES[0].decode(), LINES[2].decode()]
+        assert index.context(record, 1) == [LINES[2].decode()]
+        assert index.context(record._replace(request_id=None), 5) == []
+    finally:
+        index.close()
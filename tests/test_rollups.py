@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+from rollups import LatencyStats, QuantileSketch, TimeRollups, find_spikes
+
+
+def _minute(i):
+    return f"2024-05-01 {10 + i // 60:02d}:{i % 60:02d}"
+
+
+# --- TEST: QuantileSketch ---
+
+
+def test_sketch_quantiles_within_accuracy():
+    """Test that quantiles stay within 1% of the exact values."""
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6, 1) for _ in range(20000)]
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+
+    values.sort()
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+    assert (sketch.min, sketch.max) == (values[0], values[-1])
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_sketch_merge_equals_single_pass():
+    """Test that merged partial sketches equal one sketch over everything."""
+    whole, first, second = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for value in range(0, 1000, 3):
+        whole.add(value)
+        (first if value < 500 else second).add(value)
+    first.merge(second)
+
+    assert first.summary() == whole.summary()
+    assert first.summary()["min"] == 0
+
+
+def test_latency_ignores_non_numbers():
+    """Test that only numeric values of the key are summarised, per service."""
+    latency = LatencyStats()
+    latency.observe(b"risk", b'{"latency_ms": 120}')
+    latency.observe(b"risk", b'{"latency_ms": "slow"}')
+    latency.observe(b"risk", b'{"latency_ms": true}')
+    latency.observe(b"risk", b"[1, 2]")
+    latency.observe(b"risk", b"{broken")
+    latency.observe(b"auth", b'{"latency_ms": 3.5}')
+
+    summary = latency.summary()
+    assert list(summary["services"]) == ["auth", "risk"]
+    assert summary["services"]["risk"]["count"] == 1
+    assert summary["services"]["auth"]["p50"] == 3.5
+
+
+# --- TEST: TimeRollups ---
+
+
+def test_rollups_buckets_and_retention():
+    """Test hourly totals and that only the latest minutes are kept."""
+    rollups = TimeRollups(minutes=2, hours=2)
+    for i in range(70):
+        rollups.add(_minute(i), "svc", "Timeout")
+    rollups.add(_minute(0), "auth", "Bad token", 3)
+
+    summary = rollups.summary([])
+    assert [h["errors"] for h in summary["hours"]] == [63, 10]
+    assert summary["hours"][0]["services"] == {"svc": 60, "auth": 3}
+    assert [m["minute"] for m in summary["minutes"]] == [_minute(68), _minute(69)]
+    assert len(rollups.minutes) <= 4
+
+    for i in range(5):
+        rollups.add(_minute(60 * (i + 2)), "svc", "Timeout")
+    summary = rollups.summary([])
+    assert [h["hour"] for h in summary["hours"]] == [
+        _minute(300)[:13],
+        _minute(360)[:13],
+    ]
+    assert len(rollups.hours) <= 4
+
+
+def test_rollups_merge():
+    """Test that merged rollups equal rollups filled in one go."""
+    whole, first, second = TimeRollups(), TimeRollups(), TimeRollups()
+    for i in range(10):
+        whole.add(_minute(i), "svc", f"m{i % 3}")
+        (first if i % 2 else second).add(_minute(i), "svc", f"m{i % 3}")
+    first.merge(second)
+
+    assert first.summary([]) == whole.summary([])
+
+
+# --- TEST: find_spikes ---
+
+
+def test_find_spikes():
+    """Test that a burst over a steady baseline is flagged, noise is not."""
+    counts = {_minute(i): 20 + i % 3 for i in range(60)}
+    counts[_minute(45)] = 80
+    counts[_minute(50)] = 30
+
+    assert find_spikes(counts) == [
+        {"minute": _minute(45), "errors": 80, "baseline": 21.0}
+    ]
+
+
+def test_find_spikes_counts_quiet_minutes():
+    """Test that minutes without errors count as zeros in the baseline."""
+    counts = {_minute(i): 12 for i in range(20)}
+
+    assert find_spikes({**counts, _minute(20): 40}) == [
+        {"minute": _minute(20), "errors": 40, "baseline": 12.0}
+    ]
+    assert find_spikes({**counts, _minute(59): 40}) == [
+        {"minute": _minute(59), "errors": 40, "baseline": 4.07}
+    ]
+    assert find_spikes({_minute(0): 500}) == []
@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi.testclient import TestClient  # noqa: E402
+
+from service import LogStore, _parse_batch, create_app, parse_arguments  # noqa: E402
+
+LINES = [
+    "[2024-05-01 10:00:00] | ERROR | [payment-service] | req-1 | Timeout | "
+    '{"user_id": 101}',
+    '[2024-05-01 10:00:30] | INFO | [auth-service] | req-2 | Login | {"user_id": 102}',
+    "[2024-05-01 10:01:00] | ERROR | [auth-service] | req-3 | Bad token | "
+    '{"user_id": 102}',
+    "garbage",
+    "[2024-05-02 09:00:00] | ERROR | [payment-service] | req-4 | Timeout | "
+    '{"user_id": 103}',
+]
+BODY = ("\n".join(LINES) + "\n").encode("utf-8")
+
+
+# --- TEST: LogStore ---
+
+
+def test_parse_batch_counts_whole_lines():
+    """Test that a batch parses the same with or without a final newline."""
+    batch, stats = _parse_batch(BODY, "level == ERROR")
+    assert (len(batch), stats.total_lines, stats.malformed_lines) == (3, 5, 1)
+
+    batch, stats = _parse_batch(BODY.rstrip(b"\n"), "level == ERROR")
+    assert (len(batch), stats.total_lines) == (3, 5)
+
+    assert _parse_batch(b"", "level == ERROR")[1].total_lines == 0
+
+
+def test_parse_batch_log_formats():
+    """Test that a batch's format is detected or taken as named."""
+    body = (
+        b'{"timestamp": "2024-05-01T10:00:01Z", "level": "error", '
+        b'"service": "payment", "request_id": "r1", "message": "boom"}\n'
+        b'10.0.0.1 - - [01/May/2024:10:00:01 +0000] "GET /pay HTTP/1.1" 502 17 '
+        b'"-" "curl/8.0"\n'
+    )
+    batch, stats = _parse_batch(body * 2, "level == ERROR")
+    assert [r.message for r in batch] == ["boom", "boom"]
+    assert stats.malformed_lines == 2
+
+    batch, stats = _parse_batch(body, "level == ERROR", "nginx")
+    assert [r.service for r in batch] == ["nginx"]
+    assert stats.malformed_lines == 1
+
+
+def test_store_errors_and_retention():
+    """Test /errors conditions and that old records are dropped, not counts."""
+    store = LogStore(max_records=3)
+    for _ in range(2):
+        store.add(*_parse_batch(BODY, "level == ERROR"))
+
+    assert store.summary()["total_errors"] == 6
+    assert store.retained == 3
+    assert [e["message"] for e in store.errors(service="payment-service")] == [
+        "Timeout",
+        "Timeout",
+    ]
+    assert len(store.errors(since="2024-05-02 00:00:00")) == 1
+    assert len(store.errors(until="2024-05-01 10:00:59", limit=5)) == 1
+    assert store.errors(service="nope") == []
+
+
+# --- TEST: HTTP endpoints ---
+
+
+def test_service_ingest_and_queries():
+    """Test ingesting over HTTP and answering summary, errors and top-N."""
+    with TestClient(create_app()) as client:
+        response = client.post("/ingest", content=BODY)
+        assert response.json() == {"lines": 5, "malformed_lines": 1, "errors": 3}
+
+        summary = client.get("/summary").json()
+        assert summary["total_errors"] == 3
+        assert summary["unique_affected_users"] == 3
+        assert summary["errors_by_service"] == {"payment-service": 2, "auth-service": 1}
+        assert summary["peak_minute"] == {"minute": "2024-05-01 10:00", "errors": 1}
+
+        errors = client.get(
+            "/errors", params={"service": "payment-service", "since": "2024-05-02"}
+        ).json()
+        assert errors == [
+            {
+                "timestamp": "2024-05-02 09:00:00",
+                "service": "payment-service",
+                "message": "Timeout",
+                "user_id": 103,
+            }
+        ]
+
+        top = client.get("/top/messages", params={"n": 1}).json()
+        assert top == [{"value": "Timeout", "count": 2}]
+
+        assert client.get("/errors", params={"since": "yesterday"}).status_code == 422
+        assert client.get("/top/levels").status_code == 422
+        assert (
+            client.post("/ingest", params={"format": "csv"}, content=BODY).status_code
+            == 422
+        )
+        response = client.post("/ingest", params={"format": "pipe"}, content=BODY)
+        assert response.json()["errors"] == 3
+
+
+def test_service_follows_file(tmp_path):
+    """Test that a followed file is parsed and appended lines are picked up."""
+    log_file = tmp_path / "server.log"
+    log_file.write_text(LINES[0] + "\n", encoding="utf-8")
+
+    app = create_app(
+        [str(log_file)], "level == ERROR and service == payment-service", interval=0.05
+    )
+    with TestClient(app) as client:
+        _wait_for(client, 1)
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write("\n".join(LINES[1:]) + "\n" + LINES[0])
+        _wait_for(client, 2)
+        assert client.get("/summary").json()["total_lines"] == 5
+
+
+def test_service_follow_survives_unreadable_file(tmp_path):
+    """Test that a follow poll failing to read keeps polling and reports why."""
+    log_path = tmp_path / "server.log"
+    log_path.mkdir()
+
+    with TestClient(create_app([str(log_path)], interval=0.05)) as client:
+        errors = _wait_for_follow_errors(client, bool)
+        assert list(errors) == [str(log_path)]
+
+        log_path.rmdir()
+        log_path.write_text(LINES[0] + "\n", encoding="utf-8")
+        _wait_for_follow_errors(client, lambda errors: not errors)
+        assert client.get("/summary").json()["total_errors"] == 1
+
+
+def _wait_for_follow_errors(client, done):
+    deadline = time.monotonic() + 10
+    while not done(errors := client.get("/summary").json()["follow_errors"]):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return errors
+
+
+def _wait_for(client, total_errors):
+    deadline = time.monotonic() + 10
+    while client.get("/summary").json()["total_errors"] < total_errors:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_parse_arguments_rejects_bad_filter():
+    """Test that the service validates --filter like the CLI."""
+    assert parse_arguments([]).filter_expr == "level == ERROR"
+    with pytest.raises(SystemExit):
+        parse_arguments(["--filter", "level in"])
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from sketches import ApproxStats, HeavyHitters, HyperLogLog, stable_hash
+
+
+# --- TEST: HyperLogLog ---
+
+
+def test_hyperloglog_estimates_within_error():
+    """Test large and small cardinalities against the sketch's error bound."""
+    sketch = HyperLogLog.for_error(0.02)
+    sketch.update(range(200_000))
+    sketch.update(range(1000))  # duplicates do not count
+
+    assert sketch.precision == 12
+    assert sketch.estimate() == pytest.approx(200_000, rel=0.06)
+
+    small = HyperLogLog(10)
+    small.update(f"user-{i}" for i in range(50))
+    assert small.estimate() == pytest.approx(50, abs=1)
+    assert HyperLogLog().estimate() == 0
+
+
+def test_hyperloglog_merge_is_union():
+    """Test that merged sketches equal one sketch over both inputs."""
+    whole, first, second = HyperLogLog(8), HyperLogLog(8), HyperLogLog(8)
+    whole.update(range(3000))
+    first.update(range(2000))
+    second.update(range(1000, 3000))
+    first.merge(second)
+
+    assert first.registers == whole.registers
+    with pytest.raises(ValueError):
+        first.merge(HyperLogLog(9))
+
+
+def test_stable_hash_keeps_types_apart():
+    """Test that the hash is fixed across runs and tells 1 from '1'."""
+    assert stable_hash(1) != stable_hash("1")
+    assert stable_hash("user-1") == 0x5B879C3A9BC1B9F0
+
+
+# --- TEST: HeavyHitters ---
+
+
+def test_heavy_hitters_bounds():
+    """Test that counts are lower bounds within `error` and heavy values stay."""
+    rng = random.Random(1)
+    values = [
+        rng.choice("ab") if rng.random() < 0.5 else rng.randrange(1000)
+        for _ in range(20_000)
+    ]
+    exact = {}
+    for value in values:
+        exact[value] = exact.get(value, 0) + 1
+
+    summary = HeavyHitters.for_error(0.05)
+    for start in range(0, len(values), 3000):
+        batch = {}
+        for value in values[start : start + 3000]:
+            batch[value] = batch.get(value, 0) + 1
+        summary.update(batch)
+
+    assert len(summary.counts) <= summary.capacity == 20
+    assert summary.error <= len(values) / 21
+    assert [value for value, _ in summary.most_common(2)] in (["a", "b"], ["b", "a"])
+    for value, count in summary.counts.items():
+        assert exact[value] - summary.error <= count <= exact[value]
+
+
+def test_heavy_hitters_merge():
+    """Test that merging keeps the bound over the combined input."""
+    first, second = HeavyHitters(2), HeavyHitters(2)
+    first.update({"a": 5, "b": 3, "c": 1})
+    second.update({"a": 1, "c": 4, "d": 2})
+    first.merge(second)
+
+    assert first.most_common(1) == [("a", 2)]
+    assert first.error == 4
+    assert len(first.counts) <= 2
+
+
+def test_approx_stats_summary():
+    """Test the `approximate` summary block."""
+    stats = ApproxStats(0.5)
+    stats.update({"Timeout": 3, "Bad token": 1, "Slow": 1}, {101: 2, 102: 1, 103: 1})
+
+    assert stats.users.estimate() == 3
+    assert stats.summary() == {
+        "error": 0.5,
+        "top_messages": [{"message": "Timeout", "count": 2}],
+        "top_users": [{"user_id": 101, "count": 1}],
+        "count_error": {"messages": 1, "users": 1},
+    }
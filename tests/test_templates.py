@@ -0,0 +1,66 @@
+from templates import WILDCARD, TemplateMiner
+
+
+def _payments(miner, count, start=0):
+    for i in range(start, start + count):
+        miner.add(f"Payment {1000 + i} failed for ${i}.50")
+
+
+# --- TEST: TemplateMiner ---
+
+
+def test_masks_variable_tokens():
+    """Test that messages differing in IDs and amounts share one template."""
+    miner = TemplateMiner()
+    _payments(miner, 50)
+    miner.add("Connection timeout")
+    miner.add("Connection timeout")
+
+    assert [(str(t), t.count) for t in miner.most_common()] == [
+        ("Payment <*> failed for <*>", 50),
+        ("Connection timeout", 2),
+    ]
+    top = miner.summary()["top"]
+    assert top[0]["examples"] == [
+        ["1000", "$0.50"],
+        ["1001", "$1.50"],
+        ["1002", "$2.50"],
+    ]
+    assert top[1]["examples"] == []
+
+
+def test_merges_similar_messages_and_keeps_others_apart():
+    """Test the similarity threshold on words without digits."""
+    miner = TemplateMiner()
+    miner.add("Session closed for alice after logout")
+    miner.add("Session closed for bob after logout")
+    miner.add("Session closed by admin carol today")
+    miner.add("Disk full")
+
+    assert [str(t) for t in miner] == [
+        f"Session closed for {WILDCARD} after logout",
+        "Session closed by admin carol today",
+        "Disk full",
+    ]
+
+
+def test_cache_is_bounded():
+    """Test that the message cache evicts the least recently used messages."""
+    miner = TemplateMiner(cache_size=10)
+    _payments(miner, 100)
+    assert len(miner._cache) == 10
+    assert len(miner) == 1
+    assert miner.add("Payment 1099 failed for $99.50").count == 101
+
+
+def test_update_and_merge():
+    """Test that counts and templates combine across separate miners."""
+    first, second = TemplateMiner(), TemplateMiner()
+    _payments(first, 20)
+    second.update({"Payment 7 failed for $1.00": 5, "Disk full": 2})
+    first.merge(second)
+
+    assert [(str(t), t.count) for t in first.most_common()] == [
+        ("Payment <*> failed for <*>", 25),
+        ("Disk full", 2),
+    ]
@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from timestamps import (
+    ISO_TIMESTAMP,
+    TimestampDecoder,
+    format_timestamp,
+    format_timestamp_bytes,
+    parse_timestamp,
+)
+
+# 2024-05-01 10:00:00 UTC
+HOUR = 1714557600
+
+
+# --- TEST: TimestampDecoder ---
+
+
+def test_decode_timestamp_format():
+    """Test epoch seconds of TIMESTAMP_FORMAT text and rejected text."""
+    decode = TimestampDecoder().decode
+    assert decode(b"2024-05-01 10:00:00") == HOUR
+    assert decode(b"2024-05-01 10:59:59") == HOUR + 3599
+    assert decode(b"2024-05-01 11:00:01") == HOUR + 3601
+    assert decode(b"1970-01-01 00:00:00") == 0
+    for raw in (
+        b"2024-05-01 10:60:00",
+        b"2024-05-01 10:00:6x",
+        b"2024-13-01 10:00:00",
+        b"2024/05/01 10:00:00",
+        b"2024-05-01 10:00",
+        b"t",
+        b"",
+    ):
+        assert decode(raw) is None
+
+
+def test_decode_iso_drops_fraction_and_zone():
+    """Test that ISO 8601 text is read by position."""
+    decode = TimestampDecoder(ISO_TIMESTAMP).decode
+    assert decode(b"2024-05-01T10:00:01.250Z") == HOUR + 1
+    assert decode(b"2024-05-01T10:00:01+02:00") == HOUR + 1
+
+
+@pytest.mark.parametrize(
+    "timestamp_format, raw, expected",
+    [
+        ("%d/%b/%Y:%H:%M:%S %z", b"01/May/2024:10:00:01 +0000", HOUR + 1),
+        ("%d/%b/%Y:%H:%M:%S %z", b"01/May/2024:10:59:59 +0200", HOUR + 3599),
+        ("%d/%b/%Y:%H:%M:%S %z", b"01/May/2024:10:61:00 +0000", None),
+        ("%Y-%m-%d %H:%M:%S.%f", b"2024-05-01 10:00:01.999", HOUR + 1),
+        ("%B %d %Y %H:%M:%S", b"May 01 2024 10:00:01", HOUR + 1),
+        ("%B %d %Y %H:%M:%S", b"June 01 2024 10:00:01", HOUR + 31 * 86400 + 1),
+        ("%d/%m/%Y %Hh", b"01/05/2024 10h", HOUR),
+        ("%d/%m/%Y %Hh", b"01/05/2024", None),
+    ],
+)
+def test_decode_strptime_formats(timestamp_format, raw, expected):
+    """Test that cached prefixes give what strptime gives, UTC offsets
+    dropped, and variable-width layouts still parse."""
+    decode = TimestampDecoder(timestamp_format).decode
+    assert decode(raw) == expected
+    assert decode(raw) == expected
+
+
+def test_decode_caches_prefix():
+    """Test that lines of one hour share a single cached prefix."""
+    decoder = TimestampDecoder("%d/%b/%Y:%H:%M:%S %z")
+    for second in range(0, 3600, 7):
+        raw = b"01/May/2024:10:%02d:%02d +0000" % divmod(second, 60)
+        assert decoder.decode(raw) == HOUR + second
+    assert list(decoder._prefixes) == [b"01/May/2024:10: +0000"]
+
+
+def test_decode_without_year_uses_current_year():
+    """Test that syslog-style timestamps are dated in the current year."""
+    seconds = TimestampDecoder("%b %d %H:%M:%S").decode(b"May  1 10:00:01")
+    expected = datetime(datetime.now().year, 5, 1, 10, 0, 1, tzinfo=timezone.utc)
+    assert seconds == int(expected.timestamp())
+
+
+# --- TEST: formatting ---
+
+
+@pytest.mark.parametrize(
+    "text", ["2024-05-01 10:00:00", "2024-02-29 23:59:59", "1969-12-31 23:59:59"]
+)
+def test_format_round_trip(text):
+    """Test that epoch seconds format back to the text they came from."""
+    seconds = parse_timestamp(text)
+    assert format_timestamp(seconds) == text
+    assert format_timestamp_bytes(seconds) == text.encode("ascii")
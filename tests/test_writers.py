@@ -0,0 +1,165 @@
+import json
+
+import numpy as np
+import pytest
+
+from records import ErrorBatch
+from writers import (
+    CsvReportWriter,
+    JsonLinesReportWriter,
+    JsonReportWriter,
+    NpzReportWriter,
+    iter_report_errors,
+)
+
+
+# --- FIXTURES (Sample Data) ---
+
+
+@pytest.fixture
+def records():
+    """Returns error records as produced by the parser."""
+    return [
+        {"timestamp": "t1", "service": "S1", "message": "Err A", "user_id": 1},
+        {"timestamp": "t2", "service": "S1", "message": "Err A", "user_id": None},
+        {"timestamp": "t3", "service": "S2", "message": "Err\nB", "user_id": 2},
+    ]
+
+
+def _write(writer_class, path, records):
+    with writer_class(str(path)) as writer:
+        for record in records:
+            writer.write(record)
+    return writer
+
+
+# --- TEST: ReportWriter ---
+
+
+def test_json_writer_produces_valid_report(tmp_path, records):
+    """Test that the streamed JSON report parses and has the summary."""
+    output = tmp_path / "report.json"
+    writer = _write(JsonReportWriter, output, records)
+
+    data = json.loads(output.read_text(encoding="utf-8"))
+    assert data["errors"] == records
+    assert data["summary"] == {"total_errors": 3, "unique_affected_users": 2}
+    assert writer.error_counts.most_common(1) == [("Err A", 2)]
+    assert not (tmp_path / "report.json.tmp").exists()
+
+
+def test_json_writer_empty_report(tmp_path):
+    """Test that a report without errors is still valid JSON."""
+    output = tmp_path / "report.json"
+    _write(JsonReportWriter, output, [])
+
+    data = json.loads(output.read_text(encoding="utf-8"))
+    assert data == {
+        "errors": [],
+        "summary": {"total_errors": 0, "unique_affected_users": 0},
+    }
+
+
+def test_jsonl_writer(tmp_path, records):
+    """Test one record per line followed by a summary line."""
+    output = tmp_path / "report.jsonl"
+    _write(JsonLinesReportWriter, output, records)
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines[:-1]] == records
+    assert json.loads(lines[-1])["summary"]["total_errors"] == 3
+
+
+def test_writer_abort_keeps_previous_report(tmp_path, records):
+    """Test that a failure while streaming leaves the old report in place."""
+    output = tmp_path / "report.json"
+    output.write_text("old", encoding="utf-8")
+
+    with pytest.raises(RuntimeError):
+        with JsonReportWriter(str(output)) as writer:
+            writer.write(records[0])
+            raise RuntimeError("parser failed")
+
+    assert output.read_text(encoding="utf-8") == "old"
+    assert not (tmp_path / "report.json.tmp").exists()
+
+
+# --- TEST: iter_report_errors ---
+
+
+def test_csv_writer(tmp_path, records):
+    """Test CSV rows with JSON user IDs and the summary sidecar."""
+    output = tmp_path / "report.csv"
+    _write(CsvReportWriter, output, records)
+
+    lines = output.read_text(encoding="utf-8").split("\n")
+    assert lines[:3] == [
+        "timestamp,service,message,user_id",
+        "t1,S1,Err A,1",
+        "t2,S1,Err A,null",
+    ]
+    summary = json.loads((tmp_path / "report.csv.summary.json").read_text())
+    assert summary == {"summary": {"total_errors": 3, "unique_affected_users": 2}}
+
+
+def test_npz_writer_parts(tmp_path, records, monkeypatch):
+    """Test the dictionary-encoded columns, written part by part for
+    batches and records alike."""
+    monkeypatch.setattr("writers.NPZ_PART_SIZE", 2)
+    output = tmp_path / "report.npz"
+    with NpzReportWriter(str(output)) as writer:
+        writer.write_batch(ErrorBatch.from_records(records[:2]))
+        for record in records:
+            writer.write(record)
+
+    with np.load(output) as data:
+        assert [name for name in data.files if name.endswith("/message")] == [
+            "part0/message",
+            "part1/message",
+            "part2/message",
+        ]
+        assert data["part1/user_id"].dtype == np.int32
+        assert data["part1/user_id_values"].dtype == np.uint8
+        assert bytes(data["part1/user_id_values"]) == b"1null"
+        assert data["part1/user_id_offsets"].tolist() == [1, 5]
+        assert json.loads(str(data["summary"]))["total_errors"] == 5
+    assert list(iter_report_errors(str(output))) == records[:2] + records
+
+
+@pytest.mark.parametrize(
+    "writer_class",
+    [JsonReportWriter, JsonLinesReportWriter, CsvReportWriter, NpzReportWriter],
+)
+def test_iter_report_errors_round_trip(tmp_path, records, writer_class):
+    """Test that streamed reports are read back record by record."""
+    output = tmp_path / "report"
+    _write(writer_class, output, records)
+
+    assert list(iter_report_errors(str(output))) == records
+
+
+@pytest.mark.parametrize("writer_class", [CsvReportWriter, NpzReportWriter])
+def test_iter_report_errors_context_round_trip(tmp_path, records, writer_class):
+    """Test that request IDs and context lines survive CSV and npz."""
+    output = tmp_path / "report"
+    with writer_class(str(output)) as writer:
+        writer.context = lambda record: [f"before {record['timestamp']}"]
+        for record in records:
+            writer.write({**record, "request_id": "r-1", "user_id": "101"})
+
+    errors = list(iter_report_errors(str(output)))
+    assert errors[2] == {
+        **records[2],
+        "user_id": "101",
+        "request_id": "r-1",
+        "context": ["before t3"],
+    }
+
+
+def test_iter_report_errors_pretty_printed(tmp_path, records):
+    """Test reading a report written with json.dump(indent=4)."""
+    output = tmp_path / "report.json"
+    report = {"summary": {"total_errors": 3}, "errors": records}
+    output.write_text(json.dumps(report, indent=4), encoding="utf-8")
+
+    assert list(iter_report_errors(str(output))) == records
@@ -0,0 +1,168 @@
+# File: timestamps.py
+"""Timestamps as integer epoch seconds, decoded through a cached prefix.
+
+Consecutive log lines share their date and hour, so a TimestampDecoder
+parses that prefix once, remembers its epoch seconds and then only adds
+the minutes and seconds of each line. The prefix is read by slicing for
+TIMESTAMP_FORMAT and ISO 8601 text and with strptime for other layouts;
+either way a line costs two dictionary lookups instead of a datetime.
+Epoch seconds count the wall-clock time as if it were UTC (UTC offsets
+are dropped, as in reports), so they order, bucket and subtract without
+calendars, and format_timestamp turns them back into TIMESTAMP_FORMAT
+text the same way: a cached hour plus a table lookup.
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+# Layout of the timestamps the scanners compare and reports show.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# timestamp_format of ISO 8601 timestamps ("2024-05-01T10:00:01.250Z"),
+# read by slicing; fractions and offsets are dropped.
+ISO_TIMESTAMP = "iso"
+
+# Prefixes (or, for layouts without minutes and seconds, whole timestamps)
+# remembered per decoder, and hours remembered by the formatter.
+PREFIX_CACHE_SIZE = 4096
+
+_EPOCH = datetime(1970, 1, 1)
+
+# "MM:SS" of every second of an hour.
+_MINUTE_SECONDS = [f"{m:02d}:{s:02d}" for m in range(60) for s in range(60)]
+_MINUTE_SECONDS_BYTES = [text.encode("ascii") for text in _MINUTE_SECONDS]
+# Seconds into the hour of every b"MM:SS"; a lookup both checks and reads it.
+_SECONDS_OF = {text: i for i, text in enumerate(_MINUTE_SECONDS_BYTES)}
+_HOURS: Dict[int, str] = {}
+_HOURS_BYTES: Dict[int, bytes] = {}
+
+
+class TimestampDecoder:
+    """Turns raw timestamps of one layout into epoch seconds.
+
+    `timestamp_format` is a strptime format, ISO_TIMESTAMP or None for
+    TIMESTAMP_FORMAT. Layouts with "%M:%S" cache everything else of a
+    timestamp, i.e. the date, hour and any UTC offset; other layouts
+    cache whole timestamps. `decode` returns None for text that does not
+    parse.
+    """
+
+    def __init__(self, timestamp_format: Optional[str] = None):
+        self.timestamp_format = timestamp_format
+        self._prefixes: Dict[bytes, int] = {}
+        self._minute = 0
+        # Timestamps without a year (syslog's) are taken to be from this one.
+        self._year: Optional[int] = None
+        if timestamp_format is not None and not any(
+            directive in timestamp_format for directive in ("%Y", "%y", "%G")
+        ):
+            self._year = datetime.now().year
+        self.decode: Callable[[bytes], Optional[int]]
+        if timestamp_format is None or timestamp_format == ISO_TIMESTAMP:
+            self.decode = self._decode_fixed
+        elif "%M:%S" in timestamp_format:
+            # Where the minutes start, if everything before them has a
+            # fixed width; checked against strptime on every cache miss.
+            head = timestamp_format[: timestamp_format.index("%M:%S")]
+            self._minute = len(datetime(2000, 1, 1).strftime(head))
+            self.decode = self._decode_prefixed
+        else:
+            self.decode = self._decode_whole
+
+    def _decode_fixed(self, raw: bytes) -> Optional[int]:
+        # "YYYY-MM-DD HH:MM:SS", the separator before the hour being free.
+        offset = _SECONDS_OF.get(raw[14:19])
+        if offset is None or raw[13:14] != b":":
+            return None
+        base = self._prefixes.get(raw[:13])
+        if base is None:
+            if raw[4:5] != b"-" or raw[7:8] != b"-":
+                return None
+            try:
+                moment = datetime(
+                    int(raw[:4]), int(raw[5:7]), int(raw[8:10]), int(raw[11:13])
+                )
+            except ValueError:
+                return None
+            base = self._remember(raw[:13], moment)
+        return base + offset
+
+    def _decode_prefixed(self, raw: bytes) -> Optional[int]:
+        minute = self._minute
+        key = raw[:minute] + raw[minute + 5 :]
+        base = self._prefixes.get(key)
+        if base is not None:
+            offset = _SECONDS_OF.get(raw[minute : minute + 5])
+            return None if offset is None else base + offset
+
+        moment = self._parse(raw)
+        if moment is None:
+            return None
+        if (
+            raw[minute : minute + 5]
+            == _MINUTE_SECONDS_BYTES[moment.minute * 60 + moment.second]
+        ):
+            self._remember(key, moment.replace(minute=0, second=0, microsecond=0))
+        return _epoch_seconds(moment)
+
+    def _decode_whole(self, raw: bytes) -> Optional[int]:
+        seconds = self._prefixes.get(raw)
+        if seconds is None:
+            moment = self._parse(raw)
+            if moment is None:
+                return None
+            seconds = self._remember(raw, moment)
+        return seconds
+
+    def _parse(self, raw: bytes) -> Optional[datetime]:
+        try:
+            moment = datetime.strptime(raw.decode("ascii"), self.timestamp_format)
+        except (UnicodeDecodeError, ValueError):
+            return None
+        if self._year is not None:
+            moment = moment.replace(year=self._year)
+        return moment
+
+    def _remember(self, key: bytes, moment: datetime) -> int:
+        if len(self._prefixes) >= PREFIX_CACHE_SIZE:
+            self._prefixes.clear()
+        seconds = self._prefixes[key] = _epoch_seconds(moment)
+        return seconds
+
+
+def _epoch_seconds(moment: datetime) -> int:
+    return (moment.replace(tzinfo=None) - _EPOCH) // timedelta(seconds=1)
+
+
+_TIMESTAMP_DECODER = TimestampDecoder()
+
+
+def parse_timestamp(text: str) -> Optional[int]:
+    """Epoch seconds of a TIMESTAMP_FORMAT timestamp, None if it is not one."""
+    return _TIMESTAMP_DECODER.decode(text.encode("utf-8"))
+
+
+def format_timestamp(seconds: int) -> str:
+    """The TIMESTAMP_FORMAT text of epoch seconds."""
+    hour, rest = divmod(seconds, 3600)
+    prefix = _HOURS.get(hour)
+    if prefix is None:
+        if len(_HOURS) >= PREFIX_CACHE_SIZE:
+            _HOURS.clear()
+        prefix = _HOURS[hour] = _hour_prefix(hour)
+    return prefix + _MINUTE_SECONDS[rest]
+
+
+def format_timestamp_bytes(seconds: int) -> bytes:
+    """format_timestamp as ASCII bytes, as the scanners compare them."""
+    hour, rest = divmod(seconds, 3600)
+    prefix = _HOURS_BYTES.get(hour)
+    if prefix is None:
+        if len(_HOURS_BYTES) >= PREFIX_CACHE_SIZE:
+            _HOURS_BYTES.clear()
+        prefix = _HOURS_BYTES[hour] = _hour_prefix(hour).encode("ascii")
+    return prefix + _MINUTE_SECONDS_BYTES[rest]
+
+
+def _hour_prefix(hour: int) -> str:
+    return (_EPOCH + timedelta(hours=hour)).strftime("%Y-%m-%d %H:")
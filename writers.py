@@ -0,0 +1,415 @@
+# File: writers.py
+
+import csv
+import json
+import os
+import time
+import zipfile
+from collections import Counter
+from itertools import chain
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from aggregate import ErrorStats
+from line_stats import LineAggregator
+from profiling import StageTimings
+from records import CODED_COLUMNS, TEXT_TIMESTAMP, ErrorBatch, Record, as_dict
+from rollups import LatencyStats
+from timestamps import format_timestamp
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is a declared dependency
+    np = None
+
+# Where the CSV writer puts the summary, next to the report.
+SUMMARY_SUFFIX = ".summary.json"
+
+# Records per part of an npz report, the most NpzReportWriter holds.
+NPZ_PART_SIZE = 65536
+
+# Leading bytes of a zip archive, which is what an .npz file is.
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Record fields that the CSV and npz formats store as JSON text, so that
+# user IDs such as 101 and "101" stay apart.
+JSON_FIELDS = ("user_id", "request_id", "context")
+
+
+class ReportWriter:
+    """Stream error records into a report file as they arrive.
+
+    Only the summary counters are kept in memory; the summary itself is
+    written by close(). Output goes to a temporary file that replaces
+    `output_path` on a clean close, so a report can be rebuilt from itself.
+    Subclasses that write bytes set `binary`.
+    """
+
+    binary = False
+
+    def __init__(self, output_path: str, engine: str = "auto"):
+        self.output_path = output_path
+        self.engine = engine
+        self.stats = ErrorStats()
+        # Per-input summaries of a report merged from several files.
+        self.file_summaries: Dict[str, Dict[str, Any]] = {}
+        # Set by --profile to time counting and serialisation separately.
+        self.timings: Optional[StageTimings] = None
+        # Set by --context: returns the trace lines attached to a record.
+        self.context: Optional[Callable[[Record], List[str]]] = None
+        # Set by --rollups: latency percentiles added to the summary.
+        self.latency: Optional[LatencyStats] = None
+        # Set by --line-counts: per-line aggregates, each under its name.
+        self.aggregators: Sequence[LineAggregator] = ()
+        self._temp_path = output_path + ".tmp"
+        self._file: IO[Any] = (
+            open(self._temp_path, "wb")
+            if self.binary
+            else open(self._temp_path, "w", encoding="utf-8")
+        )
+        self._write_header()
+
+    @property
+    def total_errors(self) -> int:
+        return self.stats.total_errors
+
+    @property
+    def error_counts(self) -> Counter:
+        return self.stats.message_counts
+
+    @property
+    def user_counts(self) -> Counter:
+        return self.stats.user_counts
+
+    def write(self, record: Record) -> None:
+        """Count one error record and append it to the report."""
+        if self.timings is None:
+            self.stats.add(record)
+            self._write_record(record)
+            return
+        started = time.perf_counter()
+        self.stats.add(record)
+        counted = time.perf_counter()
+        self._write_record(record)
+        self._add_timings(started, counted, time.perf_counter())
+
+    def write_batch(self, batch: ErrorBatch) -> None:
+        """Append a columnar batch, counting on its encoded columns with the
+        writer's aggregation engine."""
+        started = time.perf_counter()
+        self.stats.add_batch(batch, self.engine)
+        counted = time.perf_counter()
+        self._write_batch(batch)
+        if self.timings is not None:
+            self._add_timings(started, counted, time.perf_counter())
+
+    def _add_timings(self, started: float, counted: float, written: float) -> None:
+        self.timings.add("aggregate", counted - started)
+        self.timings.add("write", written - counted)
+
+    def summary(self) -> Dict[str, Any]:
+        """The `summary` block for the records written so far."""
+        summary = self.stats.summary()
+        if self.latency is not None:
+            summary["latency"] = self.latency.summary()
+        for aggregator in self.aggregators:
+            summary[aggregator.name] = aggregator.summary()
+        if self.file_summaries:
+            summary["files"] = self.file_summaries
+        return summary
+
+    def close(self) -> None:
+        """Write the summary and move the finished report into place."""
+        started = time.perf_counter()
+        self._write_summary(self.summary())
+        self._file.close()
+        if self.timings is not None:
+            self.timings.add("write", time.perf_counter() - started)
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self) -> None:
+        """Drop a partially written report, leaving any old one untouched."""
+        self._file.close()
+        os.remove(self._temp_path)
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _record_dict(self, record: Record) -> Dict[str, Any]:
+        data = as_dict(record)
+        if self.context is not None:
+            data = {**data, "context": self.context(record)}
+        return data
+
+    def _write_header(self) -> None:
+        pass
+
+    def _write_record(self, record: Record) -> None:
+        raise NotImplementedError
+
+    def _write_batch(self, batch: ErrorBatch) -> None:
+        for record in batch:
+            self._write_record(record)
+
+    def _write_summary(self, summary: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class JsonReportWriter(ReportWriter):
+    """`{"errors": [...], "summary": {...}}` with one compact record per line."""
+
+    def _write_header(self) -> None:
+        self._file.write('{\n    "errors": [')
+        self._separator = "\n        "
+
+    def _write_record(self, record: Record) -> None:
+        self._file.write(self._separator)
+        self._file.write(json.dumps(self._record_dict(record)))
+        self._separator = ",\n        "
+
+    def _write_summary(self, summary: Dict[str, Any]) -> None:
+        body = json.dumps(summary, indent=4).replace("\n", "\n    ")
+        self._file.write(f'\n    ],\n    "summary": {body}\n}}\n')
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """One JSON object per error, followed by a final `{"summary": ...}` line."""
+
+    def _write_record(self, record: Record) -> None:
+        self._file.write(json.dumps(self._record_dict(record)))
+        self._file.write("\n")
+
+    def _write_summary(self, summary: Dict[str, Any]) -> None:
+        self._file.write(json.dumps({"summary": summary}))
+        self._file.write("\n")
+
+
+class CsvReportWriter(ReportWriter):
+    """One row per error, with user IDs (and request IDs and context lines)
+    as JSON text; CSV has no room for the summary, which goes to a
+    `<output>.summary.json` sidecar instead."""
+
+    def _write_header(self) -> None:
+        self._csv = csv.writer(self._file, lineterminator="\n")
+        self._fields: Optional[List[str]] = None
+
+    def _start(self) -> None:
+        # The columns depend on --context, which is set after construction.
+        self._fields = ["timestamp", "service", "message", "user_id"]
+        if self.context is not None:
+            self._fields += ["request_id", "context"]
+        self._csv.writerow(self._fields)
+
+    def _write_record(self, record: Record) -> None:
+        if self._fields is None:
+            self._start()
+        data = self._record_dict(record)
+        self._csv.writerow(
+            [
+                json.dumps(data.get(field)) if field in JSON_FIELDS else data[field]
+                for field in self._fields
+            ]
+        )
+
+    def _write_summary(self, summary: Dict[str, Any]) -> None:
+        if self._fields is None:
+            self._start()
+        summary_path = self.output_path + SUMMARY_SUFFIX
+        with open(summary_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"summary": summary}, f, indent=4)
+        os.replace(summary_path + ".tmp", summary_path)
+
+
+class NpzReportWriter(ReportWriter):
+    """Compressed NumPy archive written in parts of up to NPZ_PART_SIZE
+    records, each a set of `part<n>/` arrays. Every column is a
+    dictionary-encoded pair: `<column>` holds int32 codes into the
+    part's distinct values, stored as UTF-8 bytes in `<column>_values`
+    with `<column>_offsets` giving where each value ends. The timestamp
+    column is int64 epoch seconds instead, its values holding the text of
+    timestamps that did not decode (see TEXT_TIMESTAMP).
+
+    Parts are written to the archive as they fill, so memory is bounded
+    by the part size whatever the number of records. User and request IDs
+    are stored as JSON text, `context` (with --context) as one JSON list
+    per record and the archive's `summary` as JSON text.
+    """
+
+    binary = True
+
+    def _write_header(self) -> None:
+        if np is None:
+            raise RuntimeError("the npz format needs numpy to be installed")
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED)
+        self._parts = 0
+        self._pending = ErrorBatch()
+        self._contexts: List[str] = []
+
+    def _write_record(self, record: Record) -> None:
+        self._pending.append(record)
+        if self.context is not None:
+            self._contexts.append(json.dumps(self.context(record)))
+        if len(self._pending) >= NPZ_PART_SIZE:
+            self._flush()
+
+    def _write_batch(self, batch: ErrorBatch) -> None:
+        if self.context is not None:
+            for record in batch:
+                self._write_record(record)
+            return
+        self._flush()
+        if len(batch):
+            self._write_part(batch)
+
+    def _write_summary(self, summary: Dict[str, Any]) -> None:
+        self._flush()
+        self._write_array("summary", np.array(json.dumps(summary)))
+        self._zip.close()
+
+    def _flush(self) -> None:
+        if len(self._pending):
+            self._write_part(self._pending, self._contexts)
+            self._pending = ErrorBatch()
+            self._contexts = []
+
+    def _write_part(self, batch: ErrorBatch, contexts: Sequence[str] = ()) -> None:
+        prefix = f"part{self._parts}/"
+        self._parts += 1
+        self._write_array(
+            f"{prefix}timestamp", np.frombuffer(batch.timestamps, dtype=np.int64)
+        )
+        self._write_strings(f"{prefix}timestamp", batch.timestamp_texts)
+        for column in CODED_COLUMNS:
+            values = batch.tables[column]
+            if column in JSON_FIELDS:
+                values = [json.dumps(value) for value in values]
+            self._write_array(
+                f"{prefix}{column}", np.frombuffer(batch.codes[column], dtype=np.int32)
+            )
+            self._write_strings(f"{prefix}{column}", values)
+        if contexts:
+            self._write_strings(f"{prefix}context", contexts)
+
+    def _write_strings(self, name: str, values: Sequence[str]) -> None:
+        encoded = [value.encode("utf-8") for value in values]
+        self._write_array(
+            f"{name}_values", np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        )
+        self._write_array(
+            f"{name}_offsets",
+            np.cumsum([len(value) for value in encoded], dtype=np.int64),
+        )
+
+    def _write_array(self, name: str, array: "np.ndarray") -> None:
+        with self._zip.open(f"{name}.npy", "w", force_zip64=True) as member:
+            np.lib.format.write_array(member, array, allow_pickle=False)
+
+
+REPORT_WRITERS = {
+    "json": JsonReportWriter,
+    "jsonl": JsonLinesReportWriter,
+    "csv": CsvReportWriter,
+    "npz": NpzReportWriter,
+}
+
+
+def iter_report_errors(report_path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the error records of an existing report.
+
+    Reports written by JsonReportWriter and JSON Lines reports are streamed
+    line by line, CSV reports row by row and npz archives column by column;
+    any other JSON report is loaded in one go.
+    """
+    with open(report_path, "rb") as f:
+        magic = f.read(len(ZIP_MAGIC))
+    if magic == ZIP_MAGIC:
+        yield from _iter_npz_errors(report_path)
+        return
+
+    with open(report_path, "r", encoding="utf-8", newline="") as f:
+        first = f.readline()
+
+        if first.startswith("timestamp,service,message,user_id"):
+            f.seek(0)
+            for row in csv.DictReader(f):
+                yield _from_json_fields(row)
+            return
+
+        if first.rstrip("\n") != "{":
+            for line in chain([first], f):
+                if line.strip():
+                    record = json.loads(line)
+                    if "summary" not in record:
+                        yield record
+            return
+
+        if f.readline().rstrip("\n") == '    "errors": [':
+            for line in f:
+                line = line.strip()
+                if not line.startswith("{"):
+                    break
+                yield json.loads(line.rstrip(","))
+            return
+
+        f.seek(0)
+        yield from json.load(f).get("errors", [])
+
+
+def _from_json_fields(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Decode the JSON text fields of a CSV or npz record; a null request
+    ID is left out, as in JSON reports."""
+    for field in JSON_FIELDS:
+        if field in record:
+            record[field] = json.loads(record[field])
+    if record.get("request_id", "") is None:
+        del record["request_id"]
+    return record
+
+
+def _iter_npz_errors(report_path: str) -> Iterator[Dict[str, Any]]:
+    with np.load(report_path) as data:
+        part = 0
+        while f"part{part}/timestamp" in data:
+            yield from _iter_npz_part(data, f"part{part}/")
+            part += 1
+
+
+def _iter_npz_part(data: Any, prefix: str) -> Iterator[Dict[str, Any]]:
+    # JSON text is decoded once per distinct value, not once per record.
+    texts = _npz_strings(data, f"{prefix}timestamp")
+    timestamps = [
+        texts[TEXT_TIMESTAMP - seconds]
+        if seconds <= TEXT_TIMESTAMP
+        else format_timestamp(seconds)
+        for seconds in data[f"{prefix}timestamp"].tolist()
+    ]
+    tables = []
+    for column in CODED_COLUMNS:
+        values = _npz_strings(data, f"{prefix}{column}")
+        if column in JSON_FIELDS:
+            values = [json.loads(value) for value in values]
+        tables.append(values)
+    codes = [data[f"{prefix}{column}"].tolist() for column in CODED_COLUMNS]
+    contexts = None
+    if f"{prefix}context_values" in data:
+        contexts = _npz_strings(data, f"{prefix}context")
+    for position, (timestamp, *row) in enumerate(zip(timestamps, *codes)):
+        record = {"timestamp": timestamp}
+        for column, table, code in zip(CODED_COLUMNS, tables, row):
+            record[column] = table[code]
+        if record["request_id"] is None:
+            del record["request_id"]
+        if contexts is not None:
+            record["context"] = json.loads(contexts[position])
+        yield record
+
+
+def _npz_strings(data: Any, name: str) -> List[str]:
+    blob = data[f"{name}_values"].tobytes()
+    ends = data[f"{name}_offsets"].tolist()
+    return [blob[start:end].decode("utf-8") for start, end in zip([0] + ends, ends)]